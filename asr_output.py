@@ -0,0 +1,190 @@
+import math
+import wave
+
+from logger_utils import append_to_log
+from processing_config import get_processing_setting
+
+# ASR-ready vocals: mono, resampled and loudness-normalized straight from the
+# separated tensor, so speech recognition needs no second FFmpeg pass.
+DEFAULT_ASR_SAMPLERATE = 16000
+DEFAULT_ASR_TARGET_LUFS = -23.0
+DEFAULT_ASR_TRIM_SILENCE = True
+ASR_PEAK_CEILING_DB = -1.0      # Normalization gain is capped so peaks stay below this
+SILENCE_THRESHOLD_DB = -50.0    # Frames quieter than this (RMS, after normalization) count as silence
+SILENCE_FRAME_SECONDS = 0.02
+SILENCE_PADDING_SECONDS = 0.25  # Kept around the speech when trimming
+
+# ITU-R BS.1770 gating
+LOUDNESS_BLOCK_SECONDS = 0.4
+LOUDNESS_STEP_SECONDS = 0.1
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+FILTER_SEGMENT_STEPS = 600      # K-weighting is applied per 60 s segment to bound memory
+FILTER_PADDING_SECONDS = 0.5
+
+
+def get_asr_settings():
+    """Sample rate, loudness target and trimming for ASR output ('asr_*' settings)."""
+    return {
+        "samplerate": int(get_processing_setting("asr_samplerate", DEFAULT_ASR_SAMPLERATE)),
+        "target_lufs": float(get_processing_setting("asr_target_lufs", DEFAULT_ASR_TARGET_LUFS)),
+        "trim_silence": bool(get_processing_setting("asr_trim_silence", DEFAULT_ASR_TRIM_SILENCE)),
+    }
+
+
+def _biquad_response(freqs, samplerate, b, a):
+    """Complex frequency response of a biquad at 'freqs' (Hz)."""
+    import numpy as np
+    z = np.exp(-1j * 2 * np.pi * freqs / samplerate)
+    return (b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)
+
+
+def _k_weighting_gain(freqs, samplerate):
+    """
+    Magnitude response of the BS.1770 K-weighting filter (high shelf + high pass),
+    designed for 'samplerate' so it also holds at 16 kHz.
+    """
+    import numpy as np
+    # Stage 1: +4 dB high shelf around 1.5 kHz (head effects)
+    gain_a = 10 ** (4.0 / 40)
+    w0 = 2 * math.pi * 1500.0 / samplerate
+    alpha = math.sin(w0) / (2 * (1 / math.sqrt(2)))
+    root = 2 * math.sqrt(gain_a) * alpha
+    shelf = _biquad_response(freqs, samplerate, (
+        gain_a * ((gain_a + 1) + (gain_a - 1) * math.cos(w0) + root),
+        -2 * gain_a * ((gain_a - 1) + (gain_a + 1) * math.cos(w0)),
+        gain_a * ((gain_a + 1) + (gain_a - 1) * math.cos(w0) - root),
+    ), (
+        (gain_a + 1) - (gain_a - 1) * math.cos(w0) + root,
+        2 * ((gain_a - 1) - (gain_a + 1) * math.cos(w0)),
+        (gain_a + 1) - (gain_a - 1) * math.cos(w0) - root,
+    ))
+    # Stage 2: high pass at 38 Hz (RLB weighting)
+    w0 = 2 * math.pi * 38.0 / samplerate
+    alpha = math.sin(w0) / (2 * 0.5)
+    high_pass = _biquad_response(freqs, samplerate, (
+        (1 + math.cos(w0)) / 2, -(1 + math.cos(w0)), (1 + math.cos(w0)) / 2,
+    ), (
+        1 + alpha, -2 * math.cos(w0), 1 - alpha,
+    ))
+    return np.abs(shelf * high_pass)
+
+
+def _step_energies(samples, samplerate):
+    """
+    Sum of squared K-weighted samples per 100 ms step. The filter is applied by
+    FFT in padded segments (its magnitude response is all loudness depends on).
+    """
+    import numpy as np
+    step = int(round(LOUDNESS_STEP_SECONDS * samplerate))
+    segment = step * FILTER_SEGMENT_STEPS
+    padding = int(FILTER_PADDING_SECONDS * samplerate)
+    steps = len(samples) // step
+    energies = np.zeros(steps)
+    gains = {}  # Segment length -> filter response; all but the edge segments share one
+    for start in range(0, steps * step, segment):
+        end = min(start + segment, steps * step)
+        lo, hi = max(0, start - padding), min(len(samples), end + padding)
+        piece = samples[lo:hi].astype(np.float64)
+        if len(piece) not in gains:
+            gains[len(piece)] = _k_weighting_gain(np.fft.rfftfreq(len(piece), 1.0 / samplerate), samplerate)
+        spectrum = np.fft.rfft(piece)
+        spectrum *= gains[len(piece)]
+        filtered = np.fft.irfft(spectrum, len(piece))[start - lo:end - lo]
+        energies[start // step:end // step] = (filtered ** 2).reshape(-1, step).sum(axis=1)
+    return energies, step
+
+
+def integrated_loudness(samples, samplerate):
+    """Gated integrated loudness (LUFS) of a mono or [channels, samples] float signal, per ITU-R BS.1770."""
+    import numpy as np
+    energies = 0.0
+    for channel in (samples if samples.ndim > 1 else samples[None]):
+        channel_energies, step = _step_energies(channel, samplerate)
+        energies = energies + channel_energies
+    steps_per_block = int(round(LOUDNESS_BLOCK_SECONDS / LOUDNESS_STEP_SECONDS))
+    if len(energies) < steps_per_block:
+        return float("-inf")
+    blocks = np.convolve(energies, np.ones(steps_per_block), mode="valid") / (steps_per_block * step)
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(blocks)
+    gated = blocks[block_loudness > ABSOLUTE_GATE_LUFS]
+    if not len(gated):
+        return float("-inf")
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = blocks[block_loudness > max(ABSOLUTE_GATE_LUFS, relative_gate)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def _speech_bounds(samples, samplerate):
+    """(start, end) sample range without leading/trailing silence, padded; the whole signal if all silent."""
+    import numpy as np
+    frame = max(1, int(SILENCE_FRAME_SECONDS * samplerate))
+    frames = len(samples) // frame
+    if not frames:
+        return 0, len(samples)
+    rms = np.sqrt((samples[:frames * frame].astype(np.float64) ** 2).reshape(frames, frame).mean(axis=1))
+    loud = np.nonzero(rms > 10 ** (SILENCE_THRESHOLD_DB / 20))[0]
+    if not len(loud):
+        return 0, len(samples)
+    padding = int(SILENCE_PADDING_SECONDS * samplerate)
+    start = max(0, loud[0] * frame - padding)
+    end = min(len(samples), (loud[-1] + 1) * frame + padding)
+    return start, end
+
+
+def _write_mono_wav(path, samples, samplerate):
+    import numpy as np
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(samplerate)
+        wav_file.writeframes(pcm.tobytes())
+
+
+def prepare_asr_samples(samples, samplerate, target_lufs=DEFAULT_ASR_TARGET_LUFS, trim_silence=True):
+    """
+    Normalize a mono float signal to 'target_lufs' (peaks capped at
+    ASR_PEAK_CEILING_DB) and optionally trim leading/trailing silence.
+    Returns (samples, stats) where stats holds the measured loudness, the gain and
+    the trimmed start offset (to map ASR timestamps back to the original).
+    """
+    import numpy as np
+    loudness = integrated_loudness(samples, samplerate)
+    gain_db = 0.0
+    if math.isfinite(loudness):
+        gain_db = target_lufs - loudness
+        peak = float(np.abs(samples).max())
+        if peak > 0:
+            gain_db = min(gain_db, ASR_PEAK_CEILING_DB - 20 * math.log10(peak))
+        samples = samples * 10 ** (gain_db / 20)
+
+    start, end = _speech_bounds(samples, samplerate) if trim_silence else (0, len(samples))
+    return samples[start:end], {
+        "input_lufs": round(loudness, 2) if math.isfinite(loudness) else None,
+        "gain_db": round(gain_db, 2),
+        "trimmed_start_seconds": round(float(start) / samplerate, 3),
+        "duration_seconds": round(float(end - start) / samplerate, 3),
+    }
+
+
+def save_asr_stem(vocals, path, samplerate, settings=None):
+    """
+    Write the separated vocals tensor ([channels, samples] at the model's
+    'samplerate') as ASR-ready 16-bit mono WAV at the configured rate.
+    Returns the stats of prepare_asr_samples.
+    """
+    from demucs.audio import convert_audio
+    settings = settings or get_asr_settings()
+    mono = convert_audio(vocals, samplerate, settings["samplerate"], 1)[0]
+    samples, stats = prepare_asr_samples(
+        mono.cpu().numpy(), settings["samplerate"], settings["target_lufs"], settings["trim_silence"]
+    )
+    _write_mono_wav(path, samples, settings["samplerate"])
+    append_to_log(
+        f"ASR output {path}: {stats['input_lufs']} LUFS -> {settings['target_lufs']} LUFS "
+        f"(gain {stats['gain_db']} dB), {stats['duration_seconds']} s at {settings['samplerate']} Hz, "
+        f"trimmed {stats['trimmed_start_seconds']} s from the start."
+    )
+    return stats
@@ -0,0 +1,211 @@
+import os
+import sys
+import time
+import argparse
+import itertools
+
+from bag_parallel import get_bag_pool
+from logger_utils import append_to_log
+from machine_profile import MACHINE_PROFILE_FILE, load_machine_profile, save_machine_profile, update_machine_profile
+from separation_engine import (
+    DEFAULT_MODEL_NAME,
+    DEFAULT_CHUNK_SECONDS,
+    DEFAULT_CHUNK_OVERLAP_SECONDS,
+    bag_size,
+    import_demucs,
+    load_separation_model,
+    resolve_chunking,
+    separate_waveform,
+)
+from separation_presets import PRESET_NAMES, SEPARATION_PRESETS, describe_preset
+
+DEFAULT_CLIP_SECONDS = 20.0
+QUALITY_TOLERANCE_DB = 0.3  # Allowed vocal SI-SDR loss against the reference settings
+
+# Reference settings: the defaults every candidate is judged against
+REFERENCE_OPTIONS = {
+    "chunk_seconds": DEFAULT_CHUNK_SECONDS,
+    "overlap_seconds": DEFAULT_CHUNK_OVERLAP_SECONDS,
+    "shifts": 1,
+    "overlap": 0.25,
+}
+
+# Parameter grid searched on all cores
+SEARCH_GRID = {
+    "chunk_seconds": (10.0, 20.0, 30.0),
+    "overlap_seconds": (0.5, 1.0),
+    "shifts": (0, 1),
+    "overlap": (0.1, 0.25),
+}
+
+
+def synth_clip(torch, seconds, samplerate, seed=7):
+    """Short synthetic mixture (speech-like vocal over music) with its vocal ground truth."""
+    import numpy as np
+    from regression_corpus import SAMPLE_RATE, synth_background, synth_vocal
+
+    rng = np.random.default_rng(seed)
+    vocals = synth_vocal(rng, seconds, 180.0)
+    background = synth_background(rng, seconds, "music")
+    if samplerate != SAMPLE_RATE:
+        raise RuntimeError(f"Autotune expects a {SAMPLE_RATE} Hz model, got {samplerate} Hz.")
+    mixture = torch.from_numpy((vocals + background).T.astype("float32").copy())
+    return mixture, vocals
+
+
+def _vocal_si_sdr(reference, sources):
+    from regression_corpus import si_sdr
+    return float(si_sdr(reference, sources["vocals"].numpy().T))
+
+
+def _time_run(model, mixture, options, repeats):
+    """Best-of-'repeats' wall time for one separation and the resulting sources."""
+    best, sources = None, None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        sources = separate_waveform(model, mixture, dedup=None, **options)  # Always really separate
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, sources
+
+
+def tune_parameters(model, mixture, vocals, clip_seconds, tolerance_db, repeats):
+    """
+    Time every SEARCH_GRID combination on all cores and return the fastest one
+    whose vocal SI-SDR is within 'tolerance_db' of REFERENCE_OPTIONS.
+    """
+    reference_seconds, reference_sources = _time_run(model, mixture, REFERENCE_OPTIONS, repeats)
+    reference_quality = _vocal_si_sdr(vocals, reference_sources)
+    print(f"reference: {reference_seconds / clip_seconds:.3f} RTF, vocals SI-SDR {reference_quality:.2f} dB")
+
+    best = {"options": dict(REFERENCE_OPTIONS), "rtf": reference_seconds / clip_seconds,
+            "vocals_si_sdr": reference_quality}
+    keys = list(SEARCH_GRID)
+    for values in itertools.product(*(SEARCH_GRID[key] for key in keys)):
+        options = dict(zip(keys, values))
+        if options == REFERENCE_OPTIONS:
+            continue
+        seconds, sources = _time_run(model, mixture, options, repeats)
+        quality = _vocal_si_sdr(vocals, sources)
+        rtf = seconds / clip_seconds
+        accepted = quality >= reference_quality - tolerance_db
+        print(f"{options}: {rtf:.3f} RTF, vocals SI-SDR {quality:.2f} dB{'' if accepted else ' (rejected)'}")
+        if accepted and rtf < best["rtf"]:
+            best = {"options": options, "rtf": rtf, "vocals_si_sdr": quality}
+    best["reference_vocals_si_sdr"] = reference_quality
+    return best
+
+
+def tune_parallel_bag(model_name, model, mixture, clip_seconds, options, repeats):
+    """
+    Time 'options' with a bag's members run one after another on all cores and
+    in parallel worker processes (see bag_parallel), exactly as separate_waveform
+    runs them for the 'parallel_bag' option. Returns {"parallel_bag", "rtf"} of
+    the faster way; models that are not bags keep it off.
+    """
+    if bag_size(model_name) < 2:
+        return {"parallel_bag": False, "rtf": None}
+    chunk_seconds, _ = resolve_chunking(options.get("chunk_seconds"), options.get("overlap_seconds"))
+    results = {}
+    for enabled in (False, True):
+        if enabled:
+            try:
+                # Start the worker processes up front so their start-up is not timed
+                get_bag_pool(model_name, model, mixture.shape[0], int(chunk_seconds * model.samplerate))
+            except RuntimeError as e:
+                print(f"parallel bag: {e}")
+                break
+        seconds, _ = _time_run(model, mixture, dict(options, parallel_bag=enabled), repeats)
+        results[enabled] = seconds / clip_seconds
+        print(f"parallel_bag={enabled}: {results[enabled]:.3f} RTF")
+    enabled = min(results, key=results.get)
+    return {"parallel_bag": enabled, "rtf": results[enabled]}
+
+
+def run_autotune(model_name=DEFAULT_MODEL_NAME, clip_seconds=DEFAULT_CLIP_SECONDS,
+                 tolerance_db=QUALITY_TOLERANCE_DB, repeats=1, save=True):
+    """
+    Benchmark separation settings, and running a bag's members in worker
+    processes, on this machine and (by default) save the winner as the machine
+    profile that separate_audio loads automatically.
+    """
+    torch, _, _ = import_demucs()
+    model = load_separation_model(model_name)
+    mixture, vocals = synth_clip(torch, clip_seconds, model.samplerate)
+
+    append_to_log(f"Autotune started for '{model_name}' on {os.cpu_count()} cores.")
+    best = tune_parameters(model, mixture, vocals, clip_seconds, tolerance_db, repeats)
+    bag = tune_parallel_bag(model_name, model, mixture, clip_seconds, best["options"], repeats)
+
+    profile = {
+        "separation": dict(best["options"], model=model_name, parallel_bag=bag["parallel_bag"]),
+        "measured": {
+            "rtf": round(best["rtf"], 4),
+            "vocals_si_sdr": round(best["vocals_si_sdr"], 3),
+            "reference_vocals_si_sdr": round(best["reference_vocals_si_sdr"], 3),
+            "parallel_bag_rtf": round(bag["rtf"], 4) if bag["rtf"] is not None else None,
+            "clip_seconds": clip_seconds,
+            "tolerance_db": tolerance_db,
+        },
+    }
+    print(f"Best: {profile['separation']}")
+    if save:
+        save_machine_profile(dict(load_machine_profile() or {}, **profile))
+    return profile
+
+
+def benchmark_presets(clip_seconds=DEFAULT_CLIP_SECONDS, presets=PRESET_NAMES, progress_callback=None,
+                      save=True):
+    """
+    Measure the real-time factor and vocal SI-SDR of each separation preset on the
+    synthetic clip and (by default) store them in the machine profile for display.
+    """
+    torch, _, _ = import_demucs()
+    results = {}
+    for index, preset in enumerate(presets):
+        options = dict(SEPARATION_PRESETS[preset])
+        model = load_separation_model(options.pop("model"))
+        mixture, vocals = synth_clip(torch, clip_seconds, model.samplerate)
+        seconds, sources = _time_run(model, mixture, options, repeats=1)
+        results[preset] = {
+            "rtf": round(seconds / clip_seconds, 4),
+            "vocals_si_sdr": round(_vocal_si_sdr(vocals, sources), 3),
+        }
+        append_to_log(f"Preset '{preset}': {results[preset]['rtf']:.3f} RTF, "
+                      f"vocals SI-SDR {results[preset]['vocals_si_sdr']:.2f} dB")
+        if progress_callback:
+            progress_callback(100.0 * (index + 1) / len(presets))
+    if save:
+        update_machine_profile(presets=results)
+    return results
+
+
+def benchmark_presets_job(status):
+    """JobManager target for the GUI's benchmark button."""
+    status.set("Benchmarking presets...")
+    benchmark_presets(progress_callback=status.progress)
+    status.set("Preset benchmark done.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the fastest separation settings for this machine.")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--clip-seconds", type=float, default=DEFAULT_CLIP_SECONDS)
+    parser.add_argument("--tolerance-db", type=float, default=QUALITY_TOLERANCE_DB,
+                        help="Allowed vocal SI-SDR loss against the default settings")
+    parser.add_argument("--repeats", type=int, default=1, help="Time each setting this many times (best counts)")
+    parser.add_argument("--presets", action="store_true",
+                        help="Only measure the speed of the fast/balanced/best presets")
+    parser.add_argument("--dry-run", action="store_true", help=f"Do not write {MACHINE_PROFILE_FILE}")
+    args = parser.parse_args()
+
+    try:
+        if args.presets:
+            benchmark_presets(args.clip_seconds, save=not args.dry_run)
+            for name in PRESET_NAMES:
+                print(describe_preset(name))
+        else:
+            run_autotune(args.model, args.clip_seconds, args.tolerance_db, args.repeats, save=not args.dry_run)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,183 @@
+import os
+import atexit
+import threading
+
+from logger_utils import append_to_log
+from processing_config import get_processing_setting
+from weight_cache import load_cached_member, weight_cache_enabled
+
+# Runs the members of a bag of models (e.g. mdx_extra_q) in parallel worker
+# processes instead of one after another inside apply_model(). Each worker
+# holds one member; the chunk to separate and every member's output live in
+# shared-memory tensors, so only a few bytes of control data cross the pipes.
+WORKER_START_TIMEOUT_SECONDS = 300.0
+POLL_SECONDS = 0.25
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def parallel_bag_enabled(options):
+    """'parallel_bag' separation option, falling back to the 'parallel_bag' setting (off by default)."""
+    enabled = options.get("parallel_bag")
+    if enabled is None:
+        enabled = get_processing_setting("parallel_bag", False)
+    return bool(enabled)
+
+
+def _bag_member_worker(model_name, member_index, threads, mix_buffer, out_buffer, connection):
+    """Worker process: load one bag member, then separate chunks from the shared buffers on request."""
+    import torch
+    from demucs.apply import apply_model
+    from demucs.pretrained import get_model
+
+    torch.set_num_threads(threads)
+    # The parent filled the weight cache when it loaded the bag, so workers map
+    # the same file and share its pages instead of each holding a private copy
+    sub_model = load_cached_member(model_name, member_index) if weight_cache_enabled() else None
+    if sub_model is None:
+        sub_model = get_model(model_name).models[member_index]
+    sub_model.cpu()
+    sub_model.eval()
+    connection.send(("ready", None))
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        length, shifts, overlap = request
+        try:
+            with torch.no_grad():
+                out_buffer[..., :length] = apply_model(
+                    sub_model, mix_buffer[None, :, :length], shifts=shifts, split=True, overlap=overlap,
+                    progress=False,
+                )[0]
+            connection.send(("done", None))
+        except Exception as e:
+            connection.send(("error", f"{type(e).__name__}: {e}"))
+    connection.close()
+
+
+class BagWorkerPool:
+    """
+    One worker process per member of a bag of models. apply() separates a chunk
+    with all members at once and combines their outputs with the bag's
+    per-source weights, in member order, exactly as demucs.apply does.
+    Chunks up to 'max_length' samples fit the shared buffers.
+    """
+    def __init__(self, model_name, bag, channels, max_length):
+        import torch
+        import torch.multiprocessing as torch_mp
+
+        self.model_name = model_name
+        self.channels = channels
+        self.max_length = max_length
+        self.weights = [list(member_weights) for member_weights in bag.weights]
+        self.source_count = len(bag.sources)
+        self._lock = threading.Lock()
+
+        members = len(bag.models)
+        threads = max(1, (os.cpu_count() or 1) // members)
+        context = torch_mp.get_context("spawn")
+        self.mix_buffer = torch.zeros(channels, max_length).share_memory_()
+        self.out_buffers = [torch.zeros(self.source_count, channels, max_length).share_memory_()
+                            for _ in range(members)]
+        self.connections, self.processes = [], []
+        for index in range(members):
+            parent_end, child_end = context.Pipe()
+            process = context.Process(
+                target=_bag_member_worker,
+                args=(model_name, index, threads, self.mix_buffer, self.out_buffers[index], child_end),
+                daemon=True,
+                name=f"bag-{model_name}-{index}",
+            )
+            process.start()
+            child_end.close()
+            self.connections.append(parent_end)
+            self.processes.append(process)
+        try:
+            for connection in self.connections:
+                if not connection.poll(WORKER_START_TIMEOUT_SECONDS):
+                    raise RuntimeError(f"Bag worker for '{model_name}' did not start in time.")
+                connection.recv()
+        except (EOFError, OSError, RuntimeError) as e:
+            self.close()
+            raise RuntimeError(f"Could not start parallel bag workers for '{model_name}': {e}")
+        append_to_log(f"Started {members} bag worker process(es) for '{model_name}' "
+                      f"({threads} thread(s) each).")
+
+    def apply(self, mix_chunk, shifts, overlap):
+        """Separate one [channels, samples] chunk; returns [sources, channels, samples] like apply_model()[0]."""
+        length = mix_chunk.shape[-1]
+        with self._lock:
+            self.mix_buffer[:, :length] = mix_chunk
+            for connection in self.connections:
+                connection.send((length, shifts, overlap))
+            errors = []
+            for connection in self.connections:
+                # Wait for every member before reusing the buffers, even if one of them failed
+                while not connection.poll(POLL_SECONDS):
+                    if not all(process.is_alive() for process in self.processes):
+                        self.close()
+                        raise RuntimeError(f"A bag worker for '{self.model_name}' exited unexpectedly.")
+                status, message = connection.recv()
+                if status == "error":
+                    errors.append(message)
+            if errors:
+                raise RuntimeError(f"Parallel bag separation failed: {errors[0]}")
+
+            estimates = 0.0
+            totals = [0.0] * self.source_count
+            for out_buffer, member_weights in zip(self.out_buffers, self.weights):
+                out = out_buffer[..., :length].clone()
+                for source, weight in enumerate(member_weights):
+                    out[source] *= weight
+                    totals[source] += weight
+                estimates += out
+            for source in range(self.source_count):
+                estimates[source] /= totals[source]
+        return estimates
+
+    @property
+    def alive(self):
+        return all(process.is_alive() for process in self.processes)
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (OSError, ValueError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for connection in self.connections:
+            connection.close()
+
+
+def get_bag_pool(model_name, bag, channels, chunk_length):
+    """
+    Worker pool for 'model_name' whose buffers fit chunks of 'chunk_length'
+    samples, started on first use (and restarted for longer chunks or after a
+    worker died). Returns None if the model is not a bag of several models.
+    """
+    if len(getattr(bag, "models", ())) < 2:
+        return None
+    with _pools_lock:
+        pool = _pools.get(model_name)
+        if pool is not None and (not pool.alive or pool.channels != channels or pool.max_length < chunk_length):
+            pool.close()
+            pool = None
+        if pool is None:
+            pool = BagWorkerPool(model_name, bag, channels, chunk_length)
+            _pools[model_name] = pool
+        return pool
+
+
+@atexit.register
+def shutdown_bag_pools():
+    """Stop every bag worker process."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,108 @@
+from pathlib import Path
+
+from job_manager import get_job_manager
+import clip_batching
+import local_processing_logic
+import youtube_logic
+
+
+def submit_local_files(file_paths, save_folder, output_mode=local_processing_logic.OUTPUT_STEMS,
+                       background_level=None, preset=None, time_ranges=None, splice_ranges=False,
+                       batch_clips=False):
+    """
+    Queue one separation job per local file, saving stems into 'save_folder'.
+    'output_mode', 'background_level', 'preset', 'time_ranges' and 'splice_ranges'
+    are passed to process_local_video. With 'batch_clips', all files go into one
+    submit_clip_batch job instead; it only writes stems of whole files, so other
+    output modes or time ranges raise ValueError.
+    Returns the list of queued Job objects (shared with the GUI's job dashboard).
+    """
+    if batch_clips:
+        clip_batching.check_batch_options(output_mode, time_ranges)
+        return [submit_clip_batch(file_paths, save_folder, preset)]
+    manager = get_job_manager()
+    return [
+        manager.submit(
+            "Local Video Upload",
+            Path(file_path).name,
+            local_processing_logic.process_local_video,
+            str(file_path),
+            str(save_folder),
+            output_mode=output_mode,
+            background_level=background_level,
+            preset=preset,
+            time_ranges=time_ranges,
+            splice_ranges=splice_ranges,
+        )
+        for file_path in file_paths
+    ]
+
+
+def submit_youtube_link(link, save_folder, subtitle_languages=None, include_translated_subs=False,
+                        subtitles_only=False):
+    """Queue a YouTube download (or subtitles-only) job. Returns the Job."""
+    return get_job_manager().submit(
+        "YouTube Subtitles" if subtitles_only else "YouTube Download",
+        link,
+        youtube_logic.process_youtube_video,
+        link,
+        str(save_folder),
+        subtitle_languages=subtitle_languages,
+        include_translated_subs=include_translated_subs,
+        subtitles_only=subtitles_only,
+    )
+
+
+def submit_youtube_separation(link, save_folder, subtitle_languages=None, include_translated_subs=False,
+                              preset=None):
+    """
+    Queue a YouTube download that also separates every video into stems, with
+    playlist downloads overlapping separation (see separate_youtube_video). Returns the Job.
+    """
+    return get_job_manager().submit(
+        "YouTube Separation",
+        link,
+        youtube_logic.separate_youtube_video,
+        link,
+        str(save_folder),
+        subtitle_languages=subtitle_languages,
+        include_translated_subs=include_translated_subs,
+        preset=preset,
+    )
+
+
+def submit_clip_batch(file_paths, save_folder, preset=None):
+    """
+    Queue one job that separates many short files in shared model batches
+    (see clip_batching), saving clean_/bg_ stems into 'save_folder' (in the
+    inputs' subfolders). Returns the Job.
+    """
+    return get_job_manager().submit(
+        clip_batching.JOB_KIND,
+        f"{len(file_paths)} clips",
+        clip_batching.process_clip_batch,
+        [str(file_path) for file_path in file_paths],
+        str(save_folder),
+        preset=preset,
+    )
+
+
+def cancel_job(job):
+    """Cancel a queued or running job (Job object or job id). Returns True if it was still active."""
+    job_id = getattr(job, "job_id", job)
+    return get_job_manager().cancel(job_id)
+
+
+def cancel_all_jobs():
+    """Cancel every queued or running job."""
+    get_job_manager().cancel_all()
+
+
+def wait_for_jobs(jobs, timeout=None):
+    """
+    Block until the given jobs are finished, failed or cancelled.
+    Returns their final snapshots (dicts), or raises TimeoutError.
+    """
+    if not get_job_manager().wait(jobs, timeout=timeout):
+        raise TimeoutError("Timed out waiting for jobs to finish.")
+    return [job.snapshot() for job in jobs]
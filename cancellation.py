@@ -0,0 +1,73 @@
+import os
+import signal
+import subprocess
+
+from logger_utils import append_to_log
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when the user (or a batch caller) asked for it to stop."""
+
+
+class CombinedEvent:
+    """
+    Stands in for a cancel event that counts as set once any of 'events' (threading.Events
+    or None) is, e.g. the user's cancel button or a job stopping its own helper thread.
+    """
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+
+def raise_if_cancelled(cancel_event, stage=""):
+    """Raise JobCancelled if 'cancel_event' (a threading.Event or None) has been set."""
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled(f"Job cancelled{f' during {stage}' if stage else ''}.")
+
+
+def _kill_process_tree(process):
+    """
+    Kill a child process and anything it spawned (yt-dlp starts its own ffmpeg, for example).
+    """
+    try:
+        if os.name == "nt":
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except Exception as e:
+        append_to_log(f"Could not kill process tree {process.pid}, killing process only: {e}")
+        process.kill()
+
+
+def run_cancellable(command, cancel_event=None, poll_interval=0.25, stage=""):
+    """
+    Drop-in replacement for subprocess.run(command, check=True, stdout=PIPE, stderr=PIPE)
+    that kills the child process (and its children) as soon as 'cancel_event' is set.
+    Raises JobCancelled on cancellation and subprocess.CalledProcessError on failure.
+    """
+    popen_kwargs = {"stdout": subprocess.PIPE, "stderr": subprocess.PIPE}
+    if os.name != "nt":
+        popen_kwargs["start_new_session"] = True  # Own process group, so the whole tree can be killed
+
+    raise_if_cancelled(cancel_event, stage)
+    process = subprocess.Popen(command, **popen_kwargs)
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=poll_interval)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event is not None and cancel_event.is_set():
+                _kill_process_tree(process)
+                process.communicate()
+                append_to_log(f"Killed {os.path.basename(str(command[0]))} (pid {process.pid}) after cancellation.")
+                raise_if_cancelled(cancel_event, stage)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
@@ -0,0 +1,107 @@
+import sys
+import argparse
+from pathlib import Path
+
+import batch_api
+from clip_batching import check_batch_options
+from job_ledger import get_job_ledger, job_parameters
+from job_manager import JOB_FINISHED
+from local_processing_logic import OUTPUT_MODES, OUTPUT_STEMS
+from separation_presets import PRESET_NAMES, describe_preset, preset_options
+from time_ranges import parse_time_ranges
+from utils import AUDIO_EXTENSIONS, VIDEO_EXTENSIONS, get_video_length
+
+MEDIA_EXTENSIONS = VIDEO_EXTENSIONS + AUDIO_EXTENSIONS
+
+
+def list_presets():
+    for name in PRESET_NAMES:
+        print(describe_preset(name))
+
+
+def estimate(file_paths, preset=None, output_mode=OUTPUT_STEMS):
+    """Print the pre-flight time/disk/memory estimate for each file from this machine's job history."""
+    ledger = get_job_ledger()
+    if ledger is None:
+        print("The job ledger is not available.")
+        return
+    parameters = job_parameters(preset_options(preset), preset=preset, output_mode=output_mode)
+    for file_path in file_paths:
+        job_estimate = ledger.estimate("Local Video Upload", get_video_length(file_path), parameters)
+        print(f"{file_path}: {job_estimate.describe()}")
+
+
+def expand_inputs(paths):
+    """The given files, with directories replaced by the video and audio files directly inside them."""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(child for child in path.iterdir()
+                                if child.is_file() and child.suffix.lower() in MEDIA_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def separate(file_paths, save_folder, preset=None, output_mode=OUTPUT_STEMS, background_level=None,
+             time_ranges=None, splice_ranges=False, batch=False):
+    """
+    Separate local files through the job manager and wait; returns the number of failed jobs.
+    With 'batch', all files go through one batched job for short clips (see clip_batching).
+    """
+    jobs = batch_api.submit_local_files(file_paths, save_folder, output_mode, background_level, preset,
+                                        time_ranges, splice_ranges, batch_clips=batch)
+    try:
+        snapshots = batch_api.wait_for_jobs(jobs)
+    except KeyboardInterrupt:
+        batch_api.cancel_all_jobs()
+        snapshots = batch_api.wait_for_jobs(jobs)
+    for snapshot in snapshots:
+        print(f"{snapshot['label']}: {snapshot['status']} - {snapshot['error'] or snapshot['message']}")
+    return sum(1 for snapshot in snapshots if snapshot["status"] != JOB_FINISHED)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rian vocal separation from the command line.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("presets", help="List separation presets with their measured speed")
+
+    estimate_parser = subparsers.add_parser("estimate", help="Predict time, disk and memory for local files")
+    estimate_parser.add_argument("files", nargs="+")
+    estimate_parser.add_argument("--preset", choices=PRESET_NAMES)
+    estimate_parser.add_argument("--mode", choices=OUTPUT_MODES, default=OUTPUT_STEMS)
+
+    separate_parser = subparsers.add_parser("separate", help="Separate local video or audio files")
+    separate_parser.add_argument("files", nargs="+", help="Files, or folders of video/audio files")
+    separate_parser.add_argument("--output", "-o", required=True, help="Folder for the results")
+    separate_parser.add_argument("--preset", choices=PRESET_NAMES,
+                                 help="Separation preset (default: 'separation_preset' setting)")
+    separate_parser.add_argument("--mode", choices=OUTPUT_MODES, default=OUTPUT_STEMS)
+    separate_parser.add_argument("--background", type=float, default=None,
+                                 help="Background level (0-1) mixed into remuxed video")
+    separate_parser.add_argument("--ranges", help="Only separate these parts, e.g. '1:30-2:45, 10:00-12:00'")
+    separate_parser.add_argument("--splice", action="store_true",
+                                 help="With --ranges, write full-length stems that are silent outside the ranges")
+    separate_parser.add_argument("--batch", action="store_true",
+                                 help="Separate many short clips in shared model batches (stems only)")
+    args = parser.parse_args()
+
+    if args.command == "presets":
+        list_presets()
+    elif args.command == "estimate":
+        estimate(args.files, args.preset, args.mode)
+    else:
+        if args.ranges:
+            try:
+                parse_time_ranges(args.ranges)
+            except ValueError as e:
+                parser.error(str(e))
+        if args.batch:
+            try:
+                check_batch_options(args.mode, args.ranges)
+            except ValueError as e:
+                parser.error(str(e))
+        failed = separate(expand_inputs(args.files), args.output, args.preset, args.mode, args.background,
+                          args.ranges, args.splice, args.batch)
+        sys.exit(1 if failed else 0)
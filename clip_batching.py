@@ -0,0 +1,277 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from cancellation import JobCancelled, raise_if_cancelled
+from job_ledger import job_parameters, track_job
+from local_processing_logic import OUTPUT_STEMS
+from logger_utils import append_to_log
+from machine_profile import machine_separation_options
+from memory_model import MemoryBudgetExceeded, get_admission_controller
+from metrics_utils import record_stage, time_stage
+from processing_config import get_processing_setting
+from separation_engine import (
+    DEFAULT_MODEL_NAME,
+    load_separation_model,
+    read_audio,
+    save_stem,
+    separate_waveform,
+    to_two_stems,
+)
+from separation_presets import preset_options
+from utils import output_stem
+from video_processor import get_bundled_path
+from vocal_postprocess import get_postprocess_chain, postprocess_vocals
+
+# Batch mode for many short inputs (social clips, ad spots), where per-file
+# costs dominate. Files are decoded in parallel straight from their container
+# (no extraction step), sorted by length, and packed into padded batches that
+# go through the model in one apply_model() call each; every clip is
+# normalized on its own samples only and cut back to its own length afterwards,
+# so the padding never leaks into a clip's result. Stems are written in parallel.
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_MAX_BATCH_SECONDS = 480.0   # Padded audio per batch (clips x longest clip)
+WINDOW_BATCHES = 2                  # Batches' worth of files decoded (and sorted) together
+JOB_KIND = "Clip Batch"
+
+
+def get_batch_settings():
+    """Batch size, padded seconds per batch and decode threads ('clip_batch_*' settings)."""
+    return {
+        "batch_size": max(1, int(get_processing_setting("clip_batch_size", DEFAULT_BATCH_SIZE))),
+        "max_batch_seconds": float(get_processing_setting("clip_batch_max_seconds", DEFAULT_MAX_BATCH_SECONDS)),
+        "decode_workers": max(1, int(get_processing_setting("clip_batch_decode_workers",
+                                                            max(1, (os.cpu_count() or 2) // 2)))),
+    }
+
+
+def check_batch_options(output_mode=None, time_ranges=None):
+    """Batch mode writes stems of whole files; raise ValueError for options it cannot honour."""
+    if time_ranges or (output_mode and output_mode != OUTPUT_STEMS):
+        raise ValueError("Batching short clips writes stems of whole files; "
+                         "it cannot be combined with time ranges or another output mode.")
+
+
+def output_names(file_paths):
+    """
+    Where each file's stems go, relative to the save folder: its folder relative
+    to the folder all inputs share, and its output_stem (with the extension
+    when files next to it share its stem). So same-named clips never overwrite
+    each other.
+    """
+    paths = [Path(path).absolute() for path in file_paths]
+    try:
+        common = Path(os.path.commonpath([str(path.parent) for path in paths])) if paths else None
+    except ValueError:
+        common = None  # Different drives
+    folders = [path.parent.relative_to(common) if common else Path(*path.parent.parts[1:]) for path in paths]
+    return {
+        str(original): folder / output_stem(path)
+        for original, folder, path in zip(file_paths, folders, paths)
+    }
+
+
+def pack_batches(lengths, batch_size, max_batch_samples):
+    """
+    Group clip indices into batches, longest first, so clips of similar length
+    share a batch and little padding is wasted. A batch holds at most
+    'batch_size' clips and 'max_batch_samples' padded samples (a longer clip
+    still gets a batch of its own).
+    """
+    order = sorted(range(len(lengths)), key=lambda index: lengths[index], reverse=True)
+    batches, current = [], []
+    for index in order:
+        # The first clip of a batch is its longest, so it sets the padded length
+        padded = lengths[current[0]] if current else lengths[index]
+        if current and (len(current) >= batch_size or padded * (len(current) + 1) > max_batch_samples):
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def separate_batch(model, clips, shifts=1, overlap=0.25):
+    """
+    Separate several [channels, samples] clips in one model call. Each clip is
+    normalized with its own statistics and zero-padded to the longest, which
+    is what apply_model() does at the end of any single input anyway. Returns,
+    per clip, a dict of source name -> [channels, samples] tensor of its length.
+    """
+    import torch
+    from demucs.apply import apply_model
+
+    length = max(clip.shape[-1] for clip in clips)
+    mix = torch.zeros(len(clips), clips[0].shape[0], length)
+    stats = []
+    for index, clip in enumerate(clips):
+        ref = clip.mean(0)
+        ref_mean, ref_std = ref.mean(), ref.std() + 1e-8
+        mix[index, :, :clip.shape[-1]] = (clip - ref_mean) / ref_std
+        stats.append((ref_mean, ref_std))
+    with torch.no_grad():
+        output = apply_model(model, mix, shifts=shifts, split=True, overlap=overlap, progress=False)
+    return [
+        {name: output[index, source, :, :clip.shape[-1]] * ref_std + ref_mean
+         for source, name in enumerate(model.sources)}
+        for index, (clip, (ref_mean, ref_std)) in enumerate(zip(clips, stats))
+    ]
+
+
+def separate_clips(file_paths, save_folder, separation_options=None, cancel_event=None, progress_callback=None):
+    """
+    Separate many short files in batches, writing clean_<stem>.wav and
+    bg_<stem>.wav for each into 'save_folder', in the same subfolders as the
+    inputs (see output_names). 'separation_options' selects
+    the model, 'shifts', 'overlap' and 'postprocess' (chunking does not apply:
+    clips go through the model whole, unless memory admission asks for smaller
+    chunks). Files that cannot be decoded or do not fit in memory are skipped.
+    Returns (seconds of audio separated, {path: error} of failed files).
+    """
+    settings = get_batch_settings()
+    options = {**machine_separation_options(), **(separation_options or {})}
+    model_name = options.pop("model", DEFAULT_MODEL_NAME)
+    postprocess_chain = get_postprocess_chain(options.pop("postprocess", None))
+    shifts, overlap = options.get("shifts", 1), options.get("overlap", 0.25)
+    ffmpeg_path = get_bundled_path("ffmpeg.exe")
+    with time_stage("model_load"):
+        model = load_separation_model(model_name)
+    samplerate, channels = model.samplerate, model.audio_channels
+    max_batch_samples = int(settings["max_batch_seconds"] * samplerate)
+    window = settings["batch_size"] * WINDOW_BATCHES
+    windows = [list(file_paths[start:start + window]) for start in range(0, len(file_paths), window)]
+    failures, written, total_seconds = {}, [], 0.0
+    save_folder = Path(save_folder)
+    save_folder.mkdir(parents=True, exist_ok=True)
+    names = output_names(file_paths)
+
+    def decode(path):
+        return read_audio(ffmpeg_path, path, samplerate, channels, cancel_event)
+
+    def write(path, sources):
+        vocals, rest = to_two_stems(sources, "vocals")
+        if postprocess_chain:
+            vocals = postprocess_vocals(vocals, samplerate, postprocess_chain)
+        name = names[str(path)]
+        (save_folder / name.parent).mkdir(parents=True, exist_ok=True)
+        save_stem(vocals, save_folder / name.parent / f"clean_{name.name}.wav", samplerate)
+        save_stem(rest, save_folder / name.parent / f"bg_{name.name}.wav", samplerate)
+
+    def admit(label, seconds):
+        # Clips go through the model whole, so the padded batch length is the chunk length
+        return get_admission_controller().admit(
+            label, seconds, model_name, {**options, "chunk_seconds": seconds, "parallel_bag": False},
+            channels=channels, samplerate=samplerate, cancel_event=cancel_event,
+        )
+
+    def separate_alone(clip, ticket):
+        # A low-memory ticket was admitted for its reduced chunk size, so separate in such chunks
+        if ticket.low_memory:
+            return separate_waveform(model, clip, ticket.options["chunk_seconds"], shifts=shifts, overlap=overlap,
+                                     cancel_event=cancel_event, parallel_bag=False)
+        return separate_batch(model, [clip], shifts, overlap)[0]
+
+    def separate_admitted(path, clip):
+        # Admitted and separated on its own; a clip that does not fit in memory fails alone
+        clip_seconds = clip.shape[-1] / samplerate
+        try:
+            with admit(Path(path).name, clip_seconds) as ticket, time_stage("separate", clip_seconds):
+                return separate_alone(clip, ticket)
+        except MemoryBudgetExceeded as e:
+            append_to_log(f"Clip batch: not enough memory to separate {path}: {e}")
+            failures[str(path)] = str(e)
+            return None
+
+    with ThreadPoolExecutor(settings["decode_workers"], thread_name_prefix="clip-io") as executor:
+        # The next window is decoding while the current one is separated
+        pending = [executor.submit(decode, path) for path in windows[0]] if windows else []
+        handled = 0
+        for window_index, paths in enumerate(windows):
+            futures = pending
+            pending = ([executor.submit(decode, path) for path in windows[window_index + 1]]
+                       if window_index + 1 < len(windows) else [])
+            clips = []
+            started = time.perf_counter()
+            for path, future in zip(paths, futures):
+                try:
+                    clips.append((path, future.result()))
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    append_to_log(f"Clip batch: could not decode {path}: {e}")
+                    failures[str(path)] = str(e)
+            record_stage("decode_wait", time.perf_counter() - started)
+            handled += len(paths) - len(clips)
+
+            for batch in pack_batches([clip.shape[-1] for _, clip in clips], settings["batch_size"],
+                                      max_batch_samples):
+                raise_if_cancelled(cancel_event, "separation")
+                batch_clips = [clips[index][1] for index in batch]
+                batch_seconds = len(batch) * max(clip.shape[-1] for clip in batch_clips) / samplerate
+                audio_seconds = sum(clip.shape[-1] for clip in batch_clips) / samplerate
+                try:
+                    with admit(f"clip batch of {len(batch)}", batch_seconds) as ticket, \
+                            time_stage("separate", audio_seconds):
+                        if ticket.low_memory:
+                            # Too big for memory as a batch: one clip per model call, in smaller chunks
+                            results = [separate_alone(clip, ticket) for clip in batch_clips]
+                        else:
+                            results = separate_batch(model, batch_clips, shifts, overlap)
+                except MemoryBudgetExceeded as e:
+                    if len(batch) == 1:
+                        path = clips[batch[0]][0]
+                        append_to_log(f"Clip batch: not enough memory to separate {path}: {e}")
+                        failures[str(path)] = str(e)
+                        results = [None]
+                    else:
+                        # Does not fit at all as a batch: each clip admitted and separated on its own
+                        results = [separate_admitted(*clips[index]) for index in batch]
+                for index, sources in zip(batch, results):
+                    if sources is not None:
+                        written.append((clips[index][0], executor.submit(write, clips[index][0], sources)))
+                        total_seconds += clips[index][1].shape[-1] / samplerate
+                handled += len(batch)
+                if progress_callback:
+                    progress_callback(100.0 * handled / len(file_paths))
+
+        with time_stage("write_wait"):
+            for path, future in written:
+                try:
+                    future.result()
+                except Exception as e:
+                    append_to_log(f"Clip batch: could not write the stems of {path}: {e}")
+                    failures[str(path)] = str(e)
+    return total_seconds, failures
+
+
+def process_clip_batch(file_paths, save_folder, progress_label, preset=None):
+    """
+    Job target: separate 'file_paths' with separate_clips and 'preset', recording
+    the whole batch as one job in the ledger. Raises if any file failed (after
+    the others were written).
+    """
+    cancel_event = getattr(progress_label, "cancel_event", None)
+    progress_callback = getattr(progress_label, "progress", None)
+    progress_label.set(f"Separating {len(file_paths)} clip(s) in batches...")
+    separation_options = preset_options(preset)
+    started = time.perf_counter()
+    with track_job(
+        JOB_KIND,
+        f"{len(file_paths)} clips",
+        file_size=sum(os.path.getsize(path) for path in file_paths if os.path.isfile(path)),
+        parameters=job_parameters(separation_options, preset=preset, clips=len(file_paths)),
+    ) as ledger_entry:
+        total_seconds, failures = separate_clips(
+            file_paths, save_folder, separation_options, cancel_event, progress_callback
+        )
+        ledger_entry.update(input_seconds=total_seconds)
+    elapsed = time.perf_counter() - started
+    append_to_log(f"{JOB_KIND}: {len(file_paths) - len(failures)} of {len(file_paths)} clip(s), "
+                  f"{total_seconds:.0f}s of audio, separated in {elapsed:.1f}s "
+                  f"({total_seconds / max(elapsed, 1e-6):.1f}x real time).")
+    if failures:
+        raise RuntimeError(f"{len(failures)} of {len(file_paths)} clip(s) failed: "
+                           + "; ".join(f"{Path(path).name}: {error}" for path, error in failures.items()))
+    progress_label.set(f"Separated {len(file_paths)} clip(s) ({total_seconds:.0f}s of audio) in {elapsed:.1f}s.")
@@ -1,6 +1,29 @@
+import os
+import sys
+import shutil
 import tempfile
+import threading
+import time
+import contextlib
+import uuid
 from pathlib import Path
-import sys
+
+from logger_utils import append_to_log
+from metrics_utils import register_gauge
+from processing_config import get_processing_setting
+
+WORKSPACE_PREFIX = "rian_job_"
+
+# Rough on-disk footprint per second of input: the audio decoded to 32-bit float
+# 44.1 kHz stereo WAV (~350 KB/s) plus the two 16-bit stereo stems written by
+# Demucs (~350 KB/s together), with headroom.
+AUDIO_BYTES_PER_SECOND = 850 * 1024
+# Extra footprint per second when the source video itself lives in the workspace (downloads).
+VIDEO_BYTES_PER_SECOND = 1024 * 1024
+MIN_RESERVATION_BYTES = 64 * 1024 * 1024
+UNKNOWN_DURATION_RESERVATION_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_RAMDISK_DIRS = ["/dev/shm"]
+
 
 def get_output_directory():
     """
@@ -28,4 +51,260 @@ def get_output_directory():
             print(f"Using temporary directory: {temp_dir}")
             return temp_dir
         else:
-            raise RuntimeError(f"Error creating directory: {e}")
\ No newline at end of file
+            raise RuntimeError(f"Error creating directory: {e}")
+
+
+def estimate_job_bytes(duration_seconds, includes_video=False):
+    """
+    Estimate how much scratch space a job needs from its probed duration (seconds).
+    Falls back to a generous fixed reservation when the duration is unknown.
+    """
+    if not duration_seconds:
+        return UNKNOWN_DURATION_RESERVATION_BYTES
+
+    per_second = AUDIO_BYTES_PER_SECOND + (VIDEO_BYTES_PER_SECOND if includes_video else 0)
+    return max(MIN_RESERVATION_BYTES, int(duration_seconds * per_second))
+
+
+def get_directory_size(path):
+    """Total size in bytes of all files below 'path' (0 if it does not exist)."""
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # File removed while walking
+    return total
+
+
+def _pid_alive(pid):
+    """Best-effort check whether a process with the given PID is still running."""
+    if pid == os.getpid():
+        return True
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        pass
+
+    if os.name == "nt":
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, but owned by another user
+    return True
+
+
+class JobWorkspace:
+    """
+    A scratch directory owned by one job, plus the space reserved for it.
+    """
+    def __init__(self, path, label, reserved_bytes, on_ramdisk):
+        self.path = Path(path)
+        self.label = label
+        self.reserved_bytes = reserved_bytes
+        self.on_ramdisk = on_ramdisk
+        self.peak_bytes = 0
+
+    def sample_usage(self):
+        """Measure current usage, update this job's high-water mark and return it."""
+        used = get_directory_size(self.path)
+        self.peak_bytes = max(self.peak_bytes, used)
+        return used
+
+
+class WorkspaceManager:
+    """
+    Hands out per-job working directories under a disk budget.
+
+    Every job reserves space up front based on its probed duration. Jobs that
+    would push the total reservation over the budget wait until earlier jobs
+    release their space (or are refused outright if they could never fit).
+    Intermediates go to a RAM disk (tmpfs) when one is available and the job fits
+    in the RAM budget.
+    """
+    def __init__(self, root=None, disk_budget_bytes=None, ram_budget_bytes=None, ramdisk_dir=None):
+        workspace_dir = root or get_processing_setting("workspace_dir")
+        self.root = Path(workspace_dir) if workspace_dir else get_output_directory() / "workspaces"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        if disk_budget_bytes is None:
+            disk_budget_bytes = int(get_processing_setting("disk_budget_mb", 20480)) * 1024 * 1024
+        if ram_budget_bytes is None:
+            ram_budget_bytes = int(get_processing_setting("ram_budget_mb", 2048)) * 1024 * 1024
+        self.disk_budget_bytes = disk_budget_bytes
+        self.ram_budget_bytes = ram_budget_bytes
+        self.ram_root = self._find_ramdisk_root(ramdisk_dir or get_processing_setting("ramdisk_dir"))
+
+        self._condition = threading.Condition()
+        self._disk_reserved = 0
+        self._ram_reserved = 0
+        self.high_water = {"disk_reserved": 0, "ram_reserved": 0, "job_peak": 0}
+
+    def _find_ramdisk_root(self, configured_dir):
+        """Pick a tmpfs/RAM-disk directory for intermediates, or None if unavailable."""
+        if self.ram_budget_bytes <= 0:
+            return None
+        candidates = [configured_dir] if configured_dir else DEFAULT_RAMDISK_DIRS
+        for candidate in candidates:
+            if candidate and os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+                ram_root = Path(candidate) / "rian_workspaces"
+                try:
+                    ram_root.mkdir(exist_ok=True)
+                    return ram_root
+                except OSError as e:
+                    append_to_log(f"RAM disk at {candidate} is not usable: {e}")
+        return None
+
+    def cleanup_orphans(self):
+        """
+        Remove workspaces left behind by crashed runs (owner process no longer alive).
+        Returns the number of bytes reclaimed.
+        """
+        reclaimed = 0
+        for base in filter(None, [self.root, self.ram_root]):
+            for entry in base.glob(f"{WORKSPACE_PREFIX}*"):
+                try:
+                    owner_pid = int(entry.name[len(WORKSPACE_PREFIX):].split("_", 1)[0])
+                except ValueError:
+                    continue
+                if _pid_alive(owner_pid):
+                    continue
+                size = get_directory_size(entry)
+                shutil.rmtree(entry, ignore_errors=True)
+                reclaimed += size
+                append_to_log(f"Removed orphaned workspace {entry} ({size / 1024 / 1024:.1f} MB).")
+        return reclaimed
+
+    def _try_reserve(self, reserved_bytes, prefer_ram):
+        """Reserve space if possible. Returns the base directory to use, or None."""
+        if prefer_ram and self.ram_root and self._ram_reserved + reserved_bytes <= self.ram_budget_bytes:
+            if shutil.disk_usage(self.ram_root).free >= reserved_bytes:
+                self._ram_reserved += reserved_bytes
+                self.high_water["ram_reserved"] = max(self.high_water["ram_reserved"], self._ram_reserved)
+                return self.ram_root
+
+        if self._disk_reserved + reserved_bytes <= self.disk_budget_bytes:
+            if shutil.disk_usage(self.root).free >= reserved_bytes:
+                self._disk_reserved += reserved_bytes
+                self.high_water["disk_reserved"] = max(self.high_water["disk_reserved"], self._disk_reserved)
+                return self.root
+        return None
+
+    @contextlib.contextmanager
+    def job_workspace(self, label, duration_seconds=None, includes_video=False,
+                      prefer_ram=True, wait=True, timeout=None):
+        """
+        Context manager yielding a JobWorkspace for one job.
+        Blocks (queues) while the disk budget is exhausted, unless 'wait' is False.
+        Raises RuntimeError if the job cannot fit in the budget at all, or if
+        waiting times out. The directory and its reservation are released on exit.
+        """
+        reserved_bytes = estimate_job_bytes(duration_seconds, includes_video)
+        if reserved_bytes > self.disk_budget_bytes and (not self.ram_root or reserved_bytes > self.ram_budget_bytes):
+            raise RuntimeError(
+                f"Job '{label}' needs about {reserved_bytes / 1024 / 1024:.0f} MB of scratch space, "
+                f"which exceeds the configured disk budget of {self.disk_budget_bytes / 1024 / 1024:.0f} MB."
+            )
+
+        with self._condition:
+            base_dir = self._try_reserve(reserved_bytes, prefer_ram)
+            if base_dir is None and not wait:
+                raise RuntimeError(f"Not enough disk budget available for job '{label}'.")
+            if base_dir is None:
+                append_to_log(f"Job '{label}' queued waiting for {reserved_bytes / 1024 / 1024:.0f} MB of disk budget.")
+                deadline = None if timeout is None else time.monotonic() + timeout
+            while base_dir is None:
+                if not self._disk_reserved and not self._ram_reserved:
+                    raise RuntimeError(f"Not enough free disk space for job '{label}'.")
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise RuntimeError(f"Timed out waiting for disk budget for job '{label}'.")
+                self._condition.wait(timeout=remaining)
+                base_dir = self._try_reserve(reserved_bytes, prefer_ram)
+
+        on_ramdisk = base_dir == self.ram_root
+        path = base_dir / f"{WORKSPACE_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        workspace = JobWorkspace(path, label, reserved_bytes, on_ramdisk)
+        try:
+            path.mkdir(parents=True)
+            append_to_log(
+                f"Workspace for '{label}' at {path} "
+                f"({'RAM disk' if on_ramdisk else 'disk'}, reserved {reserved_bytes / 1024 / 1024:.0f} MB)."
+            )
+            yield workspace
+        finally:
+            workspace.sample_usage()
+            shutil.rmtree(path, ignore_errors=True)
+            with self._condition:
+                if on_ramdisk:
+                    self._ram_reserved -= reserved_bytes
+                else:
+                    self._disk_reserved -= reserved_bytes
+                self.high_water["job_peak"] = max(self.high_water["job_peak"], workspace.peak_bytes)
+                self._condition.notify_all()
+            append_to_log(
+                f"Released workspace for '{label}': peak usage {workspace.peak_bytes / 1024 / 1024:.1f} MB "
+                f"of {reserved_bytes / 1024 / 1024:.0f} MB reserved. High-water marks: {self.report()}"
+            )
+
+    def usage_bytes(self):
+        """Bytes currently used by all live workspaces (disk and RAM disk)."""
+        return sum(
+            get_directory_size(entry)
+            for base in filter(None, [self.root, self.ram_root])
+            for entry in base.glob(f"{WORKSPACE_PREFIX}*")
+        )
+
+    def report(self):
+        """Return current reservations and high-water marks (in MB) for logging/display."""
+        mb = 1024 * 1024
+        return {
+            "disk_reserved_mb": round(self._disk_reserved / mb, 1),
+            "ram_reserved_mb": round(self._ram_reserved / mb, 1),
+            "disk_reserved_high_water_mb": round(self.high_water["disk_reserved"] / mb, 1),
+            "ram_reserved_high_water_mb": round(self.high_water["ram_reserved"] / mb, 1),
+            "job_peak_usage_high_water_mb": round(self.high_water["job_peak"] / mb, 1),
+        }
+
+
+_workspace_manager = None
+_workspace_manager_lock = threading.Lock()
+
+
+def get_workspace_manager():
+    """
+    Return the process-wide WorkspaceManager, creating it on first use.
+    Creating it also cleans up workspaces orphaned by crashed runs.
+    """
+    global _workspace_manager
+    with _workspace_manager_lock:
+        if _workspace_manager is None:
+            _workspace_manager = WorkspaceManager()
+            register_gauge("rian_temp_disk_used_bytes", "Bytes used by job workspaces.",
+                           _workspace_manager.usage_bytes)
+            register_gauge("rian_temp_disk_reserved_bytes", "Bytes reserved by job workspaces on disk.",
+                           lambda: _workspace_manager._disk_reserved)
+            register_gauge("rian_temp_ram_reserved_bytes", "Bytes reserved by job workspaces on the RAM disk.",
+                           lambda: _workspace_manager._ram_reserved)
+            reclaimed = _workspace_manager.cleanup_orphans()
+            if reclaimed:
+                append_to_log(f"Reclaimed {reclaimed / 1024 / 1024:.1f} MB from orphaned workspaces.")
+        return _workspace_manager
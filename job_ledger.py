@@ -0,0 +1,317 @@
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import contextlib
+from datetime import datetime
+from pathlib import Path
+
+from bag_parallel import parallel_bag_enabled
+from cancellation import JobCancelled
+from directory_manager import estimate_job_bytes
+from logger_utils import LOG_FILE, append_to_log
+from machine_profile import machine_fingerprint, machine_separation_options
+from memory_model import get_admission_controller
+from metrics_utils import record_stage_timings
+from separation_engine import DEFAULT_CHUNK_SECONDS, DEFAULT_MODEL_NAME, bag_size
+from utils import format_duration
+
+# Local history of every job, used to predict how long (and how much disk and
+# memory) the next one will take on this machine.
+LEDGER_FILE = Path(LOG_FILE).parent / "rian_job_ledger.sqlite3"
+FIT_HISTORY = 50       # Most recent successful jobs used for a fit
+MIN_MODEL_SAMPLES = 3  # Below this many jobs with the same model, all jobs of the kind are used
+DISK_MARGIN = 1.2      # Learned scratch-space estimates are padded by this factor
+ETA_MIN_PROGRESS = 5.0  # Percent of progress before it is trusted for the ETA
+
+LEDGER_STATUS_RUNNING = "running"
+LEDGER_STATUS_SUCCESS = "success"
+LEDGER_STATUS_FAILURE = "failure"
+LEDGER_STATUS_CANCELLED = "cancelled"
+LEDGER_STATUS_INTERRUPTED = "interrupted"  # Still 'running' when the app last stopped
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    function_type TEXT NOT NULL,
+    label TEXT,
+    machine TEXT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    status TEXT NOT NULL,
+    input_seconds REAL,
+    file_size INTEGER,
+    parameters TEXT,
+    stage_seconds TEXT,
+    processing_seconds REAL,
+    peak_disk_bytes INTEGER,
+    peak_memory_bytes INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_kind ON jobs (function_type, status, id);
+"""
+
+
+def _machine_key():
+    return json.dumps(machine_fingerprint(), sort_keys=True)
+
+
+def _fit_line(points):
+    """
+    Least-squares (intercept, slope) of processing seconds against input seconds.
+    Falls back to a line through the origin when the inputs all have about the
+    same length or the fit comes out negative.
+    """
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    n = len(points)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if n >= 2 and variance > 1e-6:
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+        intercept = mean_y - slope * mean_x
+        if slope > 0 and intercept >= 0:
+            return intercept, slope
+    squares = sum(x * x for x in xs)
+    return 0.0, (sum(x * y for x, y in points) / squares if squares else 0.0)
+
+
+class JobEstimate:
+    """Pre-flight prediction for one job: seconds (None without history), disk and memory bytes."""
+    def __init__(self, seconds, stage_seconds, disk_bytes, memory_bytes, samples):
+        self.seconds = seconds
+        self.stage_seconds = stage_seconds
+        self.disk_bytes = disk_bytes
+        self.memory_bytes = memory_bytes
+        self.samples = samples
+
+    def describe(self):
+        time_text = (f"about {format_duration(self.seconds)} (from {self.samples} past job(s))"
+                     if self.seconds is not None else "time unknown (no past jobs yet)")
+        return (f"Estimated {time_text}, {self.disk_bytes / 1024 / 1024:.0f} MB disk, "
+                f"{self.memory_bytes / 1024 / 1024:.0f} MB memory.")
+
+
+class JobLedger:
+    """
+    SQLite record of every job run on this machine: input properties, parameters,
+    per-stage timings, resource peaks and outcome. Throughput models are fitted
+    from it on demand.
+    """
+    def __init__(self, path=LEDGER_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+            # Jobs of a previous run that never finished (crash, kill)
+            self._connection.execute("UPDATE jobs SET status = ? WHERE status = ?",
+                                     (LEDGER_STATUS_INTERRUPTED, LEDGER_STATUS_RUNNING))
+
+    def start(self, function_type, label, input_seconds=None, file_size=None, parameters=None):
+        """Record a job as running. Returns its ledger id."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (function_type, label, machine, started_at, status, input_seconds, file_size,"
+                " parameters) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (function_type, label, _machine_key(), datetime.now().isoformat(), LEDGER_STATUS_RUNNING,
+                 input_seconds, file_size, json.dumps(parameters or {}, sort_keys=True)),
+            )
+            return cursor.lastrowid
+
+    def update(self, ledger_id, **fields):
+        """Set columns of a recorded job ('stage_seconds' and 'parameters' may be dicts)."""
+        for name in ("stage_seconds", "parameters"):
+            if isinstance(fields.get(name), dict):
+                fields[name] = json.dumps(fields[name], sort_keys=True)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._connection:
+            self._connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), ledger_id))
+
+    def recent(self, limit=20, function_type=None):
+        """The most recent jobs as dicts, newest first."""
+        query = "SELECT * FROM jobs"
+        args = []
+        if function_type:
+            query += " WHERE function_type = ?"
+            args.append(function_type)
+        query += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._connection.execute(query, args).fetchall()
+        return [dict(row) for row in rows]
+
+    def _history(self, function_type, model_name):
+        """Recent successful jobs of this kind on this machine, preferring the same model."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT * FROM jobs WHERE function_type = ? AND status = ? AND machine = ?"
+                " AND input_seconds > 0 AND processing_seconds IS NOT NULL ORDER BY id DESC LIMIT ?",
+                (function_type, LEDGER_STATUS_SUCCESS, _machine_key(), FIT_HISTORY * 4),
+            ).fetchall()
+        same_model = [row for row in rows if json.loads(row["parameters"] or "{}").get("model") == model_name]
+        return (same_model if len(same_model) >= MIN_MODEL_SAMPLES else rows)[:FIT_HISTORY]
+
+    def estimate(self, function_type, input_seconds, parameters=None, includes_video=False):
+        """
+        Pre-flight JobEstimate for a job of 'function_type' on an input of
+        'input_seconds': time from a per-stage linear fit of this machine's past
+        jobs, scratch space from their measured peaks (or the workspace
+        manager's rule of thumb) and memory from the calibrated memory model.
+        """
+        parameters = parameters or {}
+        model_name = parameters.get("model", DEFAULT_MODEL_NAME)
+        history = self._history(function_type, model_name) if input_seconds else []
+
+        seconds, stage_seconds = None, {}
+        if history:
+            intercept, slope = _fit_line([(row["input_seconds"], row["processing_seconds"]) for row in history])
+            seconds = intercept + slope * input_seconds
+            stage_points = {}
+            for row in history:
+                for stage, stage_time in json.loads(row["stage_seconds"] or "{}").items():
+                    stage_points.setdefault(stage, []).append((row["input_seconds"], stage_time))
+            for stage, points in stage_points.items():
+                intercept, slope = _fit_line(points)
+                stage_seconds[stage] = round(intercept + slope * input_seconds, 2)
+
+        disk_ratios = [row["peak_disk_bytes"] / row["input_seconds"] for row in history if row["peak_disk_bytes"]]
+        if disk_ratios:
+            disk_bytes = int(max(disk_ratios) * input_seconds * DISK_MARGIN)
+        else:
+            disk_bytes = estimate_job_bytes(input_seconds, includes_video)
+
+        chunk_seconds = float(parameters.get("chunk_seconds") or DEFAULT_CHUNK_SECONDS)
+        members = bag_size(model_name) if parallel_bag_enabled(parameters) else 1
+        memory_bytes = get_admission_controller().memory_model.predict_peak_bytes(
+            input_seconds, model_name, chunk_seconds, parallel_members=members)
+        return JobEstimate(seconds, stage_seconds, disk_bytes, memory_bytes, len(history))
+
+
+class LedgerEntry:
+    """
+    One running job's ledger record, as yielded by track_job. Holds the
+    pre-flight estimate and turns separation progress into a live ETA.
+    """
+    def __init__(self, ledger, ledger_id, estimate):
+        self.ledger = ledger
+        self.ledger_id = ledger_id
+        self.estimate = estimate
+        self.started = time.monotonic()
+        self.fields = {}
+
+    def update(self, **fields):
+        """Remember extra columns (file_size, peak_disk_bytes, ...) to store when the job ends."""
+        self.fields.update({name: value for name, value in fields.items() if value is not None})
+
+    def eta_seconds(self, progress_percent):
+        """
+        Remaining seconds: the pre-flight estimate minus elapsed time, blended
+        towards extrapolated progress as the job advances. None if neither is known yet.
+        """
+        elapsed = time.monotonic() - self.started
+        from_model = max(0.0, self.estimate.seconds - elapsed) if self.estimate.seconds is not None else None
+        if progress_percent < ETA_MIN_PROGRESS:
+            return from_model
+        from_progress = elapsed * (100.0 - progress_percent) / progress_percent
+        if from_model is None:
+            return from_progress
+        weight = progress_percent / 100.0
+        return (1 - weight) * from_model + weight * from_progress
+
+    def progress_message(self, prefix, progress_percent):
+        """E.g. 'Separating... 40% (about 0:01:30 left)'."""
+        eta = self.eta_seconds(progress_percent)
+        suffix = f" (about {format_duration(eta)} left)" if eta is not None else ""
+        return f"{prefix} {progress_percent:.0f}%{suffix}"
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_job_ledger():
+    """Process-wide ledger, or None if the database cannot be opened (jobs then run unrecorded)."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            try:
+                _ledger = JobLedger()
+            except sqlite3.Error as e:
+                append_to_log(f"Job ledger unavailable ({LEDGER_FILE}): {e}")
+                return None
+        return _ledger
+
+
+def job_parameters(separation_options=None, **extra):
+    """Parameters recorded for a separation job: the effective model options plus 'extra'."""
+    options = {**machine_separation_options(), **(separation_options or {})}
+    options.setdefault("model", DEFAULT_MODEL_NAME)
+    options.update({name: value for name, value in extra.items() if value is not None})
+    return options
+
+
+@contextlib.contextmanager
+def track_job(function_type, label, input_seconds=None, file_size=None, parameters=None, includes_video=False):
+    """
+    Record a job in the ledger for the duration of the block. Yields a
+    LedgerEntry (with the pre-flight estimate); stages timed on this thread are
+    stored with the outcome. Ledger errors are logged, never raised into the job.
+    """
+    ledger = get_job_ledger()
+    estimate, ledger_id = None, None
+    if ledger is not None:
+        try:
+            estimate = ledger.estimate(function_type, input_seconds, parameters, includes_video)
+            ledger_id = ledger.start(function_type, label, input_seconds, file_size, parameters)
+        except sqlite3.Error as e:
+            append_to_log(f"Could not record job '{label}' in the ledger: {e}")
+    if estimate is None:
+        estimate = JobEstimate(None, {}, estimate_job_bytes(input_seconds, includes_video), 0, 0)
+    entry = LedgerEntry(ledger, ledger_id, estimate)
+
+    status, error = LEDGER_STATUS_SUCCESS, None
+    with record_stage_timings() as stage_seconds:
+        try:
+            yield entry
+        except JobCancelled:
+            status = LEDGER_STATUS_CANCELLED
+            raise
+        except BaseException as e:
+            status, error = LEDGER_STATUS_FAILURE, str(e)
+            raise
+        finally:
+            if ledger_id is not None:
+                try:
+                    ledger.update(
+                        ledger_id,
+                        status=status,
+                        finished_at=datetime.now().isoformat(),
+                        processing_seconds=round(time.monotonic() - entry.started, 3),
+                        stage_seconds={stage: round(seconds, 3) for stage, seconds in stage_seconds.items()},
+                        error=error,
+                        **entry.fields,
+                    )
+                except sqlite3.Error as e:
+                    append_to_log(f"Could not record the outcome of job '{label}' in the ledger: {e}")
+
+
+def print_history(limit=20):
+    ledger = get_job_ledger()
+    if ledger is None:
+        return
+    for row in ledger.recent(limit):
+        length = format_duration(row["input_seconds"]) if row["input_seconds"] else "?"
+        took = f"{row['processing_seconds']:.1f}s" if row["processing_seconds"] is not None else "-"
+        print(f"#{row['id']} {row['started_at'][:19]} {row['function_type']}: {row['label']} "
+              f"[{row['status']}] input {length}, took {took}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Show the local job history ({LEDGER_FILE}).")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    print_history(args.limit)
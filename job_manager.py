@@ -0,0 +1,258 @@
+import queue
+import threading
+import itertools
+import time
+from datetime import datetime
+
+from cancellation import JobCancelled
+from logger_utils import append_to_log
+from metrics_utils import record_job_outcome, register_gauge
+from processing_config import get_processing_setting
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_FINISHED = "finished"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_DONE_STATUSES = (JOB_FINISHED, JOB_FAILED, JOB_CANCELLED)
+
+
+class Job:
+    """
+    State of one unit of work (a local file, a YouTube link, ...).
+    Fields are written by the worker thread through JobManager and read by the UI.
+    """
+    def __init__(self, job_id, kind, label):
+        self.job_id = job_id
+        self.kind = kind
+        self.label = label
+        self.status = JOB_QUEUED
+        self.message = "Queued"
+        self.progress = 0.0  # Percent, 0-100
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    def snapshot(self):
+        """Return a plain dict copy of the job state, safe to hand to the UI thread."""
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "label": self.label,
+            "status": self.status,
+            "message": self.message,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class JobStatusReporter:
+    """
+    Stand-in for the Tk StringVar the processing functions used to update directly.
+    Calls are forwarded to the JobManager, so worker threads never touch Tk objects.
+    'cancel_event' is the job's threading.Event, for passing down to long-running stages.
+    """
+    def __init__(self, manager, job):
+        self._manager = manager
+        self._job = job
+        self.cancel_event = job.cancel_event
+
+    def set(self, message):
+        self._manager.update(self._job, message=message)
+
+    def progress(self, percent):
+        self._manager.update(self._job, progress=max(0.0, min(100.0, float(percent))))
+
+
+class JobManager:
+    """
+    Runs jobs on a small pool of worker threads and collects their status updates.
+
+    Workers never talk to the UI directly: each update marks the job as dirty on a
+    queue, and the UI drains that queue on a fixed timer (see drain_updates), so
+    bursts of updates from a busy pipeline collapse into one redraw per job per tick.
+    """
+    def __init__(self, max_concurrent_jobs=1):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._pending = queue.Queue()
+        self._updates = queue.Queue()
+        self._workers = [
+            threading.Thread(target=self._worker_loop, daemon=True, name=f"job-worker-{i}")
+            for i in range(max(1, max_concurrent_jobs))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, kind, label, target, *args, **kwargs):
+        """
+        Queue 'target' to run on a worker thread.
+        'target' is called as target(*args, status, **kwargs) where 'status' is a
+        JobStatusReporter with the same set() method as a Tk StringVar.
+        Returns the Job.
+        """
+        with self._lock:
+            job = Job(next(self._ids), kind, label)
+            self._jobs[job.job_id] = job
+        self._updates.put(job.job_id)
+        self._pending.put((job, target, args, kwargs))
+        append_to_log(f"Job {job.job_id} queued: {kind} - {label}")
+        return job
+
+    def track(self, kind, label):
+        """
+        Register a job that is executed by some other pipeline (e.g. the watch folder)
+        rather than by this manager's workers, so it still shows up on the dashboard
+        and can be cancelled. The caller drives it with update().
+        """
+        with self._lock:
+            job = Job(next(self._ids), kind, label)
+            self._jobs[job.job_id] = job
+        self._updates.put(job.job_id)
+        return job
+
+    def update(self, job, **changes):
+        """Apply changes to a job's state and notify the UI on its next tick."""
+        with self._lock:
+            became_done = changes.get("status") in JOB_DONE_STATUSES and job.status not in JOB_DONE_STATUSES
+            for name, value in changes.items():
+                setattr(job, name, value)
+        self._updates.put(job.job_id)
+
+        if became_done:
+            duration = None
+            if job.started_at and job.finished_at:
+                duration = (job.finished_at - job.started_at).total_seconds()
+            record_job_outcome(job.kind, job.status, duration)
+
+    def cancel(self, job_id):
+        """
+        Ask a job to stop. Queued jobs are dropped before they start; running jobs
+        see their cancel_event set and stop at the next check (child processes are
+        killed, separation stops at the next chunk). Returns False if the job is unknown or done.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in JOB_DONE_STATUSES:
+                return False
+            job.cancel_event.set()
+            was_queued = job.status == JOB_QUEUED
+        if was_queued:
+            self.update(job, status=JOB_CANCELLED, finished_at=datetime.now(), message="Cancelled before start.")
+        else:
+            self.update(job, message="Cancelling...")
+        append_to_log(f"Cancellation requested for job {job_id} ({job.label}).")
+        return True
+
+    def cancel_all(self):
+        """Cancel every queued or running job."""
+        with self._lock:
+            job_ids = [job_id for job_id, job in self._jobs.items() if job.status not in JOB_DONE_STATUSES]
+        for job_id in job_ids:
+            self.cancel(job_id)
+
+    def wait(self, jobs, timeout=None):
+        """Block until all given jobs are done (or 'timeout' seconds pass). Returns True if all finished."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in jobs:
+            while job.status not in JOB_DONE_STATUSES:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.1)
+        return True
+
+    def count(self, status):
+        """Number of jobs currently in the given status."""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == status)
+
+    def jobs(self):
+        """Snapshots of all jobs, oldest first."""
+        with self._lock:
+            return [job.snapshot() for job in self._jobs.values()]
+
+    def drain_updates(self):
+        """
+        Collect every pending update notification (non-blocking) and return one
+        snapshot per changed job. Intended to be called from the UI thread.
+        """
+        changed_ids = []
+        while True:
+            try:
+                job_id = self._updates.get_nowait()
+            except queue.Empty:
+                break
+            if job_id not in changed_ids:
+                changed_ids.append(job_id)
+
+        with self._lock:
+            return [self._jobs[job_id].snapshot() for job_id in changed_ids if job_id in self._jobs]
+
+    def clear_finished(self):
+        """Forget jobs that are no longer queued or running."""
+        with self._lock:
+            for job_id in [jid for jid, job in self._jobs.items() if job.status in JOB_DONE_STATUSES]:
+                del self._jobs[job_id]
+
+    def run_now(self, kind, label, target, *args, **kwargs):
+        """
+        Like submit(), but start 'target' right away on its own thread instead of
+        waiting behind queued and running jobs (for short interactive work such as
+        previews). Returns the Job.
+        """
+        with self._lock:
+            job = Job(next(self._ids), kind, label)
+            self._jobs[job.job_id] = job
+        self._updates.put(job.job_id)
+        append_to_log(f"Job {job.job_id} started immediately: {kind} - {label}")
+        threading.Thread(
+            target=self._run, args=(job, target, args, kwargs), daemon=True, name=f"job-{job.job_id}"
+        ).start()
+        return job
+
+    def _run(self, job, target, args, kwargs):
+        """Run one job, recording the outcome."""
+        with self._lock:
+            if job.cancel_event.is_set():
+                return  # Cancelled while still queued
+            job.status, job.started_at, job.message = JOB_RUNNING, datetime.now(), "Starting..."
+        self._updates.put(job.job_id)
+        try:
+            target(*args, JobStatusReporter(self, job), **kwargs)
+            self.update(job, status=JOB_FINISHED, finished_at=datetime.now(), progress=100.0)
+        except JobCancelled:
+            append_to_log(f"Job {job.job_id} ({job.label}) cancelled.")
+            self.update(job, status=JOB_CANCELLED, finished_at=datetime.now(), message="Cancelled.")
+        except Exception as e:
+            append_to_log(f"Job {job.job_id} ({job.label}) failed: {e}")
+            self.update(job, status=JOB_FAILED, finished_at=datetime.now(), error=str(e), message=f"Failed: {e}")
+
+    def _worker_loop(self):
+        """Take queued jobs one at a time and run them."""
+        while True:
+            job, target, args, kwargs = self._pending.get()
+            self._run(job, target, args, kwargs)
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-wide JobManager shared by the GUI and the batch API."""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(
+                get_processing_setting("max_concurrent_jobs", 1))
+            register_gauge("rian_queue_depth", "Jobs waiting to start.",
+                           lambda: _job_manager.count(JOB_QUEUED))
+            register_gauge("rian_running_jobs", "Jobs currently running.",
+                           lambda: _job_manager.count(JOB_RUNNING))
+        return _job_manager
@@ -1,64 +1,204 @@
 import os
 import shutil
-import tempfile
 import socket
 import platform
 from datetime import datetime
 from pathlib import Path
 from tkinter import filedialog
 
+from cancellation import JobCancelled
+from directory_manager import get_workspace_manager
+from job_ledger import job_parameters, track_job
 from logger_utils import append_to_log, send_log_to_server
+from separation_presets import preset_options
+from time_ranges import parse_time_ranges, range_label, splice_wavs
 from utils import (
+    AUDIO_EXTENSIONS,
+    VIDEO_EXTENSIONS,
     format_duration,
     calculate_processing_time,
     get_video_length,
+    is_audio_file,
+    output_stem,
 )
-from video_processor import process_video
+from video_processor import process_video, process_video_ranges, remux_clean_audio
 
 
-def process_local_video(app, progress_label, progress_bar):
+VIDEO_PATTERNS = " ".join(f"*{extension}" for extension in VIDEO_EXTENSIONS)
+AUDIO_PATTERNS = " ".join(f"*{extension}" for extension in AUDIO_EXTENSIONS)
+MEDIA_FILE_TYPES = [
+    ("Video and Audio Files", f"{VIDEO_PATTERNS} {AUDIO_PATTERNS}"),
+    ("Video Files", VIDEO_PATTERNS),
+    ("Audio Files", AUDIO_PATTERNS),
+]
+
+# What a local job delivers: the two WAV stems, the video with cleaned audio, or both;
+# or an ASR-ready vocal file (mono, resampled, normalized) instead of / next to the stems
+OUTPUT_STEMS = "stems"
+OUTPUT_REMUX = "remux"
+OUTPUT_BOTH = "both"
+OUTPUT_ASR = "asr"
+OUTPUT_STEMS_ASR = "stems+asr"
+OUTPUT_MODES = (OUTPUT_STEMS, OUTPUT_REMUX, OUTPUT_BOTH, OUTPUT_ASR, OUTPUT_STEMS_ASR)
+
+
+def select_local_videos():
     """
-    Let user pick a local video file, process it, and save stems.
+    Let the user pick one or more local video or audio files and the folder to save stems into.
+    Must be called from the UI thread. Returns (file_paths, save_folder); the list is
+    empty if the user cancels either dialog.
     """
-    file_path = filedialog.askopenfilename(
-        title="Select a Video File",
-        filetypes=[("Video Files", "*.mp4 *.mkv *.avi *.mov")],
+    file_paths = filedialog.askopenfilenames(
+        title="Select Video or Audio Files",
+        filetypes=MEDIA_FILE_TYPES,
     )
-    if not file_path:
-        progress_label.set("No file selected.")
+    if not file_paths:
         append_to_log("No file selected for Local Video Upload.")
-        return
+        return [], None
+
+    save_folder = filedialog.askdirectory(title="Choose folder to save extracted files")
+    if not save_folder:
+        append_to_log("Save operation canceled by user.")
+        return [], None
+
+    return list(file_paths), save_folder
+
 
+def process_local_video(file_path, save_folder, progress_label, output_mode=OUTPUT_STEMS, background_level=None,
+                        preset=None, time_ranges=None, splice_ranges=False):
+    """
+    Process one local video file and save its stems into 'save_folder'.
+    'preset' names a separation preset (fast/balanced/best, see separation_presets);
+    None uses the configured default.
+    With output_mode 'remux' (or 'both'), also write clean_<stem>.<ext>: the original
+    video stream copied with the cleaned vocals (optionally remixed with the
+    background at 'background_level') as its main audio track.
+    With 'asr' (or 'stems+asr'), write asr_<stem>.wav: the vocals as mono 16 kHz,
+    loudness-normalized WAV for speech recognition (see asr_output), produced in
+    the same pass; 'asr' alone skips the full-resolution stems.
+    'time_ranges' (e.g. '1:30-2:45, 10:00-12:00', see time_ranges) limits the job
+    to those parts of the video: the stems are written per clip, as
+    clean_<stem>_<range>.wav, or with 'splice_ranges' as full-length files that are
+    silent outside the ranges. Remuxing always uses the full-length version, and
+    ASR output is written per clip.
+    Audio files (see utils.AUDIO_EXTENSIONS) are accepted too; having no video,
+    they get the stems instead of a remuxed file.
+    Runs on a job worker thread; 'progress_label' only needs a set() method.
+    If it also carries a 'cancel_event' and a progress() method (JobStatusReporter),
+    they are passed down so the job can be cancelled and report progress.
+    Re-raises on failure or cancellation (after logging) so the job is marked accordingly.
+    """
+    cancel_event = getattr(progress_label, "cancel_event", None)
+    progress_callback = getattr(progress_label, "progress", None)
     progress_label.set("Processing video... Please wait.")
     start_time = datetime.now()
-    original_stem = Path(file_path).stem
+    original_stem = output_stem(file_path)
     function_type = "Local Video Upload"  # Define function type
+    report = {}  # Filled by process_video (dedup hit rate, ...)
+    if is_audio_file(file_path) and output_mode in (OUTPUT_REMUX, OUTPUT_BOTH):
+        append_to_log(f"{file_path} is an audio file with no video to remux into; saving the stems instead.")
+        output_mode = OUTPUT_STEMS
 
     try:
         # Calculate video length
         video_length_seconds = get_video_length(file_path)
         video_length_str = format_duration(video_length_seconds) if video_length_seconds else "Unknown"
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Process video to extract vocals and noise
-            vocals_path, noise_path, _ = process_video(file_path, Path(temp_dir))
+        ranges = parse_time_ranges(time_ranges, video_length_seconds) if time_ranges else None
+        separated_seconds = sum(end - start for start, end in ranges) if ranges else video_length_seconds
+
+        # Pre-flight estimate from this machine's past jobs; the ledger records this one too
+        separation_options = preset_options(preset)
+        with track_job(
+            function_type,
+            original_stem,
+            input_seconds=separated_seconds,
+            file_size=os.path.getsize(file_path),
+            parameters=job_parameters(separation_options, preset=preset, output_mode=output_mode,
+                                      clips=len(ranges) if ranges else None),
+        ) as ledger_entry:
+            append_to_log(f"{function_type} '{original_stem}': {ledger_entry.estimate.describe()}")
+            progress_label.set(ledger_entry.estimate.describe())
+
+            def report_progress(percent):
+                if progress_callback:
+                    progress_callback(percent)
+                progress_label.set(ledger_entry.progress_message("Separating...", percent))
+
+            # Reserve scratch space for the job based on its duration
+            with get_workspace_manager().job_workspace(original_stem, video_length_seconds) as workspace:
+                # Process video to extract vocals and noise
+                wants_asr = output_mode in (OUTPUT_ASR, OUTPUT_STEMS_ASR)
+                if ranges:
+                    names = [f"{original_stem}_{range_label(start, end)}" for start, end in ranges]
+                    asr_dests = [Path(save_folder) / f"asr_{name}.wav" for name in names]
+                    clips = process_video_ranges(
+                        file_path,
+                        workspace.path,
+                        ranges,
+                        cancel_event=cancel_event,
+                        progress_callback=report_progress,
+                        separation_options=separation_options,
+                        report=report,
+                        asr_paths=asr_dests if wants_asr else None,
+                        write_stems=output_mode != OUTPUT_ASR,
+                    )
+                    outputs = [(name, vocals, noise) for name, (vocals, noise) in zip(names, clips)]
+                    vocals_path = noise_path = None
+                    if output_mode != OUTPUT_ASR and (splice_ranges or output_mode in (OUTPUT_REMUX, OUTPUT_BOTH)):
+                        progress_label.set("Splicing clips into the full-length timeline...")
+                        starts = [start for start, _ in ranges]
+                        vocals_path = splice_wavs([(start, vocals) for start, (vocals, _) in zip(starts, clips)],
+                                                  Path(workspace.path) / "vocals_timeline.wav", video_length_seconds)
+                        noise_path = splice_wavs([(start, noise) for start, (_, noise) in zip(starts, clips)],
+                                                 Path(workspace.path) / "no_vocals_timeline.wav", video_length_seconds)
+                        if splice_ranges:
+                            outputs = [(original_stem, vocals_path, noise_path)]
+                else:
+                    asr_dests = [Path(save_folder) / f"asr_{original_stem}.wav"]
+                    vocals_path, noise_path, _ = process_video(
+                        file_path,
+                        workspace.path,
+                        cancel_event=cancel_event,
+                        progress_callback=report_progress,
+                        separation_options=separation_options,
+                        report=report,
+                        asr_path=asr_dests[0] if wants_asr else None,
+                        write_stems=output_mode != OUTPUT_ASR,
+                    )
+                    outputs = [(original_stem, vocals_path, noise_path)]
+                if wants_asr:
+                    for asr_dest in asr_dests:
+                        append_to_log(f"ASR-ready vocals saved as: {asr_dest}")
+                workspace.sample_usage()
 
-            # Prompt user to save the extracted files
-            save_folder = filedialog.askdirectory(title="Choose folder to save extracted files")
-            if not save_folder:
-                progress_label.set("Save operation canceled by user.")
-                append_to_log("Save operation canceled by user.")
-                return
+                # Put the cleaned audio back into the video without re-encoding the video
+                if output_mode in (OUTPUT_REMUX, OUTPUT_BOTH):
+                    progress_label.set("Remuxing cleaned audio into video...")
+                    remux_dest = Path(save_folder) / f"clean_{original_stem}{Path(file_path).suffix}"
+                    remux_clean_audio(
+                        file_path,
+                        vocals_path,
+                        remux_dest,
+                        noise_path=noise_path,
+                        background_level=background_level,
+                        cancel_event=cancel_event,
+                    )
+                    append_to_log(f"Remuxed video saved as: {remux_dest}")
 
-            # Save processed files
-            vocals_dest = Path(save_folder) / f"clean_{original_stem}.wav"
-            noise_dest = Path(save_folder) / f"bg_{original_stem}.wav"
+                # Save processed files
+                if output_mode in (OUTPUT_STEMS, OUTPUT_BOTH, OUTPUT_STEMS_ASR):
+                    for name, output_vocals, output_noise in outputs:
+                        vocals_dest = Path(save_folder) / f"clean_{name}.wav"
+                        noise_dest = Path(save_folder) / f"bg_{name}.wav"
 
-            shutil.move(str(vocals_path), str(vocals_dest))
-            append_to_log(f"Vocals file saved as: {vocals_dest}")
+                        shutil.move(str(output_vocals), str(vocals_dest))
+                        append_to_log(f"Vocals file saved as: {vocals_dest}")
 
-            shutil.move(str(noise_path), str(noise_dest))
-            append_to_log(f"Background noise file saved as: {noise_dest}")
+                        shutil.move(str(output_noise), str(noise_dest))
+                        append_to_log(f"Background noise file saved as: {noise_dest}")
+            ledger_entry.update(peak_disk_bytes=workspace.peak_bytes,
+                                peak_memory_bytes=report.get("peak_memory_bytes"))
 
         end_time = datetime.now()
         file_size = os.path.getsize(file_path)
@@ -80,19 +220,27 @@ def process_local_video(app, progress_label, progress_bar):
             "type": "local",
             "function_type": function_type,
             "status": "success",
+            "dedup_hit_rate": report.get("dedup_hit_rate"),
         }
         append_to_log(f"Log data prepared: {log_data}")  # Debugging log
         send_log_to_server(log_data)
 
         # Update UI
         elapsed = log_data['processing_time']
-        progress_label.set(f"Video processed successfully in {elapsed:.2f} seconds.")
+        reused = f" ({report['dedup_hit_rate']:.0%} reused from earlier jobs)" if report.get("dedup_hit_rate") else ""
+        progress_label.set(f"Video processed successfully in {elapsed:.2f} seconds{reused}.")
         append_to_log(f"{function_type}: Successfully processed video.")
 
+    except JobCancelled:
+        # The workspace (and its scratch files) was already released on the way out
+        progress_label.set("Processing cancelled.")
+        append_to_log(f"{function_type}: Processing of {file_path} cancelled by user.")
+        raise
     except Exception as e:
-        _handle_local_processing_error(app, e, file_path, start_time, progress_label, function_type)
+        _handle_local_processing_error(e, file_path, start_time, progress_label, function_type)
+        raise
 
-def _handle_local_processing_error(app, error_obj, file_path, start_time, progress_label, function_type):
+def _handle_local_processing_error(error_obj, file_path, start_time, progress_label, function_type):
     """
     Handle errors during local video processing and log details.
     """
@@ -0,0 +1,114 @@
+import os
+import json
+import platform
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from logger_utils import LOG_FILE, append_to_log
+from processing_config import get_processing_setting
+
+# Written by autotune.py, read on every separation
+MACHINE_PROFILE_FILE = Path(LOG_FILE).parent / "rian_machine_profile.json"
+SEPARATION_OPTION_KEYS = ("model", "chunk_seconds", "overlap_seconds", "shifts", "overlap", "parallel_bag")
+# Written by earlier versions from an in-process thread benchmark that did not
+# measure how jobs actually run; no longer read, and dropped on the next save
+STALE_PROFILE_KEYS = ("max_concurrent_jobs", "threads_per_job")
+
+_profile = None
+_profile_loaded = False
+_profile_lock = threading.Lock()
+_threads_applied = False
+
+
+def machine_fingerprint():
+    """What a profile was measured on; a profile from different hardware is ignored."""
+    return {
+        "cpu_count": os.cpu_count(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.system(),
+    }
+
+
+def save_machine_profile(profile, path=MACHINE_PROFILE_FILE):
+    """Store an autotune result (see autotune.py) as this machine's profile."""
+    global _profile, _profile_loaded
+    profile = {key: value for key, value in profile.items() if key not in STALE_PROFILE_KEYS}
+    profile.update(fingerprint=machine_fingerprint(), created_at=datetime.now().isoformat())
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w") as profile_file:
+        json.dump(profile, profile_file, indent=2)
+    os.replace(temp_path, path)
+    with _profile_lock:
+        _profile, _profile_loaded = profile, True
+    append_to_log(f"Machine profile saved to {path}")
+    return profile
+
+
+def update_machine_profile(**fields):
+    """Merge 'fields' into this machine's profile (creating it if needed) and save it."""
+    profile = dict(load_machine_profile() or {})
+    profile.update(fields)
+    return save_machine_profile(profile)
+
+
+def load_machine_profile(path=MACHINE_PROFILE_FILE):
+    """
+    Return the stored machine profile, or None if there is none or it was
+    measured on different hardware. Read once and cached.
+    """
+    global _profile, _profile_loaded
+    with _profile_lock:
+        if _profile_loaded:
+            return _profile
+        _profile_loaded = True
+        try:
+            with open(path, "r") as profile_file:
+                profile = json.load(profile_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            append_to_log(f"Ignoring unreadable machine profile {path}: {e}")
+            return None
+        if profile.get("fingerprint") != machine_fingerprint():
+            append_to_log(f"Ignoring machine profile {path}: it was measured on different hardware. "
+                          f"Run 'python autotune.py' again.")
+            return None
+        _profile = profile
+        return _profile
+
+
+def machine_separation_options():
+    """
+    Separation options tuned for this machine ({} without a profile). Options
+    also set in the processing config are left out, so the config wins.
+    """
+    profile = load_machine_profile()
+    if not profile:
+        return {}
+    separation = profile.get("separation", {})
+    return {
+        key: separation[key] for key in SEPARATION_OPTION_KEYS
+        if key in separation and get_processing_setting(key) is None
+    }
+
+
+def machine_setting(name, default=None):
+    """A top-level profile value such as 'presets'."""
+    profile = load_machine_profile()
+    return profile.get(name, default) if profile else default
+
+
+def apply_thread_settings(torch):
+    """Set torch's intra-op thread count from the config's 'threads_per_job' (once per process)."""
+    global _threads_applied
+    if _threads_applied:
+        return
+    _threads_applied = True
+    threads = get_processing_setting("threads_per_job")
+    if threads:
+        torch.set_num_threads(int(threads))
+        append_to_log(f"Using {threads} torch threads per job.")
@@ -1,5 +1,6 @@
 import os
 import sys
+import multiprocessing
 
 # Example: main.py
 from rian_gui import RianVideoProcessingTool
@@ -18,6 +19,7 @@ def set_environment_for_pyinstaller():
             os.environ["ENV"] = "development"
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Bag worker processes (bag_parallel) are spawned from the bundle
     set_environment_for_pyinstaller()
     app = RianVideoProcessingTool()
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from pathlib import Path
+
+from cancellation import raise_if_cancelled
+from logger_utils import LOG_FILE, append_to_log
+from metrics_utils import register_gauge
+from processing_config import get_processing_setting
+from bag_parallel import parallel_bag_enabled
+from separation_engine import DEFAULT_CHUNK_SECONDS, bag_size, resident_model_bytes
+
+MB = 1024 * 1024
+BYTES_PER_SAMPLE = 4  # float32
+DEFAULT_SAMPLERATE = 44100
+DEFAULT_CHANNELS = 2
+DEFAULT_SOURCES = 4
+
+# Full-length float32 buffers held during one separation, per channel-sample:
+# decoded PCM + tensor copy, normalised mix, the per-source output accumulator
+# and the two collapsed stems (plus one mono crossfade weight track, added separately)
+FULL_LENGTH_BUFFERS = 4 + DEFAULT_SOURCES
+
+# Working memory of one apply_model() call, on top of the model weights. Grows
+# with the chunk length because each chunk's padded input/output live at once.
+MODEL_ACTIVATION_BYTES = {
+    "mdx_extra_q": 700 * MB,
+    "mdx_extra": 700 * MB,
+    "htdemucs": 1000 * MB,
+    "htdemucs_ft": 1000 * MB,
+}
+DEFAULT_ACTIVATION_BYTES = 900 * MB
+ACTIVATION_BYTES_PER_CHUNK_SECOND = 16 * MB
+
+# Lower-memory mode used for jobs that would not fit otherwise
+LOW_MEMORY_CHUNK_SECONDS = (15.0, 8.0, 4.0)
+UNKNOWN_DURATION_SECONDS = 600.0
+DEFAULT_CEILING_FRACTION = 0.75  # Of physical RAM, when no ceiling is configured
+FALLBACK_CEILING_BYTES = 4096 * MB
+
+CALIBRATION_FILE = Path(LOG_FILE).parent / "rian_memory_calibration.json"
+CALIBRATION_WEIGHT = 0.3  # Exponential moving average weight of a new measurement
+CALIBRATION_LIMITS = (0.5, 4.0)
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """A job would not fit under the memory ceiling even alone and in low-memory mode."""
+
+
+def _total_physical_memory():
+    try:
+        import psutil
+        return psutil.virtual_memory().total
+    except ImportError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _current_rss():
+    """Resident set size of this process in bytes, or None if it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakRssSampler:
+    """Samples the process RSS from a background thread and keeps the maximum."""
+    def __init__(self, interval_seconds=0.2):
+        self.interval_seconds = interval_seconds
+        self.baseline = None
+        self.peak = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.baseline = self.peak = _current_rss()
+        if self.baseline is not None:
+            self._thread = threading.Thread(target=self._sample_loop, daemon=True, name="rss-sampler")
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+        return False
+
+    def _sample(self):
+        rss = _current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            self._sample()
+
+    @property
+    def growth_bytes(self):
+        """Peak RSS above the RSS at the start of sampling."""
+        if self.baseline is None or self.peak is None:
+            return None
+        return max(0, self.peak - self.baseline)
+
+
+class MemoryModel:
+    """
+    Predicts the peak memory a separation job adds to the process, from its
+    duration, channel count, model and chunk length. The analytic estimate is
+    multiplied by a per-model correction factor learned from measured runs and
+    stored in CALIBRATION_FILE.
+    """
+    def __init__(self, calibration_path=CALIBRATION_FILE):
+        self.calibration_path = Path(calibration_path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.calibration_path, "r") as calibration_file:
+                self._factors = json.load(calibration_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._factors = {}
+
+    def estimate_bytes(self, duration_seconds, model_name, chunk_seconds,
+                       channels=DEFAULT_CHANNELS, samplerate=DEFAULT_SAMPLERATE, parallel_members=1):
+        """
+        Uncalibrated estimate of the job's peak memory growth, in bytes.
+        'parallel_members' bag members running at once (see bag_parallel) each need their own activations.
+        """
+        duration_seconds = duration_seconds or UNKNOWN_DURATION_SECONDS
+        samples = duration_seconds * samplerate
+        full_length = samples * BYTES_PER_SAMPLE * (channels * FULL_LENGTH_BUFFERS + 1)
+        activation = MODEL_ACTIVATION_BYTES.get(model_name, DEFAULT_ACTIVATION_BYTES)
+        activation += ACTIVATION_BYTES_PER_CHUNK_SECOND * min(chunk_seconds, duration_seconds)
+        return int(full_length + activation * parallel_members)
+
+    def calibration_factor(self, model_name):
+        with self._lock:
+            return self._factors.get(model_name, 1.0)
+
+    def predict_peak_bytes(self, duration_seconds, model_name, chunk_seconds,
+                           channels=DEFAULT_CHANNELS, samplerate=DEFAULT_SAMPLERATE, parallel_members=1):
+        """Calibrated prediction of the job's peak memory growth, in bytes."""
+        estimate = self.estimate_bytes(duration_seconds, model_name, chunk_seconds, channels, samplerate,
+                                       parallel_members)
+        return int(estimate * self.calibration_factor(model_name))
+
+    def calibrate(self, model_name, estimated_bytes, measured_bytes):
+        """Fold one measured run into the model's correction factor and persist it."""
+        if not estimated_bytes or not measured_bytes:
+            return
+        low, high = CALIBRATION_LIMITS
+        observed = min(high, max(low, measured_bytes / estimated_bytes))
+        with self._lock:
+            previous = self._factors.get(model_name)
+            factor = observed if previous is None else (
+                (1 - CALIBRATION_WEIGHT) * previous + CALIBRATION_WEIGHT * observed)
+            self._factors[model_name] = round(factor, 4)
+            try:
+                self.calibration_path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = self.calibration_path.with_suffix(".tmp")
+                with open(temp_path, "w") as calibration_file:
+                    json.dump(self._factors, calibration_file, indent=2)
+                os.replace(temp_path, self.calibration_path)
+            except OSError as e:
+                append_to_log(f"Could not save memory calibration: {e}")
+        append_to_log(
+            f"Memory model '{model_name}': measured {measured_bytes / MB:.0f} MB vs "
+            f"estimated {estimated_bytes / MB:.0f} MB; correction factor now {factor:.2f}."
+        )
+
+
+class AdmissionTicket:
+    """What a job was admitted with: the (possibly downgraded) options and the prediction."""
+    def __init__(self, label, options, predicted_bytes, estimated_bytes, low_memory, measurable=True):
+        self.label = label
+        self.options = options
+        self.predicted_bytes = predicted_bytes
+        self.estimated_bytes = estimated_bytes
+        self.low_memory = low_memory
+        self.measurable = measurable  # Whether this process's RSS covers all of the job's memory
+        self.solo = True  # Cleared if another job ran at the same time (RSS then is not ours alone)
+        self.peak_bytes = None  # Measured peak memory growth, once the job has run
+
+
+class MemoryAdmissionController:
+    """
+    Starts separation jobs only while the predicted memory of all admitted jobs,
+    plus the resident model weights, fits under 'ceiling_bytes'. A job that would
+    not fit even on its own is switched to shorter chunks. Shorter chunks only
+    shrink the model's working memory, not the full-length buffers of a long
+    input, so a job that still does not fit is refused (MemoryBudgetExceeded).
+    """
+    def __init__(self, ceiling_bytes, memory_model=None):
+        self.ceiling_bytes = ceiling_bytes
+        self.memory_model = memory_model or MemoryModel()
+        self._condition = threading.Condition()
+        self._admitted = {}  # id(ticket) -> ticket
+
+    def admitted_bytes(self):
+        with self._condition:
+            return sum(ticket.predicted_bytes for ticket in self._admitted.values())
+
+    def _available_bytes(self):
+        return self.ceiling_bytes - resident_model_bytes()
+
+    def _plan(self, label, duration_seconds, model_name, options, channels, samplerate):
+        """
+        Choose the options to run with, downgrading chunk length if the job is too
+        big. Raises MemoryBudgetExceeded if it does not fit even then.
+        """
+        options = dict(options)
+        chunk_seconds = float(options.get("chunk_seconds")
+                              or get_processing_setting("chunk_seconds", DEFAULT_CHUNK_SECONDS))
+        low_memory = False
+        available = self._available_bytes()
+        members = bag_size(model_name) if parallel_bag_enabled(options) else 1
+        predicted = self.memory_model.predict_peak_bytes(duration_seconds, model_name, chunk_seconds,
+                                                         channels, samplerate, members)
+        for low_chunk_seconds in LOW_MEMORY_CHUNK_SECONDS:
+            if predicted <= available or low_chunk_seconds >= chunk_seconds:
+                continue
+            chunk_seconds = low_chunk_seconds
+            options["chunk_seconds"] = chunk_seconds
+            low_memory = True
+            predicted = self.memory_model.predict_peak_bytes(duration_seconds, model_name, chunk_seconds,
+                                                             channels, samplerate, members)
+        if predicted > available:
+            message = (
+                f"'{label}' needs about {predicted / MB:.0f} MB even with {chunk_seconds:.0f}s chunks, more than "
+                f"the {max(0, available) / MB:.0f} MB available under the memory ceiling. Raise "
+                f"'memory_ceiling_mb' or separate shorter time ranges of the input."
+            )
+            append_to_log(f"Memory admission: refused {message}")
+            raise MemoryBudgetExceeded(f"Not enough memory: {message}")
+        if low_memory:
+            append_to_log(
+                f"Memory admission: '{label}' switched to low-memory mode "
+                f"({chunk_seconds:.0f}s chunks, predicted {predicted / MB:.0f} MB)."
+            )
+        estimated = self.memory_model.estimate_bytes(duration_seconds, model_name, chunk_seconds,
+                                                     channels, samplerate, members)
+        # Memory of bag worker processes is not in our RSS, so such runs cannot calibrate the model
+        return AdmissionTicket(label, options, predicted, estimated, low_memory, measurable=members == 1)
+
+    @contextlib.contextmanager
+    def admit(self, label, duration_seconds, model_name, options=None, channels=DEFAULT_CHANNELS,
+              samplerate=DEFAULT_SAMPLERATE, cancel_event=None):
+        """
+        Block until the job fits under the memory ceiling, then yield an
+        AdmissionTicket whose 'options' the job must run with. Raises
+        MemoryBudgetExceeded for a job too big to ever fit. Peak RSS is
+        sampled while the job runs; runs that had the process to themselves
+        are used to calibrate the memory model.
+        """
+        ticket = self._plan(label, duration_seconds, model_name, options or {}, channels, samplerate)
+        waited_since = None
+        with self._condition:
+            while True:
+                in_use = sum(admitted.predicted_bytes for admitted in self._admitted.values())
+                # Model weights loaded since planning may leave too little; then it runs alone
+                if not self._admitted or in_use + ticket.predicted_bytes <= self._available_bytes():
+                    break
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    append_to_log(
+                        f"Memory admission: '{label}' waiting (needs {ticket.predicted_bytes / MB:.0f} MB, "
+                        f"{in_use / MB:.0f} MB of {self.ceiling_bytes / MB:.0f} MB admitted)."
+                    )
+                self._condition.wait(timeout=0.5)
+                raise_if_cancelled(cancel_event, "memory admission")
+            for other in self._admitted.values():
+                other.solo = False
+            ticket.solo = not self._admitted
+            self._admitted[id(ticket)] = ticket
+        if waited_since is not None:
+            append_to_log(f"Memory admission: '{label}' started after {time.monotonic() - waited_since:.0f}s.")
+
+        try:
+            with PeakRssSampler() as sampler:
+                yield ticket
+            ticket.peak_bytes = sampler.growth_bytes
+            if ticket.solo and ticket.measurable and sampler.growth_bytes:
+                self.memory_model.calibrate(model_name, ticket.estimated_bytes, sampler.growth_bytes)
+        finally:
+            with self._condition:
+                self._admitted.pop(id(ticket), None)
+                self._condition.notify_all()
+
+
+def get_memory_ceiling_bytes():
+    """'memory_ceiling_mb' if configured, otherwise a share of physical RAM."""
+    ceiling_mb = get_processing_setting("memory_ceiling_mb")
+    if ceiling_mb:
+        return int(float(ceiling_mb) * MB)
+    total = _total_physical_memory()
+    return int(total * DEFAULT_CEILING_FRACTION) if total else FALLBACK_CEILING_BYTES
+
+
+_admission_controller = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Process-wide admission controller shared by all separation jobs."""
+    global _admission_controller
+    with _admission_controller_lock:
+        if _admission_controller is None:
+            _admission_controller = MemoryAdmissionController(get_memory_ceiling_bytes())
+            register_gauge("rian_memory_admitted_bytes", "Predicted memory of admitted separation jobs.",
+                           _admission_controller.admitted_bytes)
+            register_gauge("rian_memory_ceiling_bytes", "Memory ceiling for separation jobs.",
+                           lambda: _admission_controller.ceiling_bytes)
+        return _admission_controller
@@ -0,0 +1,285 @@
+import os
+import time
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logger_utils import append_to_log
+from processing_config import get_processing_setting
+
+DEFAULT_LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+DEFAULT_RTF_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10)
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class: a named metric with optional labels, stored per label-value tuple."""
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down. With 'callback', the value is read at scrape time."""
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_samples(self):
+        if self.callback is not None:
+            try:
+                self.set(self.callback())
+            except Exception as e:
+                append_to_log(f"Metrics: could not read gauge {self.name}: {e}")
+        return super()._render_samples()
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state["counts"]))) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            for bound, count in zip(self.buckets, state["counts"]):
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds all metrics of the process and renders them in Prometheus text format."""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+JOBS_TOTAL = REGISTRY.register(Counter(
+    "rian_jobs_total", "Jobs that reached a final state.", ["kind", "status"]))
+JOB_FAILURES_TOTAL = REGISTRY.register(Counter(
+    "rian_job_failures_total", "Jobs that failed.", ["kind"]))
+JOB_DURATION_SECONDS = REGISTRY.register(Histogram(
+    "rian_job_duration_seconds", "Wall-clock time from job start to completion.", ["kind"]))
+STAGE_DURATION_SECONDS = REGISTRY.register(Histogram(
+    "rian_stage_duration_seconds", "Wall-clock time per pipeline stage.", ["stage"]))
+STAGE_REALTIME_FACTOR = REGISTRY.register(Histogram(
+    "rian_stage_realtime_factor", "Processing seconds per second of audio, per stage.", ["stage"],
+    buckets=DEFAULT_RTF_BUCKETS))
+
+
+def register_gauge(name, documentation, callback):
+    """Register a gauge whose value is read from 'callback' whenever metrics are exported."""
+    return REGISTRY.register(Gauge(name, documentation, callback=callback))
+
+
+def record_job_outcome(kind, status, duration_seconds=None):
+    """Count a finished job and, if known, observe its duration."""
+    JOBS_TOTAL.inc(kind=kind, status=status)
+    if status == "failed":
+        JOB_FAILURES_TOTAL.inc(kind=kind)
+    if duration_seconds is not None:
+        JOB_DURATION_SECONDS.observe(duration_seconds, kind=kind)
+
+
+_stage_recorder = threading.local()
+
+
+@contextlib.contextmanager
+def record_stage_timings():
+    """
+    Collect the stages timed on this thread while the block runs, as a dict of
+    stage -> seconds (summed when a stage runs more than once).
+    """
+    timings = {}
+    previous = getattr(_stage_recorder, "timings", None)
+    _stage_recorder.timings = timings
+    try:
+        yield timings
+    finally:
+        _stage_recorder.timings = previous
+
+
+def add_stage_timings(stage_seconds):
+    """Add stage timings measured elsewhere (e.g. by the separation service) to this thread's recorder."""
+    timings = getattr(_stage_recorder, "timings", None)
+    if timings is None or not stage_seconds:
+        return
+    for stage, seconds in stage_seconds.items():
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def time_stage(stage, audio_seconds=None):
+    """
+    Time a pipeline stage. If 'audio_seconds' is given (or set later on the
+    yielded dict), the stage's real-time factor is recorded as well.
+    Only successful stages are recorded.
+    """
+    info = {"audio_seconds": audio_seconds}
+    started = time.perf_counter()
+    yield info
+    record_stage(stage, time.perf_counter() - started, info["audio_seconds"])
+
+
+def record_stage(stage, seconds, audio_seconds=None):
+    """Record a stage timed elsewhere (e.g. summed over interleaved blocks) as time_stage would."""
+    STAGE_DURATION_SECONDS.observe(seconds, stage=stage)
+    if audio_seconds:
+        STAGE_REALTIME_FACTOR.observe(seconds / audio_seconds, stage=stage)
+    add_stage_timings({stage: seconds})
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of stdout/stderr
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics in Prometheus text format on localhost from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    append_to_log(f"Metrics endpoint listening on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+def start_metrics_file_writer(path, interval_seconds=15.0):
+    """Periodically write the metrics text to 'path' (atomically) from a daemon thread."""
+    def write_loop():
+        while True:
+            try:
+                temp_path = f"{path}.tmp"
+                with open(temp_path, "w") as metrics_file:
+                    metrics_file.write(REGISTRY.render())
+                os.replace(temp_path, path)
+            except Exception as e:
+                append_to_log(f"Error writing metrics file {path}: {e}")
+            time.sleep(interval_seconds)
+
+    threading.Thread(target=write_loop, daemon=True, name="metrics-file").start()
+    append_to_log(f"Writing metrics to {path} every {interval_seconds:.0f}s")
+
+
+_exporters_started = False
+
+
+def start_metrics_exporters():
+    """
+    Start whichever exporters are configured: 'metrics_port' (0 = off) for the
+    localhost HTTP endpoint and 'metrics_file' for the periodically written file.
+    Safe to call more than once.
+    """
+    global _exporters_started
+    if _exporters_started:
+        return
+    _exporters_started = True
+
+    port = int(get_processing_setting("metrics_port", 0))
+    if port:
+        try:
+            start_metrics_server(port)
+        except OSError as e:
+            append_to_log(f"Could not start metrics endpoint on port {port}: {e}")
+
+    metrics_file = get_processing_setting("metrics_file")
+    if metrics_file:
+        start_metrics_file_writer(metrics_file, float(get_processing_setting("metrics_interval_seconds", 15.0)))
@@ -0,0 +1,118 @@
+import uuid
+import shutil
+import time
+from pathlib import Path
+
+from directory_manager import get_output_directory, get_workspace_manager
+from logger_utils import append_to_log
+from processing_config import get_processing_setting
+from separation_presets import get_default_preset, preset_options
+from time_ranges import format_timestamp, parse_time_ranges, splice_wavs
+from utils import get_video_length
+from video_processor import process_video_ranges
+
+# Quick check of a preset on a few short excerpts before committing to a full
+# job. The excerpts are separated like any time-range job and concatenated (with
+# a short gap) into one vocals and one background file to listen to. The model
+# stays loaded (in this process or the separation service), so the full job
+# that follows starts warm.
+PREVIEW_DIRNAME = "previews"
+DEFAULT_PREVIEW_EXCERPTS = 3
+DEFAULT_PREVIEW_EXCERPT_SECONDS = 8.0
+PREVIEW_GAP_SECONDS = 0.5
+PREVIEWS_KEPT = 20  # Older preview folders are removed when a new preview starts
+JOB_KIND = "Preview"
+
+
+def get_preview_settings():
+    """Number and length of the excerpts sampled across a file ('preview_*' settings)."""
+    return {
+        "excerpts": int(get_processing_setting("preview_excerpts", DEFAULT_PREVIEW_EXCERPTS)),
+        "excerpt_seconds": float(get_processing_setting("preview_excerpt_seconds", DEFAULT_PREVIEW_EXCERPT_SECONDS)),
+    }
+
+
+def sample_excerpts(duration, excerpts=DEFAULT_PREVIEW_EXCERPTS, excerpt_seconds=DEFAULT_PREVIEW_EXCERPT_SECONDS):
+    """
+    (start, end) ranges of 'excerpts' excerpts spread evenly across the file,
+    centred at 1/(n+1), 2/(n+1), ... of its length (so the intro and outro,
+    often silent or music-only, are skipped). Short files are previewed whole.
+    """
+    if not duration or duration <= excerpts * excerpt_seconds:
+        return [(0.0, duration or excerpts * excerpt_seconds)]
+    ranges = []
+    for index in range(excerpts):
+        centre = duration * (index + 1) / (excerpts + 1)
+        start = min(max(0.0, centre - excerpt_seconds / 2), duration - excerpt_seconds)
+        ranges.append((start, start + excerpt_seconds))
+    return ranges
+
+
+def new_preview_id():
+    """Unique id of one preview, so previews of same-named files or running at once never share files."""
+    return uuid.uuid4().hex[:8]
+
+
+def preview_paths(file_path, preset, preview_id):
+    """(folder, vocals_path, background_path) of preview 'preview_id' of 'file_path' with 'preset'."""
+    preset = preset or get_default_preset() or "default"
+    folder = get_output_directory() / PREVIEW_DIRNAME / f"{Path(file_path).stem}_{preset}_{preview_id}"
+    return folder, folder / "preview_vocals.wav", folder / "preview_background.wav"
+
+
+def _prune_previews(keep=PREVIEWS_KEPT):
+    """Remove all but the 'keep' most recent preview folders."""
+    root = get_output_directory() / PREVIEW_DIRNAME
+    if not root.is_dir():
+        return
+    folders = sorted((path for path in root.iterdir() if path.is_dir()),
+                     key=lambda path: path.stat().st_mtime, reverse=True)
+    for folder in folders[keep:]:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def preview_local_video(file_path, progress_label, preset=None, time_ranges=None, preview_id=None):
+    """
+    Separate a few excerpts of 'file_path' with 'preset' and write them, back to
+    back, to the files named by preview_paths for 'preview_id' (a new id if not
+    given). The excerpts are 'time_ranges' if given (user-picked), otherwise
+    sampled across the file (see sample_excerpts). Runs as a job; returns
+    (vocals_path, background_path).
+    """
+    cancel_event = getattr(progress_label, "cancel_event", None)
+    progress_callback = getattr(progress_label, "progress", None)
+    started = time.perf_counter()
+    duration = get_video_length(file_path)
+    if time_ranges:
+        ranges = parse_time_ranges(time_ranges, duration)
+    else:
+        settings = get_preview_settings()
+        ranges = sample_excerpts(duration, settings["excerpts"], settings["excerpt_seconds"])
+    excerpt_seconds = sum(end - start for start, end in ranges)
+    progress_label.set(f"Previewing {len(ranges)} excerpt(s) "
+                       f"({', '.join(f'{format_timestamp(start)}-{format_timestamp(end)}' for start, end in ranges)})...")
+
+    folder, vocals_dest, background_dest = preview_paths(file_path, preset, preview_id or new_preview_id())
+    with get_workspace_manager().job_workspace(f"preview_{Path(file_path).stem}", excerpt_seconds) as workspace:
+        clips = process_video_ranges(
+            file_path,
+            workspace.path,
+            ranges,
+            cancel_event=cancel_event,
+            progress_callback=progress_callback,
+            separation_options=preset_options(preset),
+        )
+        # Back to back, with a short gap so the cuts between excerpts are audible
+        offsets, offset = [], 0.0
+        for start, end in ranges:
+            offsets.append(offset)
+            offset += end - start + PREVIEW_GAP_SECONDS
+        _prune_previews(PREVIEWS_KEPT - 1)
+        folder.mkdir(parents=True, exist_ok=True)
+        splice_wavs([(offset, vocals) for offset, (vocals, _) in zip(offsets, clips)], vocals_dest)
+        splice_wavs([(offset, noise) for offset, (_, noise) in zip(offsets, clips)], background_dest)
+
+    elapsed = time.perf_counter() - started
+    append_to_log(f"Preview of {file_path} ({excerpt_seconds:.0f}s of audio) ready in {elapsed:.1f}s: {folder}")
+    progress_label.set(f"Preview ready in {elapsed:.1f}s: {vocals_dest.name} / {background_dest.name}")
+    return vocals_dest, background_dest
@@ -0,0 +1,66 @@
+import os
+import json
+import threading
+
+from logger_utils import get_resource_path, append_to_log
+
+CONFIG_FILE = "config.json"
+PROCESSING_SECTION = "processing"
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def load_processing_settings():
+    """
+    Load the machine-local 'processing' section of config.json.
+    Unlike the per-environment sections, these settings describe the machine
+    the tool runs on (disk budget, RAM disk, etc.), so they are shared by all environments.
+    Returns an empty dict when the file or section is missing.
+    """
+    global _settings
+    with _settings_lock:
+        if _settings is not None:
+            return _settings
+
+        config_path = get_resource_path(CONFIG_FILE)
+        try:
+            with open(config_path, "r") as config_file:
+                _settings = json.load(config_file).get(PROCESSING_SECTION, {}) or {}
+        except FileNotFoundError:
+            append_to_log(f"Processing settings not found at {config_path}; using defaults.")
+            _settings = {}
+        except json.JSONDecodeError:
+            append_to_log(f"Error: Invalid JSON in configuration file at path: {config_path}")
+            _settings = {}
+        return _settings
+
+
+def get_processing_setting(name, default=None):
+    """
+    Look up a processing setting.
+    An environment variable named RIAN_<NAME> takes precedence over config.json,
+    which takes precedence over 'default'. Values coming from the environment are
+    cast to the type of 'default' when one is given.
+    """
+    env_value = os.getenv(f"RIAN_{name.upper()}")
+    if env_value is not None:
+        return _cast_like(env_value, default)
+
+    value = load_processing_settings().get(name)
+    return default if value is None else value
+
+
+def _cast_like(raw_value, default):
+    """Cast an environment string to the type of the default value."""
+    try:
+        if isinstance(default, bool):
+            return raw_value.strip().lower() in ("1", "true", "yes", "on")
+        if isinstance(default, int):
+            return int(raw_value)
+        if isinstance(default, float):
+            return float(raw_value)
+    except ValueError:
+        append_to_log(f"Ignoring invalid setting value '{raw_value}'; using default {default}.")
+        return default
+    return raw_value
@@ -0,0 +1,102 @@
+import re
+import cProfile
+import pstats
+import io
+import threading
+import contextlib
+from datetime import datetime
+from pathlib import Path
+
+from logger_utils import LOG_FILE, append_to_log
+from processing_config import get_processing_setting
+
+# Profiles are written next to the log file
+PROFILE_DIR = Path(LOG_FILE).parent / "rian_profiles"
+
+_enabled_override = None
+_current = threading.local()
+
+
+def set_profiling_enabled(enabled):
+    """Turn profiling on/off at runtime (GUI setting); overrides the RIAN_PROFILE setting."""
+    global _enabled_override
+    _enabled_override = bool(enabled)
+    append_to_log(f"Profiling {'enabled' if enabled else 'disabled'}.")
+
+
+def profiling_enabled():
+    """True if profiling was enabled in the GUI, or via the 'profile' setting / RIAN_PROFILE=1."""
+    if _enabled_override is not None:
+        return _enabled_override
+    return bool(get_processing_setting("profile", False))
+
+
+def _profile_base_path(label):
+    """Unique per-job file prefix inside PROFILE_DIR."""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    safe_label = re.sub(r"[^A-Za-z0-9._-]+", "_", str(label))[:60] or "job"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return PROFILE_DIR / f"{timestamp}_{safe_label}"
+
+
+@contextlib.contextmanager
+def profile_job(label):
+    """
+    Profile the enclosed block with cProfile when profiling is enabled.
+    Writes <PROFILE_DIR>/<timestamp>_<label>.prof (pstats format; opens in
+    snakeviz, tuna or pstats) plus a .txt summary of the top functions.
+    Nested stages (see profile_torch_stage) reuse the same file prefix.
+    Does nothing when profiling is disabled or another profile is already active
+    on this thread.
+    """
+    if not profiling_enabled() or getattr(_current, "base_path", None) is not None:
+        yield None
+        return
+
+    base_path = _profile_base_path(label)
+    _current.base_path = base_path
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield base_path
+    finally:
+        profiler.disable()
+        _current.base_path = None
+        try:
+            profiler.dump_stats(str(base_path.with_suffix(".prof")))
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+            base_path.with_suffix(".txt").write_text(summary.getvalue(), encoding="utf-8")
+            append_to_log(f"Profile for '{label}' written to {base_path.with_suffix('.prof')}")
+        except Exception as e:
+            append_to_log(f"Error writing profile for '{label}': {e}")
+
+
+@contextlib.contextmanager
+def profile_torch_stage(stage):
+    """
+    Record the torch profiler's operator breakdown for the enclosed block
+    (the separation stage) when profiling is enabled. Writes a Chrome trace
+    (<prefix>.<stage>.trace.json, opens in chrome://tracing or Perfetto) and an
+    operator table (<prefix>.<stage>.ops.txt) using the current job's prefix.
+    """
+    if not profiling_enabled():
+        yield
+        return
+    try:
+        from torch.profiler import profile, ProfilerActivity
+    except ImportError:
+        append_to_log("torch.profiler is not available; skipping operator profile.")
+        yield
+        return
+
+    base_path = getattr(_current, "base_path", None) or _profile_base_path(stage)
+    with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as torch_profiler:
+        yield
+    try:
+        torch_profiler.export_chrome_trace(str(base_path) + f".{stage}.trace.json")
+        table = torch_profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=50)
+        Path(str(base_path) + f".{stage}.ops.txt").write_text(table, encoding="utf-8")
+        append_to_log(f"Torch operator profile for '{stage}' written to {base_path}.{stage}.*")
+    except Exception as e:
+        append_to_log(f"Error writing torch profile for '{stage}': {e}")
@@ -0,0 +1,250 @@
+import sys
+import json
+import time
+import wave
+import argparse
+from pathlib import Path
+
+from directory_manager import get_output_directory, get_workspace_manager
+from logger_utils import append_to_log
+from separation_presets import SEPARATION_PRESETS
+from video_processor import process_video
+
+SAMPLE_RATE = 44100
+CORPUS_DIRNAME = "regression_corpus"
+BASELINE_FILENAME = "baseline.json"
+
+# Allowed regressions against the stored baseline
+QUALITY_TOLERANCE_DB = 0.5   # SI-SDR may drop by at most this much per stem
+SPEED_TOLERANCE = 0.25       # Real-time factor may grow by at most 25 %
+
+# Modes under test: name -> separation_options for process_video
+REGRESSION_MODES = {
+    "default": {},
+    "chunk_10s": {"chunk_seconds": 10.0},
+    "no_shifts": {"shifts": 0},
+}
+REGRESSION_MODES.update({f"preset_{name}": options for name, options in SEPARATION_PRESETS.items()})
+
+# Synthetic corpus items: name -> (duration seconds, vocal fundamental Hz, background kind)
+CORPUS_ITEMS = {
+    "speech_over_noise": (20.0, 140.0, "noise"),
+    "speech_over_music": (20.0, 210.0, "music"),
+    "speech_over_beat": (20.0, 110.0, "beat"),
+}
+
+
+def _write_wav(path, samples):
+    """Write a float [-1, 1] array of shape [samples, channels] as 16-bit PCM WAV."""
+    import numpy as np
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(pcm.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(pcm.tobytes())
+
+
+def _read_wav(path):
+    """Read a 16-bit PCM WAV into a float array of shape [samples, channels]."""
+    import numpy as np
+    with wave.open(str(path), "rb") as wav_file:
+        channels = wav_file.getnchannels()
+        frames = wav_file.readframes(wav_file.getnframes())
+    return np.frombuffer(frames, dtype="<i2").reshape(-1, channels).astype(np.float64) / 32767
+
+
+def synth_vocal(rng, duration, f0):
+    """Voice-like signal: vibrato harmonic series, formant-weighted, gated into syllables."""
+    import numpy as np
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = f0 * (1 + 0.03 * np.sin(2 * np.pi * 5.5 * t) + 0.08 * np.sin(2 * np.pi * 0.3 * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    formants = [(700, 130), (1220, 70), (2600, 160)]
+    voice = np.zeros_like(t)
+    for harmonic in range(1, 30):
+        frequency = harmonic * f0
+        gain = sum(np.exp(-((frequency - center) / width) ** 2 / 2) for center, width in formants) + 0.05
+        voice += gain / harmonic * np.sin(harmonic * phase)
+    syllable_rate = rng.uniform(3.0, 5.0)
+    envelope = np.clip(np.sin(2 * np.pi * syllable_rate * t + rng.uniform(0, np.pi)), 0, None) ** 0.5
+    pauses = (np.sin(2 * np.pi * 0.2 * t) > -0.6).astype(float)  # Breaks between phrases
+    voice *= envelope * pauses
+    voice /= np.max(np.abs(voice)) + 1e-9
+    return np.stack([voice, voice * 0.9], axis=1) * 0.5
+
+
+def synth_background(rng, duration, kind):
+    """Background stem: broadband noise, a chord progression, or a drum-like beat."""
+    import numpy as np
+    n = int(duration * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    if kind == "noise":
+        white = rng.standard_normal((n, 2))
+        background = np.cumsum(white, axis=0)  # Brown-ish noise
+        background -= np.convolve(background[:, 0], np.ones(2048) / 2048, mode="same")[:, None]
+    elif kind == "music":
+        background = np.zeros((n, 2))
+        chords = [(220.0, 277.2, 329.6), (196.0, 246.9, 293.7), (174.6, 220.0, 261.6)]
+        for index, chord in enumerate(chords * int(duration // 6 + 1)):
+            start, end = int(index * 2 * SAMPLE_RATE), min(n, int((index + 1) * 2 * SAMPLE_RATE))
+            if start >= n:
+                break
+            segment = t[start:end]
+            tone = sum(np.sin(2 * np.pi * f * segment) + 0.3 * np.sin(4 * np.pi * f * segment) for f in chord)
+            background[start:end, 0] += tone
+            background[start:end, 1] += tone * 0.8
+    else:
+        background = np.zeros((n, 2))
+        beat_length = int(0.5 * SAMPLE_RATE)
+        kick = np.sin(2 * np.pi * 60 * t[:4000]) * np.exp(-t[:4000] * 30)
+        hat = rng.standard_normal(1500) * np.exp(-t[:1500] * 200)
+        for start in range(0, n - 4000, beat_length):
+            background[start:start + 4000] += kick[:, None]
+            background[start + beat_length // 2:start + beat_length // 2 + 1500] += 0.4 * hat[:, None]
+    background /= np.max(np.abs(background)) + 1e-9
+    return background * 0.4
+
+
+def default_corpus_dir():
+    """Where the corpus and its baseline live unless a directory is given."""
+    return get_output_directory() / CORPUS_DIRNAME
+
+
+def build_corpus(corpus_dir=None, seed=1234):
+    """
+    (Re)generate the synthetic regression corpus: for every item a mixture.wav
+    plus the ground-truth vocals.wav and background.wav. Deterministic for a given seed.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    corpus_dir = Path(corpus_dir or default_corpus_dir())
+    for name, (duration, f0, kind) in CORPUS_ITEMS.items():
+        item_dir = corpus_dir / name
+        item_dir.mkdir(parents=True, exist_ok=True)
+        vocals = synth_vocal(rng, duration, f0)
+        background = synth_background(rng, duration, kind)
+        _write_wav(item_dir / "vocals.wav", vocals)
+        _write_wav(item_dir / "background.wav", background)
+        _write_wav(item_dir / "mixture.wav", vocals + background)
+    append_to_log(f"Regression corpus written to {corpus_dir}")
+    return corpus_dir
+
+
+def sdr(reference, estimate):
+    """Signal-to-distortion ratio in dB."""
+    import numpy as np
+    length = min(len(reference), len(estimate))
+    reference, estimate = reference[:length].ravel(), estimate[:length].ravel()
+    return 10 * np.log10((np.sum(reference ** 2) + 1e-12) / (np.sum((reference - estimate) ** 2) + 1e-12))
+
+
+def si_sdr(reference, estimate):
+    """Scale-invariant SDR in dB."""
+    import numpy as np
+    length = min(len(reference), len(estimate))
+    reference, estimate = reference[:length].ravel(), estimate[:length].ravel()
+    scale = np.dot(estimate, reference) / (np.dot(reference, reference) + 1e-12)
+    target = scale * reference
+    return 10 * np.log10((np.sum(target ** 2) + 1e-12) / (np.sum((estimate - target) ** 2) + 1e-12))
+
+
+def evaluate_mode(corpus_dir, mode_name, separation_options):
+    """
+    Run process_video on every corpus item in one mode; return averaged metrics.
+    Segment dedup is off, so every mode and repeat run really separates.
+    """
+    per_item = {}
+    for item_dir in sorted(path for path in Path(corpus_dir).iterdir() if (path / "mixture.wav").is_file()):
+        duration = CORPUS_ITEMS.get(item_dir.name, (None,))[0]
+        with get_workspace_manager().job_workspace(f"regression {mode_name} {item_dir.name}", duration) as workspace:
+            started = time.perf_counter()
+            vocals_path, noise_path, _ = process_video(
+                item_dir / "mixture.wav", workspace.path, separation_options={**separation_options, "dedup": False}
+            )
+            elapsed = time.perf_counter() - started
+            reference_vocals = _read_wav(item_dir / "vocals.wav")
+            reference_background = _read_wav(item_dir / "background.wav")
+            estimated_vocals = _read_wav(vocals_path)
+            estimated_background = _read_wav(noise_path)
+
+        per_item[item_dir.name] = {
+            "vocals_sdr": sdr(reference_vocals, estimated_vocals),
+            "vocals_si_sdr": si_sdr(reference_vocals, estimated_vocals),
+            "background_sdr": sdr(reference_background, estimated_background),
+            "background_si_sdr": si_sdr(reference_background, estimated_background),
+            "rtf": elapsed / (len(reference_vocals) / SAMPLE_RATE),
+        }
+
+    if not per_item:
+        raise FileNotFoundError(f"No corpus items found in {corpus_dir}; run 'build' first.")
+    keys = next(iter(per_item.values())).keys()
+    summary = {key: round(float(sum(item[key] for item in per_item.values()) / len(per_item)), 3) for key in keys}
+    summary["items"] = {name: {k: round(float(v), 3) for k, v in item.items()} for name, item in per_item.items()}
+    return summary
+
+
+def compare_to_baseline(results, baseline):
+    """Return a list of human-readable regressions of 'results' against 'baseline'."""
+    failures = []
+    for mode_name, summary in results.items():
+        reference = baseline.get(mode_name)
+        if not reference:
+            continue
+        for key in ("vocals_si_sdr", "background_si_sdr"):
+            if summary[key] < reference[key] - QUALITY_TOLERANCE_DB:
+                failures.append(f"{mode_name}: {key} {summary[key]:.2f} dB < baseline {reference[key]:.2f} dB")
+        if summary["rtf"] > reference["rtf"] * (1 + SPEED_TOLERANCE):
+            failures.append(f"{mode_name}: real-time factor {summary['rtf']:.3f} > baseline {reference['rtf']:.3f}")
+    return failures
+
+
+def run_regression(corpus_dir=None, modes=None, update_baseline=False):
+    """
+    Evaluate the selected modes (default: all REGRESSION_MODES) on the corpus,
+    print a report and compare to the stored baseline. Returns (results, failures).
+    With 'update_baseline', the results replace the stored baseline instead.
+    """
+    corpus_dir = Path(corpus_dir or default_corpus_dir())
+    if not any(corpus_dir.glob("*/mixture.wav")):
+        build_corpus(corpus_dir)
+
+    results = {}
+    for mode_name in modes or REGRESSION_MODES:
+        results[mode_name] = evaluate_mode(corpus_dir, mode_name, REGRESSION_MODES[mode_name])
+        summary = results[mode_name]
+        print(
+            f"{mode_name:>12}: vocals SDR {summary['vocals_sdr']:6.2f} / SI-SDR {summary['vocals_si_sdr']:6.2f} dB, "
+            f"background SDR {summary['background_sdr']:6.2f} / SI-SDR {summary['background_si_sdr']:6.2f} dB, "
+            f"RTF {summary['rtf']:.3f}"
+        )
+
+    baseline_path = corpus_dir / BASELINE_FILENAME
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.is_file() else {}
+    if update_baseline:
+        baseline.update(results)
+        baseline_path.write_text(json.dumps(baseline, indent=2))
+        print(f"Baseline updated: {baseline_path}")
+        return results, []
+
+    failures = compare_to_baseline(results, baseline)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    if not baseline:
+        print(f"No baseline at {baseline_path}; run with --update-baseline to create one.")
+    return results, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speed/quality regression check for separation modes.")
+    parser.add_argument("command", choices=["build", "run"])
+    parser.add_argument("--corpus-dir", default=None, help="Corpus location (default: output_files/regression_corpus)")
+    parser.add_argument("--modes", nargs="*", choices=list(REGRESSION_MODES), help="Modes to run (default: all)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store results as the new baseline")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_corpus(args.corpus_dir)
+    else:
+        _, regressions = run_regression(args.corpus_dir, args.modes, args.update_baseline)
+        sys.exit(1 if regressions else 0)
@@ -1,6 +1,8 @@
 import os
+import sys
 import socket
 import platform
+import subprocess
 from datetime import datetime
 from pathlib import Path
 from tkinter import filedialog, ttk
@@ -17,11 +19,16 @@ from logger_utils import (
 from utils import (
     format_duration,
     calculate_processing_time,
-    run_in_thread,
     get_video_length,
 )
 import youtube_logic
 import local_processing_logic
+import clip_batching
+import preview
+from watch_folder import WatchFolder
+from separation_presets import PRESET_NAMES, DEFAULT_PRESET, get_default_preset, describe_preset
+from time_ranges import parse_time_ranges
+from youtube_downloader import get_default_subtitle_languages
 
 # License validation/activation logic
 from license_utils import ensure_valid_license_on_startup
@@ -29,6 +36,47 @@ from license_utils import ensure_valid_license_on_startup
 # Promotions utility
 from promotions_utils import fetch_promotions
 
+# Managed scratch space for jobs
+from directory_manager import get_workspace_manager
+
+# Local metrics export and opt-in profiling
+from metrics_utils import start_metrics_exporters
+from profiling_utils import profiling_enabled, set_profiling_enabled, PROFILE_DIR
+
+# Background jobs and their status updates
+from job_manager import (
+    get_job_manager,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_FINISHED,
+    JOB_FAILED,
+    JOB_CANCELLED,
+    JOB_DONE_STATUSES,
+)
+
+# How often (ms) queued job updates are applied to the UI
+UI_TICK_MS = 200
+
+JOB_STATUS_COLORS = {
+    JOB_QUEUED: "gray40",
+    JOB_RUNNING: "#1e3c72",
+    JOB_FINISHED: "green",
+    JOB_FAILED: "red",
+    JOB_CANCELLED: "orange",
+}
+
+
+def open_with_default_app(path):
+    """Open a file (e.g. a preview WAV) with the system's default application."""
+    try:
+        if hasattr(os, "startfile"):
+            os.startfile(str(path))
+        else:
+            subprocess.Popen(["open" if sys.platform == "darwin" else "xdg-open", str(path)])
+    except OSError as e:
+        append_to_log(f"Could not open {path}: {e}")
+
+
 ###############################################################################
 #                      MAIN GUI APPLICATION CLASS
 ###############################################################################
@@ -53,6 +101,12 @@ class RianVideoProcessingTool(ctk.CTk):
         # Initialize local log file
         initialize_log_file()
 
+        # Set up job workspaces; this also removes directories left by crashed runs
+        get_workspace_manager()
+
+        # Expose throughput/latency/queue metrics locally if configured
+        start_metrics_exporters()
+
         # Layout: Left nav + main content
         self.nav_frame = ctk.CTkFrame(self, corner_radius=0, fg_color="#1e3c72")
         self.nav_frame.pack(side="left", fill="y")
@@ -63,9 +117,19 @@ class RianVideoProcessingTool(ctk.CTk):
         self.promotions = []  # Store fetched promotions
         self.client_id = socket.gethostname()  # Default client ID (can be updated if needed)
 
+        # Jobs outlive the pages that started them; only the dashboard widgets are rebuilt
+        self.job_manager = get_job_manager()
+        self.job_list_frame = None
+        self.job_list_kinds = None
+        self.job_rows = {}
+        self.preview_jobs = {}  # Preview job id -> what to run once the preview is confirmed
+        self.watch_folder = None
+
         self.init_navbar()
         self.init_homepage()
 
+        self.after(UI_TICK_MS, self._drain_job_updates)
+
     ############################################################################
     #                          NAVIGATION / LAYOUT
     ############################################################################
@@ -84,11 +148,132 @@ class RianVideoProcessingTool(ctk.CTk):
         ctk.CTkButton(self.nav_frame, text="Home", command=self.init_homepage).pack(pady=10)
         ctk.CTkButton(self.nav_frame, text="Video To Clean Audio", command=self.init_local_processing).pack(pady=10)
         ctk.CTkButton(self.nav_frame, text="YouTube Download", command=self.init_youtube_download).pack(pady=10)
+        ctk.CTkButton(self.nav_frame, text="Watch Folder", command=self.init_watch_folder).pack(pady=10)
+        ctk.CTkButton(self.nav_frame, text="Jobs", command=self.init_job_dashboard).pack(pady=10)
 
     def clear_content_frame(self):
         """Clear any widgets from the content frame."""
         for widget in self.content_frame.winfo_children():
             widget.destroy()
+        # Job rows belonged to the destroyed page; running jobs are unaffected
+        self.job_list_frame = None
+        self.job_list_kinds = None
+        self.job_rows = {}
+
+    ############################################################################
+    #                             JOB DASHBOARD
+    ############################################################################
+
+    def init_job_dashboard(self):
+        """Page listing every queued, running and finished job."""
+        self.clear_content_frame()
+
+        ctk.CTkLabel(self.content_frame, text="Jobs", font=("Helvetica", 18)).pack(pady=20)
+
+        controls_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        controls_frame.pack(pady=(0, 10))
+        ctk.CTkButton(
+            controls_frame,
+            text="Clear Finished",
+            command=self.clear_finished_jobs,
+        ).pack(side="left", padx=10)
+        profiling_var = ctk.BooleanVar(value=profiling_enabled())
+        ctk.CTkCheckBox(
+            controls_frame,
+            text=f"Profile new jobs (saved to {PROFILE_DIR})",
+            variable=profiling_var,
+            command=lambda: set_profiling_enabled(profiling_var.get()),
+        ).pack(side="left", padx=10)
+
+        self.build_job_list(self.content_frame, height=520)
+
+    def build_job_list(self, parent, kinds=None, height=300):
+        """
+        Create the scrollable job list inside 'parent' and fill it from the JobManager.
+        'kinds' optionally restricts the list to some job kinds.
+        """
+        self.job_list_frame = ctk.CTkScrollableFrame(parent, width=800, height=height)
+        self.job_list_frame.pack(padx=10, pady=10, fill="both", expand=True)
+        self.job_list_kinds = kinds
+        self.job_rows = {}
+
+        for snapshot in self.job_manager.jobs():
+            self._render_job(snapshot)
+
+    def clear_finished_jobs(self):
+        """Drop finished/failed jobs from the manager and rebuild the dashboard."""
+        self.job_manager.clear_finished()
+        self.init_job_dashboard()
+
+    def _render_job(self, snapshot):
+        """Create or refresh the dashboard row for one job snapshot."""
+        if self.job_list_frame is None or not self.job_list_frame.winfo_exists():
+            return
+        if self.job_list_kinds and snapshot["kind"] not in self.job_list_kinds:
+            return
+
+        row = self.job_rows.get(snapshot["job_id"])
+        if row is None:
+            frame = ctk.CTkFrame(self.job_list_frame, corner_radius=8, fg_color="#f9f9f9")
+            frame.pack(fill="x", padx=5, pady=4)
+            header = ctk.CTkFrame(frame, fg_color="transparent")
+            header.pack(fill="x", padx=10, pady=(5, 0))
+            ctk.CTkLabel(
+                header,
+                text=f"#{snapshot['job_id']}  {snapshot['kind']}: {snapshot['label']}",
+                font=("Helvetica", 14, "bold"),
+                text_color="black",
+                anchor="w",
+            ).pack(side="left", fill="x", expand=True)
+            cancel_button = ctk.CTkButton(
+                header,
+                text="Cancel",
+                width=80,
+                fg_color="gray50",
+                command=lambda job_id=snapshot["job_id"]: self.job_manager.cancel(job_id),
+            )
+            cancel_button.pack(side="right")
+            status_label = ctk.CTkLabel(frame, text="", font=("Helvetica", 12), anchor="w", wraplength=740)
+            status_label.pack(fill="x", padx=10)
+            bar = ttk.Progressbar(frame, orient="horizontal", mode="determinate", length=740)
+            bar.pack(padx=10, pady=(0, 8))
+            row = {"status": status_label, "progress": bar, "cancel": cancel_button}
+            self.job_rows[snapshot["job_id"]] = row
+
+        row["status"].configure(
+            text=f"[{snapshot['status']}] {snapshot['message']}",
+            text_color=JOB_STATUS_COLORS.get(snapshot["status"], "black"),
+        )
+        row["progress"]["value"] = snapshot["progress"]
+        if snapshot["status"] in JOB_DONE_STATUSES:
+            row["cancel"].configure(state="disabled")
+        request = self.preview_jobs.get(snapshot["job_id"])
+        if request and snapshot["status"] == JOB_FINISHED and "actions" not in row:
+            row["actions"] = ctk.CTkFrame(row["status"].master, fg_color="transparent")
+            row["actions"].pack(fill="x", padx=10, pady=(0, 8))
+            _, vocals_path, background_path = preview.preview_paths(
+                request["file_path"], request["preset"], request["preview_id"]
+            )
+            ctk.CTkButton(row["actions"], text="Listen: Vocals", width=120,
+                          command=lambda: open_with_default_app(vocals_path)).pack(side="left", padx=5)
+            ctk.CTkButton(row["actions"], text="Listen: Background", width=140,
+                          command=lambda: open_with_default_app(background_path)).pack(side="left", padx=5)
+            ctk.CTkButton(row["actions"], text="Run Full Job", width=120,
+                          command=lambda: self.confirm_preview(snapshot["job_id"])).pack(side="left", padx=5)
+
+    def _drain_job_updates(self):
+        """
+        Apply all job updates queued since the last tick, then re-arm the timer.
+        Running on a fixed after() tick keeps the Tk event loop responsive no
+        matter how often worker threads report progress.
+        """
+        try:
+            for snapshot in self.job_manager.drain_updates():
+                self._render_job(snapshot)
+        except Exception as e:
+            append_to_log(f"Error refreshing job dashboard: {e}")
+        finally:
+            self.after(UI_TICK_MS, self._drain_job_updates)
 
     ############################################################################
     #                                HOME PAGE
@@ -192,8 +377,7 @@ class RianVideoProcessingTool(ctk.CTk):
     def init_youtube_download(self):
         """UI for downloading from YouTube (video or playlist)."""
         self.clear_content_frame()
-        progress_label = ctk.StringVar(value="Status: Ready")
-        progress_bar = ttk.Progressbar(self.content_frame, orient="horizontal", mode="determinate", length=600)
+        page_status = ctk.StringVar(value="Status: Ready")
         youtube_link_var = ctk.StringVar()
 
         ctk.CTkLabel(
@@ -210,24 +394,79 @@ class RianVideoProcessingTool(ctk.CTk):
             width=600,
         ).pack(pady=20)
 
+        # Subtitle options
+        subtitle_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        subtitle_frame.pack(pady=(0, 10))
+        subtitle_languages_var = ctk.StringVar(value=", ".join(get_default_subtitle_languages() or []))
+        ctk.CTkLabel(subtitle_frame, text="Subtitle languages:", font=("Helvetica", 14)).pack(side="left", padx=5)
+        ctk.CTkEntry(
+            subtitle_frame,
+            textvariable=subtitle_languages_var,
+            placeholder_text="e.g. en, de (blank = all)",
+            width=180,
+        ).pack(side="left", padx=5)
+        include_translated_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(subtitle_frame, text="Include auto-translated", variable=include_translated_var).pack(
+            side="left", padx=5
+        )
+        subtitles_only_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(subtitle_frame, text="Subtitles only", variable=subtitles_only_var).pack(side="left", padx=5)
+        separate_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(subtitle_frame, text="Separate vocals", variable=separate_var).pack(side="left", padx=5)
+
         ctk.CTkButton(
             self.content_frame,
             text="Download",
-            command=lambda: run_in_thread(
-                youtube_logic.process_youtube_video,
-                self,
-                youtube_link_var,
-                progress_label,
-                progress_bar
+            command=lambda: self.queue_youtube_download(
+                page_status, youtube_link_var, subtitle_languages_var, include_translated_var, subtitles_only_var,
+                separate_var,
             )
         ).pack(pady=20)
+        ctk.CTkLabel(self.content_frame, textvariable=page_status, font=("Helvetica", 14), wraplength=760).pack(
+            pady=(0, 10)
+        )
 
-        progress_bar.pack(pady=10)
-        ctk.CTkLabel(
-            self.content_frame,
-            textvariable=progress_label,
-            font=("Helvetica", 14)
-        ).pack(pady=10)
+        self.build_job_list(self.content_frame, kinds=["YouTube Download", "YouTube Subtitles", "YouTube Separation"])
+
+    def queue_youtube_download(self, status, youtube_link_var, subtitle_languages_var, include_translated_var,
+                               subtitles_only_var, separate_var):
+        """
+        Read the link, options and destination on the UI thread, then queue the download job
+        (or, with 'Separate vocals', a pipelined download-and-separate job).
+        An empty link is reported in 'status' (the page's status line).
+        """
+        link = youtube_link_var.get().strip()
+        if not link:
+            append_to_log("YouTube link is empty.")
+            status.set("YouTube link is empty.")
+            return
+        status.set("Status: Ready")
+        save_folder = youtube_logic.ask_youtube_save_folder()
+        if not save_folder:
+            return
+        languages = [lang.strip() for lang in subtitle_languages_var.get().split(",") if lang.strip()]
+        subtitles_only = subtitles_only_var.get()
+        if separate_var.get() and not subtitles_only:
+            self.job_manager.submit(
+                "YouTube Separation",
+                link,
+                youtube_logic.separate_youtube_video,
+                link,
+                save_folder,
+                subtitle_languages=languages,
+                include_translated_subs=include_translated_var.get(),
+            )
+            return
+        self.job_manager.submit(
+            "YouTube Subtitles" if subtitles_only else "YouTube Download",
+            link,
+            youtube_logic.process_youtube_video,
+            link,
+            save_folder,
+            subtitle_languages=languages,  # Empty list = all languages
+            include_translated_subs=include_translated_var.get(),
+            subtitles_only=subtitles_only,
+        )
 
     ############################################################################
     #                     LOCAL VIDEO PROCESSING PAGE
@@ -236,24 +475,301 @@ class RianVideoProcessingTool(ctk.CTk):
     def init_local_processing(self):
         """UI for local video processing."""
         self.clear_content_frame()
-        progress_label = ctk.StringVar(value="Status: Ready")
-        progress_bar = ttk.Progressbar(self.content_frame, orient="horizontal", mode="determinate", length=600)
+        page_status = ctk.StringVar(value="Status: Ready")
 
-        ctk.CTkLabel(self.content_frame, text="Process Local Video File", font=("Helvetica", 18)).pack(pady=20)
+        ctk.CTkLabel(self.content_frame, text="Process Local Video and Audio Files", font=("Helvetica", 18)).pack(
+            pady=20
+        )
 
+        # Output options
+        options_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        options_frame.pack(pady=(0, 10))
+        output_mode_var = ctk.StringVar(value=local_processing_logic.OUTPUT_STEMS)
+        ctk.CTkLabel(options_frame, text="Output:", font=("Helvetica", 14)).pack(side="left", padx=5)
+        ctk.CTkOptionMenu(
+            options_frame,
+            variable=output_mode_var,
+            values=list(local_processing_logic.OUTPUT_MODES),
+            width=110,
+        ).pack(side="left", padx=5)
+        background_level_var = ctk.DoubleVar(value=0.0)
+        background_level_text = ctk.StringVar(value="Background in video: off")
+        ctk.CTkLabel(options_frame, textvariable=background_level_text, font=("Helvetica", 14), width=200).pack(
+            side="left", padx=5
+        )
+        ctk.CTkSlider(
+            options_frame,
+            variable=background_level_var,
+            from_=0.0,
+            to=1.0,
+            number_of_steps=20,
+            width=180,
+            command=lambda value: background_level_text.set(
+                f"Background in video: {int(value * 100)}%" if value > 0 else "Background in video: off"
+            ),
+        ).pack(side="left", padx=5)
+
+        # Separation preset, with its measured speed on this machine
+        preset_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        preset_frame.pack(pady=(0, 10))
+        preset_var = ctk.StringVar(value=get_default_preset() or DEFAULT_PRESET)
+        preset_text = ctk.StringVar(value=describe_preset(preset_var.get()))
+        ctk.CTkLabel(preset_frame, text="Quality:", font=("Helvetica", 14)).pack(side="left", padx=5)
+        ctk.CTkOptionMenu(
+            preset_frame,
+            variable=preset_var,
+            values=list(PRESET_NAMES),
+            width=110,
+            command=lambda value: preset_text.set(describe_preset(value)),
+        ).pack(side="left", padx=5)
         ctk.CTkButton(
+            preset_frame,
+            text="Measure Speed",
+            width=120,
+            command=self.queue_preset_benchmark,
+        ).pack(side="left", padx=5)
+        ctk.CTkLabel(
             self.content_frame,
-            text="Upload File",
-            command=lambda: run_in_thread(
-                local_processing_logic.process_local_video,
-                self,
-                progress_label,
-                progress_bar
+            textvariable=preset_text,
+            font=("Helvetica", 12),
+            wraplength=760,
+        ).pack(pady=(0, 10))
+
+        # Optional time ranges: only those parts of each video are separated
+        ranges_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        ranges_frame.pack(pady=(0, 10))
+        time_ranges_var = ctk.StringVar()
+        ctk.CTkLabel(ranges_frame, text="Time ranges:", font=("Helvetica", 14)).pack(side="left", padx=5)
+        ctk.CTkEntry(
+            ranges_frame,
+            textvariable=time_ranges_var,
+            placeholder_text="e.g. 1:30-2:45, 10:00-12:00 (blank = whole video)",
+            width=320,
+        ).pack(side="left", padx=5)
+        splice_ranges_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(ranges_frame, text="Full-length output", variable=splice_ranges_var).pack(
+            side="left", padx=5
+        )
+        batch_clips_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(ranges_frame, text="Batch short clips", variable=batch_clips_var).pack(side="left", padx=5)
+
+        # Preview: a few short excerpts with the chosen preset, before the full job
+        preview_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        preview_frame.pack(pady=(0, 10))
+        preview_ranges_var = ctk.StringVar()
+        ctk.CTkLabel(preview_frame, text="Preview at:", font=("Helvetica", 14)).pack(side="left", padx=5)
+        ctk.CTkEntry(
+            preview_frame,
+            textvariable=preview_ranges_var,
+            placeholder_text="e.g. 5:00-5:10 (blank = sampled across the file)",
+            width=320,
+        ).pack(side="left", padx=5)
+
+        buttons_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        buttons_frame.pack(pady=20)
+        ctk.CTkButton(
+            buttons_frame,
+            text="Preview File",
+            command=lambda: self.start_preview(
+                page_status, preview_ranges_var.get().strip() or None, output_mode_var.get(), background_level_var.get(),
+                preset_var.get(), time_ranges_var.get().strip() or None, splice_ranges_var.get(),
             ),
-        ).pack(pady=20)
+        ).pack(side="left", padx=10)
+        ctk.CTkButton(
+            buttons_frame,
+            text="Upload Files",
+            command=lambda: self.queue_local_videos(
+                page_status, output_mode_var.get(), background_level_var.get(), preset_var.get(),
+                time_ranges_var.get().strip() or None, splice_ranges_var.get(), batch_clips_var.get(),
+            ),
+        ).pack(side="left", padx=10)
+        ctk.CTkLabel(self.content_frame, textvariable=page_status, font=("Helvetica", 14), wraplength=760).pack(
+            pady=(0, 10)
+        )
+
+        self.build_job_list(
+            self.content_frame, kinds=["Local Video Upload", "Benchmark", preview.JOB_KIND, clip_batching.JOB_KIND]
+        )
+
+    def queue_local_videos(self, status, output_mode=local_processing_logic.OUTPUT_STEMS, background_level=0.0,
+                           preset=None, time_ranges=None, splice_ranges=False, batch_clips=False):
+        """
+        Pick files and destination on the UI thread, then queue one job per file
+        (or, with 'batch_clips', one batched job for all of them; stems only).
+        Invalid options are reported in 'status' (the page's status line).
+        """
+        if time_ranges:
+            try:
+                parse_time_ranges(time_ranges)
+            except ValueError as e:
+                append_to_log(f"Invalid time ranges: {e}")
+                status.set(f"Invalid time ranges: {e}")
+                return
+        if batch_clips:
+            try:
+                clip_batching.check_batch_options(output_mode, time_ranges)
+            except ValueError as e:
+                append_to_log(str(e))
+                status.set(str(e))
+                return
+        status.set("Status: Ready")
+        file_paths, save_folder = local_processing_logic.select_local_videos()
+        if batch_clips and file_paths:
+            self.job_manager.submit(
+                clip_batching.JOB_KIND,
+                f"{len(file_paths)} clips",
+                clip_batching.process_clip_batch,
+                file_paths,
+                save_folder,
+                preset=preset,
+            )
+            return
+        for file_path in file_paths:
+            self.job_manager.submit(
+                "Local Video Upload",
+                Path(file_path).name,
+                local_processing_logic.process_local_video,
+                file_path,
+                save_folder,
+                output_mode=output_mode,
+                background_level=background_level or None,
+                preset=preset,
+                time_ranges=time_ranges,
+                splice_ranges=splice_ranges,
+            )
+
+    def start_preview(self, status, preview_ranges=None, output_mode=local_processing_logic.OUTPUT_STEMS,
+                      background_level=0.0, preset=None, time_ranges=None, splice_ranges=False):
+        """
+        Pick one file and preview it right away (not behind queued jobs). The page's
+        other options are kept, so 'Run Full Job' on the finished preview queues
+        the job exactly as 'Upload Files' would. Invalid ranges are reported in 'status'.
+        """
+        for ranges in filter(None, (preview_ranges, time_ranges)):
+            try:
+                parse_time_ranges(ranges)
+            except ValueError as e:
+                append_to_log(f"Invalid time ranges: {e}")
+                status.set(f"Invalid time ranges: {e}")
+                return
+        status.set("Status: Ready")
+        file_path = filedialog.askopenfilename(
+            title="Select a Video or Audio File to Preview",
+            filetypes=local_processing_logic.MEDIA_FILE_TYPES,
+        )
+        if not file_path:
+            return
+        preview_id = preview.new_preview_id()
+        job = self.job_manager.run_now(
+            preview.JOB_KIND,
+            Path(file_path).name,
+            preview.preview_local_video,
+            file_path,
+            preset=preset,
+            time_ranges=preview_ranges,
+            preview_id=preview_id,
+        )
+        self.preview_jobs[job.job_id] = {
+            "file_path": file_path,
+            "preview_id": preview_id,
+            "preset": preset,
+            "output_mode": output_mode,
+            "background_level": background_level or None,
+            "time_ranges": time_ranges,
+            "splice_ranges": splice_ranges,
+        }
+
+    def confirm_preview(self, job_id):
+        """Queue the full job for a previewed file; the preview left its model loaded."""
+        request = self.preview_jobs.pop(job_id, None)
+        if request is None:
+            return  # Already confirmed
+        save_folder = filedialog.askdirectory(title="Choose folder to save extracted files")
+        if not save_folder:
+            self.preview_jobs[job_id] = request
+            append_to_log("Save operation canceled by user.")
+            return
+        self.job_manager.submit(
+            "Local Video Upload",
+            Path(request["file_path"]).name,
+            local_processing_logic.process_local_video,
+            request["file_path"],
+            save_folder,
+            output_mode=request["output_mode"],
+            background_level=request["background_level"],
+            preset=request["preset"],
+            time_ranges=request["time_ranges"],
+            splice_ranges=request["splice_ranges"],
+        )
+
+    def queue_preset_benchmark(self):
+        """Measure each preset's speed in the background; reopen the page to see the results."""
+        from autotune import benchmark_presets_job
+        self.job_manager.submit("Benchmark", "Separation presets", benchmark_presets_job)
+
+
+    ############################################################################
+    #                          WATCH FOLDER PAGE
+    ############################################################################
+
+    def init_watch_folder(self):
+        """UI for hot-folder ingest: process every video dropped into a folder."""
+        self.clear_content_frame()
+        watch_status = ctk.StringVar(value=self._watch_folder_status())
+
+        ctk.CTkLabel(self.content_frame, text="Watch Folder", font=("Helvetica", 18)).pack(pady=20)
+
+        buttons_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        buttons_frame.pack(pady=10)
+        ctk.CTkButton(
+            buttons_frame,
+            text="Start Watching",
+            command=lambda: self.start_watch_folder(watch_status),
+        ).pack(side="left", padx=10)
+        ctk.CTkButton(
+            buttons_frame,
+            text="Stop Watching",
+            command=lambda: self.stop_watch_folder(watch_status),
+        ).pack(side="left", padx=10)
+
+        ctk.CTkLabel(
+            self.content_frame,
+            textvariable=watch_status,
+            font=("Helvetica", 14),
+            wraplength=760,
+        ).pack(pady=10)
+
+        self.build_job_list(self.content_frame, kinds=["Watch Folder"])
+
+    def _watch_folder_status(self):
+        if self.watch_folder and self.watch_folder.running:
+            return f"Watching {self.watch_folder.input_dir} -> {self.watch_folder.output_dir}"
+        return "Status: Not watching"
+
+    def start_watch_folder(self, watch_status):
+        """Ask for the input/output folders and start the watcher."""
+        if self.watch_folder and self.watch_folder.running:
+            return
+        input_dir = filedialog.askdirectory(title="Choose the folder to watch")
+        if not input_dir:
+            return
+        output_dir = filedialog.askdirectory(title="Choose the folder for cleaned audio")
+        if not output_dir:
+            return
+        try:
+            self.watch_folder = WatchFolder(input_dir, output_dir)
+            self.watch_folder.start()
+        except Exception as e:
+            append_to_log(f"Could not start watch folder: {e}")
+            watch_status.set(f"Could not start watching: {e}")
+            return
+        watch_status.set(self._watch_folder_status())
 
-        progress_bar.pack(pady=10)
-        ctk.CTkLabel(self.content_frame, textvariable=progress_label, font=("Helvetica", 14)).pack(pady=10)
+    def stop_watch_folder(self, watch_status):
+        """Stop picking up new files; jobs in progress continue."""
+        if self.watch_folder:
+            self.watch_folder.stop()
+        watch_status.set(self._watch_folder_status())
 
 
 # Entry point if running as script
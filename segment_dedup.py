@@ -0,0 +1,397 @@
+import io
+import os
+import json
+import uuid
+import hashlib
+import threading
+from collections import Counter
+from pathlib import Path
+
+from directory_manager import get_directory_size, get_workspace_manager
+from logger_utils import append_to_log
+from metrics_utils import REGISTRY, Counter as MetricCounter
+from processing_config import get_processing_setting
+from separation_engine import resolve_chunking
+
+# Audio that repeats across jobs (intros, outros, jingles, ad reads) is recognised
+# by an acoustic fingerprint and its stems are reused instead of separated again.
+DEDUP_DIRNAME = "rian_dedup"
+DEFAULT_STORE_MB = 2048
+DEFAULT_JOB_WRITE_MB = 256     # Most segment audio one job may add to the store
+
+# Fingerprint (Haitsma/Kalker style): 32-bit hashes from band-energy differences
+# of heavily overlapping frames of a 5.5 kHz mono downmix.
+DECIMATION = 8                 # 44.1 kHz -> 5.5 kHz
+FRAME_LENGTH = 2048            # ~370 ms at 5.5 kHz
+FRAME_HOP = 64                 # ~12 ms; keeps hashes stable under small misalignment
+HOP_SAMPLES = FRAME_HOP * DECIMATION  # Hop at the full sample rate (512)
+BAND_EDGES_HZ = (300.0, 2000.0)
+BAND_COUNT = 33                # 33 bands -> 32 bits per frame
+FINGERPRINT_BLOCK_FRAMES = 4096
+LOWPASS_TAPS = 255
+LOWPASS_BLOCK = 1 << 16
+SILENCE_POWER = 1e-7           # Frames quieter than this (about -70 dBFS) are not indexed
+
+# Stored segments: multiples of the hop so segment and input fingerprints share a grid
+SEGMENT_SECONDS = 10.0
+MIN_MATCH_VOTES = 20
+MIN_MATCH_FRACTION = 0.05      # Share of a segment's hashes that must agree on one offset
+MAX_HASH_BUCKET = 64           # Ignore hashes that occur too often to be informative
+MIN_SIMILARITY = 0.99          # Squared cosine similarity of the aligned mixtures
+GAIN_RANGE = (0.5, 2.0)
+
+DEDUP_INPUT_SECONDS = REGISTRY.register(MetricCounter(
+    "rian_dedup_input_seconds_total", "Seconds of audio checked against the segment store."))
+DEDUP_REUSED_SECONDS = REGISTRY.register(MetricCounter(
+    "rian_dedup_reused_seconds_total", "Seconds of audio whose stems were reused from the segment store."))
+
+
+def _lowpass_decimate(signal):
+    """
+    Anti-aliased downsampling by DECIMATION (windowed-sinc FIR, FFT overlap-add),
+    so the result does not depend on the input's alignment to the decimation grid.
+    """
+    import numpy as np
+    cutoff = 0.9 / DECIMATION  # Fraction of the input Nyquist frequency
+    n = np.arange(LOWPASS_TAPS) - (LOWPASS_TAPS - 1) / 2
+    taps = cutoff * np.sinc(cutoff * n) * np.hamming(LOWPASS_TAPS)
+    fft_length = 1 << int(np.ceil(np.log2(LOWPASS_BLOCK + LOWPASS_TAPS - 1)))
+    response = np.fft.rfft(taps, fft_length)
+
+    filtered = np.zeros(len(signal) + LOWPASS_TAPS - 1, dtype=np.float32)
+    for start in range(0, len(signal), LOWPASS_BLOCK):
+        block = signal[start:start + LOWPASS_BLOCK]
+        convolved = np.fft.irfft(np.fft.rfft(block, fft_length) * response, fft_length)
+        filtered[start:start + len(block) + LOWPASS_TAPS - 1] += convolved[:len(block) + LOWPASS_TAPS - 1]
+    delay = (LOWPASS_TAPS - 1) // 2
+    return filtered[delay:delay + len(signal):DECIMATION]
+
+
+def fingerprint(mono, samplerate):
+    """
+    Fingerprint a full-rate mono numpy signal. Returns (hashes, valid): one uint32
+    per hop and a mask of frames loud enough to be meaningful. Hash i describes
+    the audio starting at sample (i + 1) * HOP_SAMPLES.
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    signal = _lowpass_decimate(np.asarray(mono, dtype=np.float32))
+    if len(signal) < FRAME_LENGTH + FRAME_HOP:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=bool)
+
+    frame_rate = samplerate / DECIMATION
+    frequencies = np.fft.rfftfreq(FRAME_LENGTH, 1.0 / frame_rate)
+    edges = np.geomspace(BAND_EDGES_HZ[0], BAND_EDGES_HZ[1], BAND_COUNT + 1)
+    bins = np.searchsorted(frequencies, edges)
+    window = np.hanning(FRAME_LENGTH).astype(np.float32)
+    frames = sliding_window_view(signal, FRAME_LENGTH)[::FRAME_HOP]
+
+    energies, powers = [], []
+    for block_start in range(0, len(frames), FINGERPRINT_BLOCK_FRAMES):
+        block = frames[block_start:block_start + FINGERPRINT_BLOCK_FRAMES]
+        spectrum = np.abs(np.fft.rfft(block * window, axis=1)) ** 2
+        cumulative = np.concatenate([np.zeros((len(block), 1)), np.cumsum(spectrum, axis=1)], axis=1)
+        energies.append(cumulative[:, bins[1:]] - cumulative[:, bins[:-1]])
+        powers.append(np.mean(block ** 2, axis=1))
+    energy = np.concatenate(energies)
+    power = np.concatenate(powers)
+
+    band_difference = energy[:, :-1] - energy[:, 1:]
+    bits = (band_difference[1:] - band_difference[:-1]) > 0
+    hashes = (bits.astype(np.uint64) << np.arange(32, dtype=np.uint64)).sum(axis=1).astype(np.uint32)
+    valid = (power[1:] > SILENCE_POWER) & (power[:-1] > SILENCE_POWER)
+    return hashes, valid
+
+
+class SegmentStore:
+    """
+    Persistent store of separated segments for one model/parameter set: per
+    segment a .npz with its fingerprint, the mono mixture (to verify and align
+    a match) and the vocals / rest stems, all float16. Audio is only stored once
+    it recurs: the first time a segment is seen, just its fingerprint is kept
+    (a small .npy "sighting"). Kept under a size budget by evicting the least
+    recently used files.
+    """
+    def __init__(self, directory, budget_bytes):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._index = {}             # hash -> [(segment name, hash position)]
+        self._segments = {}          # segment name -> its hashes
+        self._sighting_index = {}    # hash -> [(sighting name, hash position)]
+        self._sightings = {}         # sighting name -> its hashes
+        for path in self.directory.glob("*.np[yz]"):
+            try:
+                if path.suffix == ".npz":
+                    self._add_to_index(self._index, self._segments, path.stem, self._load(path)["hashes"])
+                else:
+                    self._add_to_index(self._sighting_index, self._sightings, path.stem, self._load(path))
+            except Exception as e:
+                append_to_log(f"Dropping unreadable dedup segment {path}: {e}")
+                path.unlink(missing_ok=True)
+
+    def _load(self, path):
+        import numpy as np
+        return np.load(str(path))
+
+    def _add_to_index(self, index, entries, name, hashes):
+        entries[name] = hashes.tolist()
+        for position, value in enumerate(entries[name]):
+            index.setdefault(value, []).append((name, position))
+
+    def _remove_from_index(self, index, entries, name):
+        for value in set(entries.pop(name, ())):
+            bucket = [entry for entry in index.get(value, ()) if entry[0] != name]
+            if bucket:
+                index[value] = bucket
+            else:
+                index.pop(value, None)
+
+    def _vote(self, index, entries, hashes, valid):
+        """(name, hash offset into the input) pairs of 'entries' matching 'hashes', best-supported first."""
+        votes = Counter()
+        for position, value in enumerate(hashes.tolist()):
+            if not valid[position]:
+                continue
+            bucket = index.get(value)
+            if not bucket or len(bucket) > MAX_HASH_BUCKET:
+                continue
+            for name, entry_position in bucket:
+                votes[(name, position - entry_position)] += 1
+        return [
+            (name, offset) for (name, offset), count in votes.most_common()
+            if name in entries and count >= max(MIN_MATCH_VOTES, MIN_MATCH_FRACTION * len(entries[name]))
+        ]
+
+    def candidates(self, hashes, valid):
+        """(segment name, hash offset into the input) pairs, best-supported first."""
+        with self._lock:
+            return self._vote(self._index, self._segments, hashes, valid)
+
+    def recurs(self, hashes, valid):
+        """
+        Whether a segment with this fingerprint was seen before (in an earlier
+        job or earlier in this one). If not, it is recorded as a sighting, so
+        its next occurrence is stored; a matched sighting is dropped.
+        """
+        import numpy as np
+        with self._lock:
+            seen = {name for name, _ in self._vote(self._sighting_index, self._sightings, hashes, valid)}
+            for name in seen:
+                self._remove_from_index(self._sighting_index, self._sightings, name)
+        if seen:
+            for name in seen:
+                (self.directory / f"{name}.npy").unlink(missing_ok=True)
+            return True
+        name = uuid.uuid4().hex
+        buffer = io.BytesIO()
+        np.save(buffer, hashes)
+        temp_path = self.directory / f"{name}.tmp"
+        temp_path.write_bytes(buffer.getvalue())
+        os.replace(temp_path, self.directory / f"{name}.npy")
+        with self._lock:
+            self._add_to_index(self._sighting_index, self._sightings, name, hashes)
+        return False
+
+    def read(self, name):
+        """Load a stored segment (and mark it as recently used), or None if it is gone."""
+        path = self.directory / f"{name}.npz"
+        try:
+            with self._load(path) as data:
+                segment = {key: data[key] for key in data.files}
+            os.utime(path)
+            return segment
+        except (OSError, ValueError):
+            return None
+
+    def add(self, hashes, mixture, vocals, rest):
+        """Store one separated segment."""
+        import numpy as np
+        name = uuid.uuid4().hex
+        buffer = io.BytesIO()
+        np.savez(buffer, hashes=hashes, mixture=mixture.astype(np.float16),
+                 vocals=vocals.astype(np.float16), rest=rest.astype(np.float16))
+        temp_path = self.directory / f"{name}.tmp"
+        temp_path.write_bytes(buffer.getvalue())
+        os.replace(temp_path, self.directory / f"{name}.npz")
+        with self._lock:
+            self._add_to_index(self._index, self._segments, name, hashes)
+
+    def evict(self):
+        """Delete least recently used segments and sightings until the store fits its budget."""
+        paths = sorted(self.directory.glob("*.np[yz]"), key=lambda path: path.stat().st_mtime)
+        total = get_directory_size(self.directory)
+        for path in paths:
+            if total <= self.budget_bytes:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            total -= size
+            with self._lock:
+                if path.suffix == ".npz":
+                    self._remove_from_index(self._index, self._segments, path.stem)
+                else:
+                    self._remove_from_index(self._sighting_index, self._sightings, path.stem)
+
+
+class DedupSession:
+    """
+    Segment reuse for one separation job. find_matches() locates stored segments
+    in the input (fingerprint votes, then sample-accurate alignment and a
+    similarity check on the mixture); remember() stores the newly separated parts.
+    Tracks the job's hit rate.
+    """
+    def __init__(self, store, samplerate, write_budget_bytes=DEFAULT_JOB_WRITE_MB * 1024 * 1024):
+        self.store = store
+        self.samplerate = samplerate
+        self.write_budget_bytes = write_budget_bytes
+        self.input_samples = 0
+        self.reused_samples = 0
+        self.matches = []  # (start, end) sample ranges reused from the store
+        self._mono = None
+        self._hashes = None
+        self._valid = None
+
+    @property
+    def hit_rate(self):
+        return self.reused_samples / self.input_samples if self.input_samples else 0.0
+
+    def _align(self, approx_start, mixture):
+        """Refine a match position to the sample; returns (start, gain) or None if it does not match."""
+        import numpy as np
+        length = len(mixture)
+        lowest = max(0, approx_start - HOP_SAMPLES)
+        highest = min(len(self._mono) - length, approx_start + HOP_SAMPLES)
+        if highest < lowest:
+            return None
+
+        # Correlate the loudest second of the stored mixture around the estimated position
+        probe_length = min(length, int(self.samplerate))
+        probe_windows = max(1, length // probe_length)
+        loudness = [np.sum(mixture[i * probe_length:(i + 1) * probe_length] ** 2) for i in range(probe_windows)]
+        probe_start = int(np.argmax(loudness)) * probe_length
+        probe = mixture[probe_start:probe_start + probe_length]
+        region = self._mono[lowest + probe_start:highest + probe_start + probe_length]
+        start = lowest + int(np.argmax(np.correlate(region, probe, mode="valid")))
+
+        candidate = self._mono[start:start + length]
+        stored_energy = float(np.dot(mixture, mixture))
+        candidate_energy = float(np.dot(candidate, candidate))
+        if stored_energy <= 0 or candidate_energy <= 0:
+            return None
+        cross = float(np.dot(candidate, mixture))
+        gain = cross / stored_energy
+        if cross * cross / (stored_energy * candidate_energy) < MIN_SIMILARITY:
+            return None
+        if not GAIN_RANGE[0] <= gain <= GAIN_RANGE[1]:
+            return None
+        return start, gain
+
+    def find_matches(self, torch, wav):
+        """
+        Return [(start, end, vocals, rest)] of non-overlapping input ranges whose
+        stems can be reused; vocals/rest are [channels, samples] tensors in the
+        input's own level.
+        """
+        import numpy as np
+        self._mono = wav.mean(0).numpy().astype(np.float32)
+        self._hashes, self._valid = fingerprint(self._mono, self.samplerate)
+        self.input_samples = wav.shape[-1]
+        DEDUP_INPUT_SECONDS.inc(self.input_samples / self.samplerate)
+
+        found = []
+        for name, offset in self.store.candidates(self._hashes, self._valid):
+            approx_start = offset * HOP_SAMPLES
+            segment = self.store.read(name)
+            if segment is None:
+                continue
+            mixture = segment["mixture"].astype(np.float32)
+            length = len(mixture)
+            if any(approx_start + HOP_SAMPLES < end and start + HOP_SAMPLES < approx_start + length
+                   for start, end, _, _ in found):
+                continue  # Overlaps a better match already taken
+            aligned = self._align(approx_start, mixture)
+            if aligned is None:
+                continue
+            start, gain = aligned
+            if any(start < end and found_start < start + length for found_start, end, _, _ in found):
+                continue
+            vocals = torch.from_numpy(segment["vocals"].astype(np.float32) * gain)
+            rest = torch.from_numpy(segment["rest"].astype(np.float32) * gain)
+            found.append((start, start + length, vocals, rest))
+
+        found.sort(key=lambda match: match[0])
+        self.matches = [(start, end) for start, end, _, _ in found]
+        self.reused_samples = sum(end - start for start, end in self.matches)
+        DEDUP_REUSED_SECONDS.inc(self.reused_samples / self.samplerate)
+        return found
+
+    def remember(self, vocals, rest):
+        """
+        Store the grid segments of this input that were separated (not reused),
+        are not silent and recur (see SegmentStore.recurs), up to the job's write budget.
+        """
+        if self._mono is None:
+            return
+        segment_length = int(SEGMENT_SECONDS * self.samplerate) // HOP_SAMPLES * HOP_SAMPLES
+        hashes_per_segment = (segment_length - FRAME_LENGTH * DECIMATION) // HOP_SAMPLES
+        vocals, rest = vocals.numpy(), rest.numpy()
+        # float16 mixture + vocals + rest
+        segment_bytes = 2 * segment_length * (1 + vocals.shape[0] + rest.shape[0])
+        stored = 0
+        for start in range(0, len(self._mono) - segment_length + 1, segment_length):
+            end = start + segment_length
+            if any(start < match_end and match_start < end for match_start, match_end in self.matches):
+                continue
+            first_hash = start // HOP_SAMPLES
+            hashes = self._hashes[first_hash:first_hash + hashes_per_segment]
+            valid = self._valid[first_hash:first_hash + hashes_per_segment]
+            if len(hashes) < hashes_per_segment or valid.mean() < 0.5:
+                continue
+            if (stored + 1) * segment_bytes > self.write_budget_bytes:
+                append_to_log("Dedup: this job's segment write budget is used up; not storing more segments.")
+                break
+            if not self.store.recurs(hashes, valid):
+                continue
+            self.store.add(hashes, self._mono[start:end], vocals[:, start:end], rest[:, start:end])
+            stored += 1
+        if stored:
+            self.store.evict()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_dedup_session(model_name, samplerate, options, enabled=None):
+    """
+    A DedupSession on the store for this model and its chunking/shift/overlap
+    settings, or None when dedup is off: 'enabled' (e.g. the 'dedup' separation
+    option), by default the 'dedup_enabled' setting.
+    """
+    if enabled is None:
+        enabled = get_processing_setting("dedup_enabled", False)
+    if not enabled:
+        return None
+    chunk_seconds, overlap_seconds = resolve_chunking(options.get("chunk_seconds"), options.get("overlap_seconds"))
+    params = {
+        "model": model_name,
+        "samplerate": samplerate,
+        "chunk_seconds": chunk_seconds,
+        "overlap_seconds": overlap_seconds,
+        "shifts": options.get("shifts", 1),
+        "overlap": options.get("overlap", 0.25),
+    }
+    key = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            configured = get_processing_setting("dedup_dir")
+            root = Path(configured) if configured else get_workspace_manager().root / DEDUP_DIRNAME
+            budget = int(get_processing_setting("dedup_store_mb", DEFAULT_STORE_MB)) * 1024 * 1024
+            store = SegmentStore(root / key, budget)
+            _stores[key] = store
+    write_budget = int(get_processing_setting("dedup_job_write_mb", DEFAULT_JOB_WRITE_MB)) * 1024 * 1024
+    return DedupSession(store, samplerate, write_budget)
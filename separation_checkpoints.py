@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from directory_manager import get_directory_size, get_workspace_manager
+from logger_utils import append_to_log
+from processing_config import get_processing_setting
+
+# Separated chunks of long jobs are saved here (outside the per-job workspace,
+# which is deleted when the job ends), so a crashed or cancelled job can resume.
+CHECKPOINT_DIRNAME = "rian_checkpoints"
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+DEFAULT_CHECKPOINT_MIN_SECONDS = 600.0  # Shorter inputs are cheap enough to redo
+DEFAULT_CHECKPOINT_MAX_AGE_DAYS = 7.0   # Abandoned checkpoints are removed after this
+
+_root = None
+_root_lock = threading.Lock()
+
+
+def _fsync_write(path, write):
+    """Write a file via 'write(file)' so it is either complete and on disk or absent."""
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "wb") as temp_file:
+        write(temp_file)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+
+
+def hash_waveform(wav):
+    """SHA-256 of the decoded samples: identifies the input independently of file names."""
+    digest = hashlib.sha256()
+    digest.update(str(tuple(wav.shape)).encode("ascii"))
+    digest.update(wav.contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def gc_checkpoints(root, max_age_days=None):
+    """Remove checkpoints not touched for 'max_age_days'. Returns the bytes reclaimed."""
+    if max_age_days is None:
+        max_age_days = float(get_processing_setting("checkpoint_max_age_days", DEFAULT_CHECKPOINT_MAX_AGE_DAYS))
+    cutoff = time.time() - max_age_days * 86400
+    reclaimed = 0
+    for entry in Path(root).iterdir():
+        manifest = entry / MANIFEST_FILENAME
+        try:
+            last_used = (manifest if manifest.exists() else entry).stat().st_mtime
+        except OSError:
+            continue
+        if entry.is_dir() and last_used < cutoff:
+            size = get_directory_size(entry)
+            shutil.rmtree(entry, ignore_errors=True)
+            reclaimed += size
+            append_to_log(f"Removed stale separation checkpoint {entry} ({size / 1024 / 1024:.1f} MB).")
+    return reclaimed
+
+
+def get_checkpoint_root():
+    """The checkpoint directory ('checkpoint_dir' setting or next to the workspaces); GC'd on first use."""
+    global _root
+    with _root_lock:
+        if _root is None:
+            configured = get_processing_setting("checkpoint_dir")
+            _root = Path(configured) if configured else get_workspace_manager().root / CHECKPOINT_DIRNAME
+            _root.mkdir(parents=True, exist_ok=True)
+            gc_checkpoints(_root)
+        return _root
+
+
+class SeparationCheckpoint:
+    """
+    Durable record of a separation in progress: a manifest with the input hash,
+    model and chunking parameters, plus one file per completed chunk holding the
+    model output for that chunk. Chunks are written before the manifest counts
+    them, so after a crash every chunk the manifest lists is complete.
+    """
+    def __init__(self, directory, manifest):
+        self.directory = Path(directory)
+        self.manifest = manifest
+
+    @classmethod
+    def open(cls, wav, params, root=None):
+        """
+        Open (or start) the checkpoint for separating 'wav' with 'params' (model,
+        samplerate and chunking settings). A matching earlier run is resumed.
+        """
+        input_hash = hash_waveform(wav)
+        params = dict(sorted(params.items()))
+        key = hashlib.sha256(f"{input_hash}:{json.dumps(params)}".encode("utf-8")).hexdigest()[:32]
+        directory = Path(root or get_checkpoint_root()) / key
+        manifest_path = directory / MANIFEST_FILENAME
+        try:
+            with open(manifest_path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            if (manifest.get("version") == MANIFEST_VERSION and manifest.get("input_hash") == input_hash
+                    and manifest.get("params") == params):
+                checkpoint = cls(directory, manifest)
+                if checkpoint.completed_chunks:
+                    append_to_log(f"Resuming separation from checkpoint {directory} "
+                                  f"({len(checkpoint.completed_chunks)} chunk(s) already done).")
+                return checkpoint
+            append_to_log(f"Checkpoint {directory} does not match this job; starting over.")
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            append_to_log(f"Unreadable checkpoint manifest {manifest_path}: {e}; starting over.")
+
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir(parents=True, exist_ok=True)
+        checkpoint = cls(directory, {
+            "version": MANIFEST_VERSION,
+            "input_hash": input_hash,
+            "params": params,
+            "total_length": int(wav.shape[-1]),
+            "completed": {},
+            "created_at": datetime.now().isoformat(),
+        })
+        checkpoint._write_manifest()
+        return checkpoint
+
+    @property
+    def completed_chunks(self):
+        return self.manifest["completed"]
+
+    def _chunk_path(self, start, end):
+        return self.directory / f"chunk_{start:012d}_{end:012d}.pt"
+
+    def _write_manifest(self):
+        self.manifest["updated_at"] = datetime.now().isoformat()
+        data = json.dumps(self.manifest, indent=2).encode("utf-8")
+        _fsync_write(self.directory / MANIFEST_FILENAME, lambda manifest_file: manifest_file.write(data))
+
+    def load_chunk(self, torch, start, end):
+        """The saved output for a chunk, or None if it was not completed (or is unreadable)."""
+        if f"{start}:{end}" not in self.completed_chunks:
+            return None
+        try:
+            return torch.load(str(self._chunk_path(start, end)))
+        except Exception as e:
+            append_to_log(f"Could not read checkpointed chunk {start}:{end}: {e}; recomputing it.")
+            return None
+
+    def save_chunk(self, torch, start, end, chunk_sources):
+        """Persist a chunk's output, then record it in the manifest."""
+        chunk_path = self._chunk_path(start, end)
+        _fsync_write(chunk_path, lambda chunk_file: torch.save(chunk_sources.contiguous().clone(), chunk_file))
+        self.completed_chunks[f"{start}:{end}"] = chunk_path.name
+        self._write_manifest()
+
+    def discard(self):
+        """Delete the checkpoint once its result has been written out."""
+        shutil.rmtree(self.directory, ignore_errors=True)
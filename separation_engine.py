@@ -0,0 +1,318 @@
+import re
+import subprocess
+import threading
+import time
+import wave
+from pathlib import Path
+
+from bag_parallel import get_bag_pool, parallel_bag_enabled
+from cancellation import raise_if_cancelled, run_cancellable
+from logger_utils import append_to_log
+from machine_profile import apply_thread_settings
+from metrics_utils import record_stage, register_gauge
+from processing_config import get_processing_setting
+from weight_cache import load_weight_cache, save_weight_cache, weight_cache_enabled
+
+DEFAULT_MODEL_NAME = "mdx_extra_q"
+# Audio is separated in chunks of this length so a job can stop (and report
+# progress) between chunks; neighbouring chunks are crossfaded over the overlap.
+DEFAULT_CHUNK_SECONDS = 30.0
+DEFAULT_CHUNK_OVERLAP_SECONDS = 1.0
+
+_model_cache = {}
+_model_cache_lock = threading.Lock()
+
+register_gauge("rian_resident_models", "Separation models loaded in memory.", lambda: len(_model_cache))
+
+
+def import_demucs():
+    """Import the Demucs pieces we need, with the same error the CLI path used to raise."""
+    try:
+        import torch
+        from demucs.apply import apply_model
+        from demucs.pretrained import get_model
+    except ImportError:
+        raise RuntimeError(
+            "Demucs is not installed or failed to import. "
+            "Please ensure 'demucs' is installed in your environment."
+        )
+    return torch, apply_model, get_model
+
+
+def load_separation_model(model_name=DEFAULT_MODEL_NAME):
+    """
+    Load a pretrained Demucs model (or bag of models), caching it for later jobs.
+    Cold loads come from the memory-mapped weight cache when it holds the model;
+    otherwise from the Demucs checkpoint, after which the weight cache is filled.
+    """
+    torch, _, get_model = import_demucs()
+    apply_thread_settings(torch)
+    with _model_cache_lock:
+        model = _model_cache.get(model_name)
+        if model is None:
+            use_weight_cache = weight_cache_enabled()
+            source = "weight_cache"
+            started = time.perf_counter()
+            model = load_weight_cache(model_name) if use_weight_cache else None
+            if model is None:
+                source = "checkpoint"
+                started = time.perf_counter()
+                model = get_model(model_name)
+            elapsed = time.perf_counter() - started
+            # Cold-load breakdown: 'model_load_checkpoint' (deserialize + dequantize)
+            # versus 'model_load_weight_cache' (memory-mapped); warm loads skip both.
+            record_stage(f"model_load_{source}", elapsed)
+            if source == "checkpoint" and use_weight_cache:
+                try:
+                    save_weight_cache(model_name, model)
+                except Exception as e:
+                    append_to_log(f"Could not write the weight cache for '{model_name}': {e}")
+            model.cpu()
+            model.eval()
+            _model_cache[model_name] = model
+            append_to_log(f"Loaded separation model '{model_name}' from the "
+                          f"{source.replace('_', ' ')} in {elapsed:.2f}s.")
+        return model
+
+
+def cached_model_names():
+    """Names of the models currently loaded."""
+    with _model_cache_lock:
+        return sorted(_model_cache)
+
+
+def cached_model_name(model):
+    """Name under which 'model' was loaded by load_separation_model, or None."""
+    with _model_cache_lock:
+        return next((name for name, cached in _model_cache.items() if cached is model), None)
+
+
+def bag_size(model_name):
+    """Number of models in a loaded bag of models (1 for single models or models not loaded)."""
+    with _model_cache_lock:
+        model = _model_cache.get(model_name)
+    return max(1, len(getattr(model, "models", ())))
+
+
+def resident_model_bytes():
+    """Approximate memory held by the cached models' weights."""
+    with _model_cache_lock:
+        models = list(_model_cache.values())
+    return sum(param.numel() * param.element_size() for model in models for param in model.parameters())
+
+
+def probe_duration(ffmpeg_path, media_path):
+    """Duration in seconds from FFmpeg's input banner, or None if it cannot be read."""
+    try:
+        result = subprocess.run(
+            [ffmpeg_path, "-hide_banner", "-i", str(media_path)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace",
+        )
+    except OSError as e:
+        append_to_log(f"Could not probe duration of {media_path}: {e}")
+        return None
+    match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _read_pcm_wav(audio_path, samplerate, channels):
+    """
+    Samples ([channels, samples] float32) of a 16-bit PCM WAV that is already at
+    'samplerate' with 'channels' channels (or mono, which is duplicated as FFmpeg's
+    upmix does), read without FFmpeg. None if the file needs converting.
+    """
+    import numpy as np
+    if Path(audio_path).suffix.lower() != ".wav":
+        return None
+    try:
+        with wave.open(str(audio_path), "rb") as wav_file:
+            file_channels = wav_file.getnchannels()
+            if (wav_file.getsampwidth() != 2 or wav_file.getframerate() != samplerate
+                    or file_channels not in (1, channels)):
+                return None
+            data = wav_file.readframes(wav_file.getnframes())
+    except (wave.Error, EOFError):
+        return None  # E.g. float or extensible WAV: FFmpeg reads those
+    samples = np.frombuffer(data, dtype="<i2")
+    samples = samples[: samples.size - samples.size % file_channels].reshape(-1, file_channels).T
+    samples = samples.astype(np.float32) / 32768.0
+    if file_channels != channels:
+        samples = np.repeat(samples, channels, axis=0)
+    return np.ascontiguousarray(samples)
+
+
+def read_audio(ffmpeg_path, audio_path, samplerate, channels, cancel_event=None):
+    """
+    Decode any audio/video file to a float32 tensor of shape [channels, samples]
+    by piping raw PCM out of FFmpeg. 16-bit PCM WAV files that need no resampling
+    are read directly.
+    """
+    torch, _, _ = import_demucs()
+    import numpy as np
+
+    samples = _read_pcm_wav(audio_path, samplerate, channels)
+    if samples is not None:
+        if samples.size == 0:
+            raise RuntimeError(f"No audio samples decoded from {audio_path}.")
+        return torch.from_numpy(samples)
+
+    command = [
+        ffmpeg_path,
+        "-i", str(audio_path),
+        "-vn",
+        "-f", "f32le",
+        "-ac", str(channels),
+        "-ar", str(samplerate),
+        "-",
+    ]
+    result = run_cancellable(command, cancel_event, stage="audio decoding")
+    samples = np.frombuffer(result.stdout, dtype=np.float32)
+    if samples.size == 0:
+        raise RuntimeError(f"No audio samples decoded from {audio_path}.")
+    samples = samples[: samples.size - samples.size % channels]
+    return torch.from_numpy(samples.reshape(-1, channels).T.copy())
+
+
+def iter_chunks(total_length, chunk_length, overlap_length):
+    """Yield (start, end) sample ranges covering 'total_length' with the given overlap."""
+    stride = max(1, chunk_length - overlap_length)
+    start = 0
+    while True:
+        end = min(total_length, start + chunk_length)
+        yield start, end
+        if end >= total_length:
+            break
+        start += stride
+
+
+def crossfade_weights(torch, start, end, total_length, overlap_length):
+    """
+    Linear fade-in/fade-out weights for a chunk, so overlapping chunks sum to unity
+    after normalisation by the accumulated weight.
+    """
+    length = end - start
+    weights = torch.ones(length)
+    fade = min(overlap_length, length)
+    if fade > 1:
+        if start > 0:
+            weights[:fade] = torch.linspace(0.0, 1.0, fade + 2)[1:-1]
+        if end < total_length:
+            weights[-fade:] = torch.linspace(1.0, 0.0, fade + 2)[1:-1]
+    return weights
+
+
+def resolve_chunking(chunk_seconds=None, overlap_seconds=None):
+    """Chunk length and crossfade overlap in seconds, falling back to the settings/defaults."""
+    if chunk_seconds is None:
+        chunk_seconds = float(get_processing_setting("chunk_seconds", DEFAULT_CHUNK_SECONDS))
+    if overlap_seconds is None:
+        overlap_seconds = float(get_processing_setting("chunk_overlap_seconds", DEFAULT_CHUNK_OVERLAP_SECONDS))
+    return chunk_seconds, overlap_seconds
+
+
+def _cached_sources(torch, model, vocals, rest):
+    """
+    Expand stored vocals/rest stems into the model's source layout: the rest goes
+    into the first non-vocal source, so to_two_stems() gives back both stems.
+    """
+    sources = torch.zeros(len(model.sources), *vocals.shape)
+    sources[model.sources.index("vocals")] = vocals
+    sources[next(i for i, name in enumerate(model.sources) if name != "vocals")] = rest
+    return sources
+
+
+def separate_waveform(model, wav, chunk_seconds=None, overlap_seconds=None, shifts=1, overlap=0.25,
+                      cancel_event=None, progress_callback=None, checkpoint=None, dedup=None, parallel_bag=None):
+    """
+    Separate a [channels, samples] waveform with 'model', chunk by chunk.
+    Cancellation is checked at every chunk boundary and progress (0-100) is
+    reported after each chunk. With a SeparationCheckpoint, completed chunks are
+    saved as they finish and chunks saved by an earlier run are reused. With a
+    DedupSession, ranges matching previously separated audio reuse its stems and
+    only the gaps between them go through the model. With 'parallel_bag' (default:
+    the 'parallel_bag' setting), the members of a bag of models run concurrently
+    in worker processes (see bag_parallel) and are combined with the same weights.
+    Returns a dict of source name -> [channels, samples] tensor.
+    """
+    torch, apply_model, _ = import_demucs()
+    chunk_seconds, overlap_seconds = resolve_chunking(chunk_seconds, overlap_seconds)
+
+    # Same normalisation as 'demucs.separate'
+    ref = wav.mean(0)
+    ref_mean, ref_std = ref.mean(), ref.std() + 1e-8
+    mix = (wav - ref_mean) / ref_std
+
+    total_length = mix.shape[-1]
+    chunk_length = max(1, int(chunk_seconds * model.samplerate))
+    overlap_length = min(int(overlap_seconds * model.samplerate), chunk_length // 2)
+
+    output = torch.zeros(len(model.sources), mix.shape[0], total_length)
+    weight_total = torch.zeros(total_length)
+
+    # Reused ranges are crossfaded with the model output around them like any chunk
+    matches = dedup.find_matches(torch, wav) if dedup and "vocals" in model.sources else []
+    gaps, position = [], 0
+    for start, end, vocals, rest in matches:
+        cached = (_cached_sources(torch, model, vocals, rest) - ref_mean) / ref_std
+        weights = crossfade_weights(torch, start, end, total_length, overlap_length)
+        output[..., start:end] += cached * weights
+        weight_total[start:end] += weights
+        if start > position:
+            gaps.append((position, start))
+        position = end
+    if position < total_length:
+        gaps.append((position, total_length))
+
+    chunks = []
+    for gap_start, gap_end in gaps:
+        gap_start = max(0, gap_start - overlap_length if gap_start else 0)
+        gap_end = min(total_length, gap_end + overlap_length)
+        chunks.extend((gap_start + start, gap_start + end)
+                      for start, end in iter_chunks(gap_end - gap_start, chunk_length, overlap_length))
+
+    bag_pool = None
+    model_name = cached_model_name(model)
+    if chunks and model_name and parallel_bag_enabled({"parallel_bag": parallel_bag}):
+        bag_pool = get_bag_pool(model_name, model, mix.shape[0], chunk_length)
+
+    with torch.no_grad():
+        for index, (start, end) in enumerate(chunks):
+            raise_if_cancelled(cancel_event, "separation")
+            chunk_sources = checkpoint.load_chunk(torch, start, end) if checkpoint else None
+            if chunk_sources is None:
+                if bag_pool is not None:
+                    chunk_sources = bag_pool.apply(mix[:, start:end], shifts, overlap)
+                else:
+                    chunk_sources = apply_model(
+                        model, mix[None, :, start:end], shifts=shifts, split=True, overlap=overlap, progress=False
+                    )[0]
+                if checkpoint:
+                    checkpoint.save_chunk(torch, start, end, chunk_sources)
+            weights = crossfade_weights(torch, start, end, total_length, overlap_length)
+            output[..., start:end] += chunk_sources * weights
+            weight_total[start:end] += weights
+            if progress_callback:
+                progress_callback(100.0 * (index + 1) / len(chunks))
+
+    output /= weight_total.clamp(min=1e-8)
+    output = output * ref_std + ref_mean
+    sources = {name: output[i] for i, name in enumerate(model.sources)}
+    if dedup and "vocals" in model.sources:
+        dedup.remember(*to_two_stems(sources, "vocals"))
+    return sources
+
+
+def to_two_stems(sources, stem="vocals"):
+    """Collapse separated sources into (stem, everything else), like '--two-stems'."""
+    selected = sources[stem]
+    rest = sum(tensor for name, tensor in sources.items() if name != stem)
+    return selected, rest
+
+
+def save_stem(tensor, path, samplerate):
+    """Write a stem as 16-bit WAV, rescaling to avoid clipping (Demucs CLI defaults)."""
+    from demucs.audio import save_audio
+    save_audio(tensor, str(path), samplerate=samplerate, clip="rescale", bits_per_sample=16)
@@ -0,0 +1,49 @@
+from machine_profile import machine_setting
+from processing_config import get_processing_setting
+
+# Named quality/speed trade-offs: separation_options for process_video.
+# 'balanced' is what the tool always ran (the four-model mdx_extra_q bag);
+# 'fast' uses a single hybrid model without shift averaging, 'best' the
+# fine-tuned hybrid bag with two random shifts.
+SEPARATION_PRESETS = {
+    "fast": {"model": "htdemucs", "shifts": 0, "overlap": 0.1},
+    "balanced": {"model": "mdx_extra_q", "shifts": 1, "overlap": 0.25},
+    "best": {"model": "htdemucs_ft", "shifts": 2, "overlap": 0.25},
+}
+PRESET_NAMES = tuple(SEPARATION_PRESETS)
+DEFAULT_PRESET = "balanced"
+
+
+def get_default_preset():
+    """The 'separation_preset' setting, or None to use the machine profile / built-in defaults."""
+    preset = get_processing_setting("separation_preset")
+    return preset if preset in SEPARATION_PRESETS else None
+
+
+def preset_options(preset=None):
+    """
+    separation_options for a preset name. Without a name the configured default
+    preset is used; with none configured, {} (machine profile / defaults apply).
+    """
+    preset = preset or get_default_preset()
+    if preset is None:
+        return {}
+    if preset not in SEPARATION_PRESETS:
+        raise ValueError(f"Unknown separation preset '{preset}'. Choose one of: {', '.join(PRESET_NAMES)}.")
+    return dict(SEPARATION_PRESETS[preset])
+
+
+def preset_benchmark(preset):
+    """Measured {'rtf': ..., 'vocals_si_sdr': ...} for a preset on this machine, or None."""
+    return (machine_setting("presets") or {}).get(preset)
+
+
+def describe_preset(preset):
+    """One-line description with the measured speed, e.g. for the GUI and the CLI."""
+    options = SEPARATION_PRESETS[preset]
+    benchmark = preset_benchmark(preset)
+    if benchmark:
+        speed = f"{benchmark['rtf']:.2f}x real time (~{benchmark['rtf'] * 60:.0f}s per minute of audio)"
+    else:
+        speed = "not benchmarked (run 'python autotune.py --presets')"
+    return f"{preset}: {options['model']}, {options['shifts']} shift(s) - {speed}"
@@ -0,0 +1,407 @@
+import os
+import hmac
+import json
+import queue
+import shutil
+import secrets
+import argparse
+import threading
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from cancellation import JobCancelled
+from job_manager import JobManager, JOB_DONE_STATUSES
+from logger_utils import LOG_FILE, append_to_log
+from metrics_utils import add_stage_timings, record_stage_timings
+from processing_config import get_processing_setting
+
+# Optional long-lived process that keeps models loaded and runs separations for
+# the GUI, the batch API and the CLI. Clients talk to it over localhost HTTP and
+# fall back to separating in-process when it is not running.
+# Every request must carry the random token the running service writes (owner-
+# readable only) to SERVICE_TOKEN_FILE; browsers (Origin header), non-loopback
+# Host names and non-JSON bodies are refused, and the service only writes
+# inside the workspace directories.
+DEFAULT_SERVICE_PORT = 47615
+SERVICE_HOST = "127.0.0.1"
+SERVICE_TOKEN_FILE = Path(LOG_FILE).parent / "rian_service_token"
+TOKEN_HEADER = "X-Rian-Service-Token"
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost")
+CONNECT_TIMEOUT_SECONDS = 2.0
+JOB_KIND = "Service"
+
+
+class ServiceUnavailable(Exception):
+    """The separation service is disabled, not running or went away mid-job."""
+
+
+def get_service_port():
+    """'separation_service_port' setting; 0 disables the service for clients."""
+    return int(get_processing_setting("separation_service_port", DEFAULT_SERVICE_PORT))
+
+
+def read_service_token():
+    """Token of the running service, or None if no service has written one."""
+    try:
+        return SERVICE_TOKEN_FILE.read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def _write_service_token():
+    """Write a fresh random token, readable by this user only. Returns it."""
+    token = secrets.token_urlsafe(32)
+    temp_path = SERVICE_TOKEN_FILE.with_suffix(".tmp")
+    if temp_path.exists():
+        temp_path.unlink()
+    descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, "w", encoding="utf-8") as token_file:
+        token_file.write(token)
+    os.replace(temp_path, SERVICE_TOKEN_FILE)
+    return token
+
+
+def _within_workspace(path):
+    """Whether 'path' lies inside one of the workspace roots (disk or RAM disk)."""
+    from directory_manager import get_workspace_manager
+    manager = get_workspace_manager()
+    resolved = Path(path).resolve()
+    for root in filter(None, [manager.root, manager.ram_root]):
+        try:
+            resolved.relative_to(Path(root).resolve())
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+############################################################################
+#                             SERVER
+############################################################################
+
+
+class _ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health          -> {"status": "ok", "pid": ..., "models": [...], "jobs": ...}
+    POST /separate        -> newline-delimited JSON events for one job:
+                             {"job_id"}, {"progress"}..., then {"result"} or {"error"}
+    POST /cancel/<job_id> -> {"cancelled": true|false}
+    """
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self, require_json=False):
+        """Check the request's origin, Host, token (and Content-Type); answer it with an error if refused."""
+        host = (self.headers.get("Host") or "").rsplit(":", 1)[0]
+        token = self.headers.get(TOKEN_HEADER) or ""
+        if self.headers.get("Origin") is not None or host not in LOOPBACK_HOSTS:
+            self._send_json({"error": "forbidden"}, status=403)
+        elif not hmac.compare_digest(token.encode("utf-8"), self.server.token.encode("utf-8")):
+            self._send_json({"error": "missing or invalid token"}, status=401)
+        elif require_json and self.headers.get_content_type() != "application/json":
+            self._send_json({"error": "Content-Type must be application/json"}, status=415)
+        else:
+            return True
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        from separation_engine import cached_model_names
+        self._send_json({
+            "status": "ok",
+            "pid": os.getpid(),
+            "models": cached_model_names(),
+            "jobs": len(self.server.service.active_jobs),
+        })
+
+    def do_POST(self):
+        if not self._authorized(require_json=True):
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json({"error": "invalid JSON"}, status=400)
+            return
+
+        if self.path.startswith("/cancel/"):
+            self._send_json({"cancelled": self.server.service.cancel(self.path[len("/cancel/"):])})
+        elif self.path == "/separate":
+            self._stream_job(request)
+        else:
+            self.send_error(404)
+
+    def _stream_job(self, request):
+        if not request.get("audio_path") or not request.get("temp_dir"):
+            self._send_json({"error": "audio_path and temp_dir are required"}, status=400)
+            return
+        if not all(_within_workspace(request[key]) for key in ("temp_dir", "asr_path") if request.get(key)):
+            self._send_json({"error": "temp_dir and asr_path must be inside the workspace directory"}, status=403)
+            return
+        service = self.server.service
+        job, events = service.submit(request)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._write_event({"job_id": job.job_id})
+            while True:
+                try:
+                    event = events.get(timeout=1.0)
+                except queue.Empty:
+                    if job.status not in JOB_DONE_STATUSES:
+                        continue
+                    # Cancelled while still queued: the job never ran
+                    event = {"error": "Job cancelled.", "cancelled": True}
+                self._write_event(event)
+                if "result" in event or "error" in event:
+                    break
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away: nobody wants the result any more
+            service.cancel(job.job_id)
+        finally:
+            service.forget(job.job_id)
+
+    def _write_event(self, event):
+        line = (json.dumps(event) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass  # Jobs are logged through append_to_log
+
+
+class SeparationService:
+    """
+    Runs separation requests on its own JobManager worker pool, with models kept
+    warm across requests. Each request gets a queue of events that the HTTP
+    handler streams back to the client.
+    """
+    def __init__(self, workers=1, preload_models=()):
+        self.job_manager = JobManager(workers)
+        self.active_jobs = {}
+        if preload_models:
+            from separation_engine import load_separation_model
+            for model_name in preload_models:
+                load_separation_model(model_name)
+
+    def submit(self, request):
+        """Queue a separation; returns the Job and the queue its events are put on."""
+        events = queue.Queue()
+        job = self.job_manager.submit(JOB_KIND, os.path.basename(request["audio_path"]), self._run, request, events)
+        self.active_jobs[job.job_id] = job
+        return job, events
+
+    def cancel(self, job_id):
+        try:
+            job_id = int(job_id)
+        except ValueError:
+            return False
+        return job_id in self.active_jobs and self.job_manager.cancel(job_id)
+
+    def forget(self, job_id):
+        """Drop a job whose result was delivered (or abandoned)."""
+        self.active_jobs.pop(job_id, None)
+        self.job_manager.clear_finished()
+        self.job_manager.drain_updates()  # No UI drains them here
+
+    def _run(self, request, events, status):
+        from video_processor import separate_audio_in_process
+        report = {}
+        try:
+            with record_stage_timings() as stage_seconds:
+                vocals_path, noise_path, _ = separate_audio_in_process(
+                    request["audio_path"],
+                    request["temp_dir"],
+                    cancel_event=status.cancel_event,
+                    progress_callback=lambda percent: events.put({"progress": percent}),
+                    separation_options=request.get("separation_options"),
+                    report=report,
+                    asr_path=request.get("asr_path"),
+                    write_stems=request.get("write_stems", True),
+                )
+            events.put({"result": {"vocals_path": vocals_path and str(vocals_path),
+                                   "noise_path": noise_path and str(noise_path), "report": report,
+                                   "stage_seconds": stage_seconds}})
+        except JobCancelled as e:
+            events.put({"error": str(e), "cancelled": True})
+            raise
+        except Exception as e:
+            events.put({"error": str(e)})
+            raise
+
+
+def serve(port=None, workers=None, preload_models=()):
+    """Run the separation service in the foreground until interrupted."""
+    port = port or get_service_port() or DEFAULT_SERVICE_PORT
+    workers = workers or int(
+        get_processing_setting("max_concurrent_jobs", 1))
+    server = ThreadingHTTPServer((SERVICE_HOST, port), _ServiceRequestHandler)
+    server.daemon_threads = True
+    server.token = _write_service_token()
+    server.service = SeparationService(workers, preload_models)
+    append_to_log(f"Separation service listening on http://{SERVICE_HOST}:{port} with {workers} worker(s).")
+    print(f"Separation service listening on http://{SERVICE_HOST}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.job_manager.cancel_all()
+        if read_service_token() == server.token:
+            SERVICE_TOKEN_FILE.unlink(missing_ok=True)
+
+
+############################################################################
+#                             CLIENT
+############################################################################
+
+
+def service_status(port=None, timeout=CONNECT_TIMEOUT_SECONDS):
+    """The service's /health answer, or None if it is disabled or not running."""
+    port = port if port is not None else get_service_port()
+    token = read_service_token()
+    if not port or not token:
+        return None
+    connection = http.client.HTTPConnection(SERVICE_HOST, port, timeout=timeout)
+    try:
+        connection.request("GET", "/health", headers={TOKEN_HEADER: token})
+        response = connection.getresponse()
+        return json.loads(response.read()) if response.status == 200 else None
+    except (OSError, ValueError):
+        return None
+    finally:
+        connection.close()
+
+
+def _request_headers(token):
+    return {"Content-Type": "application/json", TOKEN_HEADER: token}
+
+
+def _post_cancel(port, token, job_id):
+    connection = http.client.HTTPConnection(SERVICE_HOST, port, timeout=CONNECT_TIMEOUT_SECONDS)
+    try:
+        connection.request("POST", f"/cancel/{job_id}", body=b"{}", headers=_request_headers(token))
+        connection.getresponse().read()
+    except OSError as e:
+        append_to_log(f"Could not cancel service job {job_id}: {e}")
+    finally:
+        connection.close()
+
+
+def separate_via_service(audio_path, temp_dir, cancel_event=None, progress_callback=None,
+                         separation_options=None, port=None, report=None, asr_path=None, write_stems=True):
+    """
+    Run one separation on the service and return (vocals_path, noise_path).
+    Progress is forwarded to 'progress_callback'; setting 'cancel_event' cancels
+    the remote job and raises JobCancelled. Raises ServiceUnavailable if the
+    service cannot be reached (or drops the connection, or rejects our token),
+    so the caller can fall back to in-process separation, and RuntimeError if
+    the job itself failed or its ASR output cannot be collected.
+    The job's statistics are added to 'report' (a dict), if given. 'asr_path' and
+    'write_stems' select the outputs as for video_processor.separate_audio (the
+    service writes the ASR file into 'temp_dir'; it is moved to 'asr_path' here).
+    """
+    port = port if port is not None else get_service_port()
+    if not port:
+        raise ServiceUnavailable("Separation service is disabled.")
+    token = read_service_token()
+    if not token:
+        raise ServiceUnavailable("Separation service is not running.")
+    service_asr_path = Path(temp_dir) / f"service_{Path(asr_path).name}" if asr_path else None
+    body = json.dumps({
+        "audio_path": str(audio_path),
+        "temp_dir": str(temp_dir),
+        "separation_options": separation_options or {},
+        "asr_path": str(service_asr_path) if asr_path else None,
+        "write_stems": write_stems,
+    }).encode("utf-8")
+
+    connection = http.client.HTTPConnection(SERVICE_HOST, port, timeout=CONNECT_TIMEOUT_SECONDS)
+    try:
+        connection.request("POST", "/separate", body=body, headers=_request_headers(token))
+        response = connection.getresponse()
+    except (OSError, http.client.HTTPException) as e:
+        connection.close()
+        raise ServiceUnavailable(f"Separation service not reachable on port {port}: {e}")
+    if response.status != 200:
+        message = response.read().decode("utf-8", "replace")
+        connection.close()
+        if response.status == 401:
+            # The token is from an earlier service run, or a different service holds the port
+            raise ServiceUnavailable(f"Separation service rejected our token: {message}")
+        raise RuntimeError(f"Separation service rejected the job ({response.status}): {message}")
+    connection.sock.settimeout(None)  # Separation can take a long time between events
+
+    job_id = None
+    done = threading.Event()
+
+    def watch_cancel():
+        while not done.is_set():
+            if cancel_event.wait(0.25):
+                if job_id is not None:
+                    _post_cancel(port, token, job_id)
+                return
+
+    if cancel_event is not None:
+        threading.Thread(target=watch_cancel, daemon=True, name="service-cancel").start()
+    try:
+        for line in response:
+            event = json.loads(line)
+            if "job_id" in event:
+                job_id = event["job_id"]
+                if cancel_event is not None and cancel_event.is_set():
+                    _post_cancel(port, token, job_id)
+            elif "progress" in event:
+                if progress_callback:
+                    progress_callback(event["progress"])
+            elif "result" in event:
+                result = event["result"]
+                break
+            elif "error" in event:
+                if event.get("cancelled"):
+                    raise JobCancelled(event["error"])
+                raise RuntimeError(event["error"])
+        else:
+            raise ServiceUnavailable("Separation service closed the connection before the job finished.")
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        raise ServiceUnavailable(f"Lost connection to the separation service: {e}")
+    finally:
+        done.set()
+        connection.close()
+
+    # The separation is done; failing to collect its output is not a reason to redo it
+    add_stage_timings(result.get("stage_seconds"))  # Timed in the service process
+    if report is not None:
+        report.update(result.get("report") or {})
+    if asr_path:
+        try:
+            shutil.move(str(service_asr_path), str(asr_path))
+        except OSError as e:
+            raise RuntimeError(f"Could not move the ASR output to {asr_path}: {e}")
+    return result["vocals_path"], result["noise_path"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep separation models warm and serve jobs on localhost.")
+    parser.add_argument("--port", type=int, default=None, help=f"Default: {DEFAULT_SERVICE_PORT}")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent separations")
+    parser.add_argument("--preload", nargs="*", default=[], help="Models to load at startup")
+    args = parser.parse_args()
+    serve(args.port, args.workers, args.preload)
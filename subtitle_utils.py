@@ -0,0 +1,77 @@
+import re
+
+# "00:01:02.345 --> 00:01:04.000 align:start position:0%" (hours are optional in WebVTT)
+VTT_TIMING_RE = re.compile(
+    r"^\s*((?:\d+:)?\d{1,2}:\d{2}\.\d{3})\s+-->\s+((?:\d+:)?\d{1,2}:\d{2}\.\d{3})"
+)
+# Inline tags: <c>, </c>, <c.colorE5E5E5>, <00:00:01.234>, <v Speaker>, <b>, ...
+VTT_TAG_RE = re.compile(r"<[^>]*>")
+
+
+def _vtt_to_srt_timestamp(timestamp):
+    """'01:02.345' or '00:01:02.345' -> '00:01:02,345'."""
+    parts = timestamp.split(":")
+    if len(parts) == 2:
+        parts.insert(0, "00")
+    hours, minutes, seconds = parts
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds.replace('.', ',')}"
+
+
+def _vtt_seconds(timestamp):
+    """'01:02.345' or '00:01:02.345' -> seconds."""
+    seconds = 0.0
+    for part in timestamp.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def _unescape(text):
+    return (text.replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">")
+            .replace("&nbsp;", " ").replace("&lrm;", "").replace("&rlm;", ""))
+
+
+def vtt_to_srt(vtt_text, rolling=False):
+    """
+    Convert WebVTT subtitle text to SRT text in-process.
+    Drops the header, NOTE/STYLE/REGION blocks, cue settings and inline tags.
+    With 'rolling' (YouTube auto-captions), the repeated "rolling" lines are
+    collapsed so each line of speech appears once: a cue that starts where the
+    previous one ends loses the leading lines that repeat that cue's lines.
+    Uploaded subtitles are converted as they are, repeated lines included.
+    """
+    cues = []
+    previous_lines = []
+    previous_end = None
+    for block in re.split(r"(?:\r?\n){2,}", vtt_text.lstrip("\ufeff")):
+        lines = block.strip().splitlines()
+        timing_index = next((i for i, line in enumerate(lines) if VTT_TIMING_RE.match(line)), None)
+        if timing_index is None:
+            continue  # WEBVTT header, NOTE, STYLE, REGION, ...
+
+        match = VTT_TIMING_RE.match(lines[timing_index])
+        text_lines = [_unescape(VTT_TAG_RE.sub("", line)).strip() for line in lines[timing_index + 1:]]
+        text_lines = [line for line in text_lines if line]
+
+        # Rolling auto-captions repeat the previous cue's last line first; keep only new lines
+        new_lines = text_lines
+        if rolling and previous_end is not None and _vtt_seconds(match.group(1)) <= previous_end:
+            repeated = 0
+            while repeated < len(text_lines) and text_lines[repeated] in previous_lines:
+                repeated += 1
+            new_lines = text_lines[repeated:]
+        if text_lines:
+            previous_lines = text_lines
+            previous_end = _vtt_seconds(match.group(2))
+        if not new_lines:
+            continue
+
+        cues.append((
+            _vtt_to_srt_timestamp(match.group(1)),
+            _vtt_to_srt_timestamp(match.group(2)),
+            "\n".join(new_lines),
+        ))
+
+    return "".join(
+        f"{index}\n{start} --> {end}\n{text}\n\n"
+        for index, (start, end, text) in enumerate(cues, start=1)
+    )
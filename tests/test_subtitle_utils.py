@@ -0,0 +1,29 @@
+from subtitle_utils import vtt_to_srt
+
+
+def test_repeated_manual_cues_are_kept():
+    vtt = (
+        "WEBVTT\n\n"
+        "00:00:01.000 --> 00:00:02.000\n[Music]\n\n"
+        "00:00:02.000 --> 00:00:03.000\n[Music]\n\n"
+        "00:00:05.000 --> 00:00:06.000\nNo.\n\n"
+        "00:00:07.000 --> 00:00:08.000\nNo.\n"
+    )
+    srt = vtt_to_srt(vtt)
+    assert srt.count("[Music]") == 2
+    assert srt.count("No.") == 2
+    assert srt.startswith("1\n00:00:01,000 --> 00:00:02,000\n[Music]\n\n2\n")
+
+
+def test_rolling_auto_captions_are_collapsed():
+    vtt = (
+        "WEBVTT\nKind: captions\n\n"
+        "00:00:00.000 --> 00:00:02.500 align:start position:0%\nhello<00:00:01.000><c> there</c>\n\n"
+        "00:00:02.500 --> 00:00:02.510 align:start position:0%\nhello there\n\n"
+        "00:00:02.510 --> 00:00:05.000 align:start position:0%\nhello there\nhow are<c> you</c>\n"
+    )
+    srt = vtt_to_srt(vtt, rolling=True)
+    assert srt == (
+        "1\n00:00:00,000 --> 00:00:02,500\nhello there\n\n"
+        "2\n00:00:02,510 --> 00:00:05,000\nhow are you\n\n"
+    )
@@ -0,0 +1,126 @@
+import re
+import wave
+
+from processing_config import get_processing_setting
+
+# Processing only parts of a recording: ranges are given as "start-end" pairs
+# such as "1:30-2:45, 1:02:00-1:03:10" (seconds, m:ss or h:mm:ss), separated
+# clip by clip with a little padding (see video_processor.process_video_ranges)
+# and delivered per clip or spliced back into a full-length timeline.
+DEFAULT_CLIP_PADDING_SECONDS = 1.0  # Model context on both sides of a clip, cropped afterwards
+SPLICE_BLOCK_FRAMES = 1 << 16
+
+
+def clip_padding_seconds():
+    return float(get_processing_setting("clip_padding_seconds", DEFAULT_CLIP_PADDING_SECONDS))
+
+
+def parse_timestamp(text):
+    """Seconds from '90', '1:30' or '1:02:03.5'. Raises ValueError."""
+    parts = text.strip().split(":")
+    if not 1 <= len(parts) <= 3 or not all(re.fullmatch(r"\d+(\.\d*)?", part) for part in parts):
+        raise ValueError(f"Invalid timestamp '{text.strip()}'; use seconds, m:ss or h:mm:ss.")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_time_ranges(spec, duration=None):
+    """
+    Sorted, non-overlapping (start, end) ranges in seconds from a string such as
+    '0:30-1:15, 10:00-12:30' or a list of strings / (start, end) pairs.
+    Overlapping or touching ranges are merged; with 'duration', ranges are clipped
+    to it. Raises ValueError for malformed or empty ranges.
+    """
+    if isinstance(spec, str):
+        spec = [part.strip() for part in re.split(r"[,;]", spec) if part.strip()]
+    ranges = []
+    for item in spec:
+        if isinstance(item, str):
+            bounds = item.split("-")
+            if len(bounds) != 2:
+                raise ValueError(f"Invalid time range '{item}'; use start-end, e.g. 1:30-2:45.")
+            start, end = parse_timestamp(bounds[0]), parse_timestamp(bounds[1])
+        else:
+            start, end = (float(value) for value in item)
+        if duration:
+            end = min(end, duration)
+        if end <= start:
+            raise ValueError(f"Time range {format_timestamp(start)}-{format_timestamp(end)} is empty"
+                             f"{' or past the end of the input' if duration else ''}.")
+        ranges.append((start, end))
+    if not ranges:
+        raise ValueError("No time ranges given.")
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def format_timestamp(seconds):
+    """'1:02:03.5'-style timestamp (hours only when needed)."""
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    text = f"{minutes:d}:{seconds:04.1f}" if not hours else f"{hours:d}:{minutes:02d}:{seconds:04.1f}"
+    return text[:-2] if text.endswith(".0") else text
+
+
+def range_label(start, end):
+    """File-name friendly label of a range, e.g. '1m30s-2m45s'."""
+    def label(seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return (f"{hours}h{minutes:02d}m{seconds:02d}s" if hours
+                else f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s")
+    return f"{label(start)}-{label(end)}"
+
+
+def padded_range(start, end, padding, duration=None):
+    """The clip actually decoded for a range: 'padding' seconds more on both sides, within the input."""
+    return max(0.0, start - padding), min(duration, end + padding) if duration else end + padding
+
+
+def splice_wavs(clips, destination, total_seconds=None):
+    """
+    Write a full-length WAV with each clip (16-bit PCM WAVs from the separation)
+    placed at its start time and silence elsewhere. 'clips' is a list of
+    (start_seconds, path), sorted and non-overlapping; the timeline lasts
+    'total_seconds', or up to the end of the last clip.
+    """
+    try:
+        with wave.open(str(clips[0][1]), "rb") as first:
+            params = first.getparams()
+        frame_bytes = params.nchannels * params.sampwidth
+        with wave.open(str(destination), "wb") as output:
+            output.setparams(params)
+            position = 0
+
+            def write_silence(frames):
+                while frames > 0:
+                    block = min(frames, SPLICE_BLOCK_FRAMES)
+                    output.writeframes(b"\0" * (block * frame_bytes))
+                    frames -= block
+
+            for start_seconds, path in clips:
+                write_silence(int(round(start_seconds * params.framerate)) - position)
+                position = max(position, int(round(start_seconds * params.framerate)))
+                with wave.open(str(path), "rb") as clip:
+                    if (clip.getnchannels(), clip.getsampwidth(), clip.getframerate()) != \
+                            (params.nchannels, params.sampwidth, params.framerate):
+                        raise RuntimeError(f"{path} does not match the format of the other clips.")
+                    while True:
+                        data = clip.readframes(SPLICE_BLOCK_FRAMES)
+                        if not data:
+                            break
+                        output.writeframes(data)
+                        position += len(data) // frame_bytes
+            if total_seconds:
+                write_silence(int(round(total_seconds * params.framerate)) - position)
+    except (wave.Error, EOFError) as e:
+        raise RuntimeError(f"Could not splice the separated clips into {destination}: {e}")
+    return destination
@@ -3,8 +3,34 @@ from datetime import datetime, timedelta
 from pathlib import Path
 
 from logger_utils import append_to_log
+from moviepy.audio.io.AudioFileClip import AudioFileClip
 from moviepy.video.io.VideoFileClip import VideoFileClip
 
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov")
+# Audio-only inputs accepted next to videos (see video_processor.extract_audio)
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".m4a", ".opus")
+
+def is_audio_file(path):
+    return Path(path).suffix.lower() in AUDIO_EXTENSIONS
+
+def output_stem(path):
+    """
+    Stem to name a file's outputs by (clean_<stem>.wav, ...): its own stem, plus its
+    extension when another video or audio file next to it has the same stem, so
+    that e.g. x.mp4 and x.wav do not overwrite each other's outputs.
+    """
+    path = Path(path)
+    media_extensions = (*VIDEO_EXTENSIONS, *AUDIO_EXTENSIONS)
+    try:
+        clashes = any(
+            other.name != path.name and other.stem.lower() == path.stem.lower()
+            and other.suffix.lower() in media_extensions
+            for other in path.parent.iterdir()
+        )
+    except OSError:
+        clashes = False
+    return f"{path.stem}_{path.suffix.lstrip('.')}" if clashes else path.stem
+
 def format_duration(seconds):
     """Format duration (float/seconds) to a mm:ss string."""
     try:
@@ -27,11 +53,11 @@ def run_in_thread(target, *args):
 
 def get_video_length(video_path):
     """
-    Calculate the length of a video (in seconds) using moviepy.
+    Calculate the length of a video (or audio file) in seconds using moviepy.
     Returns None on failure.
     """
     try:
-        with VideoFileClip(str(video_path)) as video:
+        with (AudioFileClip if is_audio_file(video_path) else VideoFileClip)(str(video_path)) as video:
             return round(video.duration, 2)  # Duration in seconds
     except Exception as e:
         append_to_log(f"Error calculating video length: {e}")
@@ -5,6 +5,31 @@ import shutil
 from pathlib import Path
 import contextlib
 
+from asr_output import save_asr_stem
+from cancellation import JobCancelled, run_cancellable
+from logger_utils import append_to_log
+from machine_profile import machine_separation_options
+from memory_model import get_admission_controller
+from metrics_utils import time_stage
+from processing_config import get_processing_setting
+from profiling_utils import profile_job, profile_torch_stage
+from separation_engine import (
+    DEFAULT_MODEL_NAME,
+    load_separation_model,
+    probe_duration,
+    read_audio,
+    resolve_chunking,
+    separate_waveform,
+    to_two_stems,
+    save_stem,
+)
+from separation_checkpoints import DEFAULT_CHECKPOINT_MIN_SECONDS, SeparationCheckpoint
+from separation_service import ServiceUnavailable, separate_via_service
+from segment_dedup import open_dedup_session
+from time_ranges import clip_padding_seconds, padded_range
+from utils import is_audio_file
+from vocal_postprocess import get_postprocess_chain, postprocess_vocals
+
 
 def get_bundled_path(executable_name):
     """
@@ -49,86 +74,362 @@ def capture_demucs_output():
         sys.stderr = original_stderr
 
 
-def process_video(file_path, temp_dir):
+def extract_audio(file_path, temp_dir, cancel_event=None, time_range=None):
+    """
+    First pipeline stage: get the audio of 'file_path' ready for separation by
+    the cheapest path that loses nothing. Returns the path of the audio file.
+    - Audio files are used as they are: the separation decodes them once.
+    - The audio track of a video is stream-copied into Matroska audio (.mka),
+      without decoding or re-encoding.
+    - With 'time_range' (start, end) in seconds, or a track that cannot be
+      copied, the audio is decoded once to 32-bit float WAV. FFmpeg seeks in the
+      input, so nothing before 'start' is decoded.
+    """
+    if is_audio_file(file_path) and not time_range:
+        append_to_log(f"{Path(file_path).name} is an audio file; separating it directly.")
+        return Path(file_path).resolve()
+
+    # Locate FFmpeg
+    ffmpeg_path = get_bundled_path("ffmpeg.exe")
+
+    if not time_range:
+        copy_path = Path(temp_dir) / "extracted_audio.mka"
+        try:
+            with time_stage("extract"):
+                run_cancellable([
+                    ffmpeg_path,
+                    "-i", str(file_path),
+                    "-map", "0:a:0",
+                    "-c:a", "copy",
+                    str(copy_path),
+                ], cancel_event, stage="audio extraction")
+            if copy_path.is_file():
+                return copy_path
+        except subprocess.CalledProcessError as e:
+            append_to_log(f"Could not copy the audio track of {file_path} (FFmpeg error code {e.returncode}); "
+                          f"decoding it instead.")
+        copy_path.unlink(missing_ok=True)
+
+    # Decode the audio (or the requested part of it) once, to lossless float PCM
+    audio_path = Path(temp_dir) / "extracted_audio.wav"
+    seek = []
+    if time_range:
+        start, end = time_range
+        seek = ["-ss", f"{start:.3f}", "-t", f"{end - start:.3f}"]
+    ffmpeg_command = [
+        ffmpeg_path,
+        *seek,
+        "-i", str(file_path),
+        "-map", "0:a:0",
+        "-c:a", "pcm_f32le",
+        str(audio_path),
+    ]
+
+    try:
+        # Capture FFmpeg logs for debugging
+        with time_stage("extract"):
+            run_cancellable(ffmpeg_command, cancel_event, stage="audio extraction")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(
+            f"FFmpeg command failed with error code {e.returncode}. "
+            f"Output: {e.stderr.decode(errors='ignore')}"
+        )
+
+    if not audio_path.is_file():
+        raise FileNotFoundError("Audio extraction failed; no audio file generated.")
+    return audio_path
+
+
+def separate_audio(audio_path, temp_dir, cancel_event=None, progress_callback=None, separation_options=None,
+                   report=None, asr_path=None, write_stems=True):
+    """
+    Second pipeline stage: separate an extracted audio file into vocals/noise.
+    Uses the local separation service (separation_service.py) when it is running,
+    so models stay warm between jobs, and separates in-process otherwise.
+    Returns (vocals_path, noise_path, (demucs_stdout, demucs_stderr)); the logs are
+    empty when the service did the work. If 'report' is a dict, job statistics
+    (such as the dedup hit rate) are added to it.
+    With 'asr_path', an ASR-ready vocal file (see asr_output) is also written there;
+    with 'write_stems' False only that file is written and both stem paths are None.
+    """
+    try:
+        vocals_path, noise_path = separate_via_service(
+            audio_path, temp_dir, cancel_event, progress_callback, separation_options, report=report,
+            asr_path=asr_path, write_stems=write_stems,
+        )
+        if not write_stems:
+            return None, None, ("", "")
+        return Path(vocals_path), Path(noise_path), ("", "")
+    except ServiceUnavailable as e:
+        append_to_log(f"{e} Separating in-process.")
+    return separate_audio_in_process(
+        audio_path, temp_dir, cancel_event, progress_callback, separation_options, report, asr_path, write_stems
+    )
+
+
+def _open_checkpoint(wav, model_name, samplerate, options):
+    """Checkpoint for long inputs (see separation_checkpoints), keyed by input and parameters."""
+    audio_seconds = wav.shape[-1] / samplerate
+    if audio_seconds < float(get_processing_setting("checkpoint_min_seconds", DEFAULT_CHECKPOINT_MIN_SECONDS)):
+        return None
+    chunk_seconds, overlap_seconds = resolve_chunking(options.get("chunk_seconds"), options.get("overlap_seconds"))
+    return SeparationCheckpoint.open(wav, {
+        "model": model_name,
+        "samplerate": samplerate,
+        "chunk_seconds": chunk_seconds,
+        "overlap_seconds": overlap_seconds,
+        "shifts": options.get("shifts", 1),
+        "overlap": options.get("overlap", 0.25),
+    })
+
+
+def separate_audio_in_process(audio_path, temp_dir, cancel_event=None, progress_callback=None,
+                              separation_options=None, report=None, asr_path=None, write_stems=True):
+    """
+    Separate an extracted audio file into vocals/noise with Demucs in this process.
+    Returns (vocals_path, noise_path, (demucs_stdout, demucs_stderr)).
+    'asr_path' and 'write_stems' select the outputs as for separate_audio; the
+    ASR file is made from the separated tensor, without writing or re-decoding a stem.
+    'separation_options' may set 'model', 'chunk_seconds', 'overlap_seconds',
+    'shifts' and 'overlap'; anything unset comes from the machine profile written
+    by autotune.py, or the defaults. 'postprocess' selects a vocal cleanup chain
+    (see vocal_postprocess), run on the separated vocals before they are written;
+    by default the 'vocal_postprocess' setting. 'output_range' ([start, end] in
+    seconds of the input) crops the outputs, e.g. to drop a clip's padding. The job waits for memory admission first and
+    may be switched to shorter chunks (see memory_model). Long inputs are
+    checkpointed chunk by chunk, so re-running a crashed or cancelled job resumes,
+    and, if enabled ('dedup' option or 'dedup_enabled' setting), audio already
+    separated in earlier jobs is reused (see segment_dedup).
+    """
+    ffmpeg_path = get_bundled_path("ffmpeg.exe")
+    audio_path = Path(audio_path)
+    options = {**machine_separation_options(), **(separation_options or {})}
+    model_name = options.pop("model", DEFAULT_MODEL_NAME)
+    postprocess_chain = get_postprocess_chain(options.pop("postprocess", None))
+    output_range = options.pop("output_range", None)
+    use_dedup = options.pop("dedup", None)
+
+    # Run Demucs in-process, chunk by chunk, so the job can be cancelled between chunks
+    with capture_demucs_output() as (demucs_out, demucs_err):
+        with time_stage("model_load"):
+            model = load_separation_model(model_name)
+        # Wait until the job's predicted memory fits; oversized jobs get shorter chunks
+        admission = get_admission_controller().admit(
+            audio_path.stem, probe_duration(ffmpeg_path, audio_path), model_name, options,
+            channels=model.audio_channels, samplerate=model.samplerate, cancel_event=cancel_event,
+        )
+        with admission as ticket:
+            with time_stage("decode") as stage:
+                wav = read_audio(ffmpeg_path, audio_path, model.samplerate, model.audio_channels, cancel_event)
+                audio_seconds = wav.shape[-1] / model.samplerate
+                stage["audio_seconds"] = audio_seconds
+            checkpoint = _open_checkpoint(wav, model_name, model.samplerate, ticket.options)
+            dedup = open_dedup_session(model_name, model.samplerate, ticket.options, enabled=use_dedup)
+            try:
+                with time_stage("separate", audio_seconds), profile_torch_stage("separate"):
+                    sources = separate_waveform(
+                        model, wav, cancel_event=cancel_event, progress_callback=progress_callback,
+                        checkpoint=checkpoint, dedup=dedup, **ticket.options
+                    )
+            except JobCancelled:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"Demucs separation process failed: {e}")
+            if output_range:
+                first, last = (int(round(seconds * model.samplerate)) for seconds in output_range)
+                sources = sources[..., first:last]
+            vocals, no_vocals = to_two_stems(sources, "vocals")
+            if postprocess_chain:
+                vocals = postprocess_vocals(vocals, model.samplerate, postprocess_chain, report)
+
+            # Keep the same output layout as the Demucs CLI
+            demucs_output_dir = Path(temp_dir) / model_name / audio_path.stem
+            demucs_output_dir.mkdir(parents=True, exist_ok=True)
+            vocals_path = demucs_output_dir / "vocals.wav" if write_stems else None
+            noise_path = demucs_output_dir / "no_vocals.wav" if write_stems else None
+            with time_stage("write_stems", audio_seconds):
+                if write_stems:
+                    save_stem(vocals, vocals_path, model.samplerate)
+                    save_stem(no_vocals, noise_path, model.samplerate)
+                if asr_path:
+                    asr_stats = save_asr_stem(vocals, asr_path, model.samplerate)
+                    if report is not None:
+                        report["asr"] = asr_stats
+            if checkpoint:
+                checkpoint.discard()
+            if dedup:
+                append_to_log(f"{audio_path.name}: {dedup.hit_rate:.0%} of the audio reused from earlier jobs.")
+                if report is not None:
+                    report["dedup_hit_rate"] = round(dedup.hit_rate, 4)
+                    report["dedup_reused_seconds"] = round(dedup.reused_samples / model.samplerate, 2)
+        if report is not None and ticket.peak_bytes:
+            report["peak_memory_bytes"] = ticket.peak_bytes
+
+        # Extract the logs from StringIO
+        demucs_stdout = demucs_out.getvalue()
+        demucs_stderr = demucs_err.getvalue()
+
+    # Verify output files from Demucs
+    if write_stems and not vocals_path.is_file():
+        raise FileNotFoundError("Demucs did not produce a 'vocals.wav' file.")
+    if write_stems and not noise_path.is_file():
+        raise FileNotFoundError("Demucs did not produce a 'no_vocals.wav' file.")
+    if asr_path and not Path(asr_path).is_file():
+        raise FileNotFoundError(f"No ASR output was written to {asr_path}.")
+
+    # Return paths + logs for debugging or display
+    return vocals_path, noise_path, (demucs_stdout, demucs_stderr)
+
+
+def process_video(file_path, temp_dir, cancel_event=None, progress_callback=None, separation_options=None,
+                  report=None, asr_path=None, write_stems=True):
     """
     Processes a video file to extract audio (with FFmpeg) and separate it
     into vocals/noise (with Demucs), returning paths to the two stems
     plus any Demucs logs captured along the way.
+    If 'cancel_event' is set while running, child processes are killed,
+    separation stops at the next chunk boundary and JobCancelled is raised.
+    'progress_callback' (optional) receives the separation progress in percent.
+    'separation_options' selects the model and chunking/shift settings (see separate_audio).
+    'report' (optional dict) receives job statistics such as the dedup hit rate.
+    'asr_path' / 'write_stems' add or substitute an ASR-ready vocal file (see separate_audio).
+    With profiling enabled, a cProfile and torch operator profile are written per job.
     """
     input_file = Path(file_path)
     if not input_file.is_file():
         raise FileNotFoundError(f"Input file does not exist or is not a valid file: {file_path}")
 
     try:
-        # Locate FFmpeg
-        ffmpeg_path = get_bundled_path("ffmpeg.exe")
-
-        # Extract audio from the video using FFmpeg
-        audio_path = Path(temp_dir) / "extracted_audio.mp3"
-        ffmpeg_command = [
-            ffmpeg_path,
-            "-i", str(file_path),
-            "-q:a", "0",
-            "-map", "a",
-            str(audio_path),
-        ]
-
-        try:
-            # Capture FFmpeg logs for debugging
-            result = subprocess.run(
-                ffmpeg_command,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(
-                f"FFmpeg command failed with error code {e.returncode}. "
-                f"Output: {e.stderr.decode(errors='ignore')}"
+        with profile_job(f"process_video_{input_file.stem}"):
+            audio_path = extract_audio(file_path, temp_dir, cancel_event)
+            return separate_audio(
+                audio_path, temp_dir, cancel_event, progress_callback, separation_options, report,
+                asr_path, write_stems,
             )
 
-        if not audio_path.is_file():
-            raise FileNotFoundError("Audio extraction failed; no audio file generated.")
+    except JobCancelled:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Unexpected error during video processing: {e}")
 
-        # Run Demucs to separate audio
-        try:
-            from demucs.separate import main as demucs_main
-        except ImportError:
-            raise RuntimeError(
-                "Demucs is not installed or failed to import. "
-                "Please ensure 'demucs' is installed in your environment."
-            )
 
-        demucs_args = [
-            "--two-stems=vocals",
-            "-n", "mdx_extra_q",
-            str(audio_path),
-            "-o", str(temp_dir),
-        ]
+def process_video_ranges(file_path, temp_dir, time_ranges, cancel_event=None, progress_callback=None,
+                         separation_options=None, report=None, asr_paths=None, write_stems=True):
+    """
+    Like process_video, for only the given (start, end) ranges of the input, in
+    seconds (see time_ranges.parse_time_ranges). Each range is extracted with
+    input-side seeking, padded by the 'clip_padding_seconds' setting on both
+    sides so the model has context at its edges, separated, and cropped back to
+    the range. Returns one (vocals_path, noise_path) pair per range.
+    'asr_paths' (optional) holds one ASR output path per range; 'report' gets
+    one report per clip under 'clips' and the largest peak memory of them.
+    """
+    input_file = Path(file_path)
+    if not input_file.is_file():
+        raise FileNotFoundError(f"Input file does not exist or is not a valid file: {file_path}")
 
-        # Capture logs from Demucs
-        with capture_demucs_output() as (demucs_out, demucs_err):
-            try:
-                demucs_main(demucs_args)
-            except Exception as e:
-                raise RuntimeError(f"Demucs separation process failed: {e}")
+    duration = probe_duration(get_bundled_path("ffmpeg.exe"), input_file)
+    padding = clip_padding_seconds()
+    total_seconds = sum(end - start for start, end in time_ranges)
+    done_seconds = 0.0
+    clips = []
+    try:
+        with profile_job(f"process_video_{input_file.stem}"):
+            for index, (start, end) in enumerate(time_ranges):
+                clip_start, clip_end = padded_range(start, end, padding, duration)
+                clip_dir = Path(temp_dir) / f"clip_{index}"
+                clip_dir.mkdir(parents=True, exist_ok=True)
+                audio_path = extract_audio(file_path, clip_dir, cancel_event, time_range=(clip_start, clip_end))
 
-            # Extract the logs from StringIO
-            demucs_stdout = demucs_out.getvalue()
-            demucs_stderr = demucs_err.getvalue()
+                def clip_progress(percent, done=done_seconds, length=end - start):
+                    if progress_callback:
+                        progress_callback((done + percent / 100 * length) / total_seconds * 100)
 
-        # Verify output files from Demucs
-        demucs_output_dir = Path(temp_dir) / "mdx_extra_q" / audio_path.stem
-        vocals_path = demucs_output_dir / "vocals.wav"
-        noise_path = demucs_output_dir / "no_vocals.wav"
+                clip_report = {}
+                options = {**(separation_options or {}), "output_range": [start - clip_start, end - clip_start]}
+                vocals_path, noise_path, _ = separate_audio(
+                    audio_path, clip_dir, cancel_event, clip_progress, options, clip_report,
+                    asr_paths[index] if asr_paths else None, write_stems,
+                )
+                clips.append((vocals_path, noise_path))
+                done_seconds += end - start
+                if report is not None:
+                    report.setdefault("clips", []).append(clip_report)
+                    if clip_report.get("peak_memory_bytes", 0) > report.get("peak_memory_bytes", 0):
+                        report["peak_memory_bytes"] = clip_report["peak_memory_bytes"]
+        return clips
 
-        if not vocals_path.is_file():
-            raise FileNotFoundError("Demucs did not produce a 'vocals.wav' file.")
-        if not noise_path.is_file():
-            raise FileNotFoundError("Demucs did not produce a 'no_vocals.wav' file.")
+    except JobCancelled:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Unexpected error during video processing: {e}")
 
-        # Return paths + logs for debugging or display
-        return vocals_path, noise_path, (demucs_stdout, demucs_stderr)
 
-    except Exception as e:
-        raise RuntimeError(f"Unexpected error during video processing: {e}")
\ No newline at end of file
+# Codec settings for the cleaned track, chosen by output container
+REMUX_AUDIO_CODECS = {
+    ".mkv": ["-c:a:0", "flac"],
+}
+DEFAULT_REMUX_AUDIO_CODEC = ["-c:a:0", "aac", "-b:a:0", "320k"]
+# How subtitle streams are carried into each container (None = dropped)
+REMUX_SUBTITLE_CODECS = {
+    ".mkv": "copy",
+    ".mp4": "mov_text",
+    ".mov": "mov_text",
+    ".avi": None,
+}
+
+
+def remux_clean_audio(video_path, vocals_path, output_path, noise_path=None, background_level=None,
+                      cancel_event=None):
+    """
+    Build a new container from 'video_path' with the original video stream copied
+    (no video re-encode) and the cleaned vocals as the first, default audio track.
+    If 'background_level' (linear gain, e.g. 0.3) and 'noise_path' are given, the
+    background stem is mixed back in at that level in the same pass.
+    The original audio tracks and subtitles are kept as additional streams.
+    Returns the output path.
+    """
+    output_path = Path(output_path)
+    extension = output_path.suffix.lower()
+    ffmpeg_path = get_bundled_path("ffmpeg.exe")
+
+    command = [ffmpeg_path, "-y", "-i", str(video_path), "-i", str(vocals_path)]
+    if background_level and noise_path:
+        command += ["-i", str(noise_path)]
+        command += [
+            "-filter_complex",
+            f"[2:a]volume={float(background_level)}[bg];"
+            f"[1:a][bg]amix=inputs=2:duration=first:normalize=0[clean]",
+            "-map", "0:v", "-map", "[clean]",
+        ]
+    else:
+        command += ["-map", "0:v", "-map", "1:a"]
+
+    # Keep the original audio tracks and subtitles after the cleaned track
+    command += ["-map", "0:a?"]
+    subtitle_codec = REMUX_SUBTITLE_CODECS.get(extension, "copy")
+    if subtitle_codec:
+        command += ["-map", "0:s?", "-c:s", subtitle_codec]
+
+    command += ["-c:v", "copy", "-c:a", "copy"]
+    command += REMUX_AUDIO_CODECS.get(extension, DEFAULT_REMUX_AUDIO_CODEC)
+    command += [
+        "-map_metadata", "0",
+        "-metadata:s:a:0", "title=Clean vocals" if not background_level else "title=Clean mix",
+        "-disposition:a", "0",
+        "-disposition:a:0", "default",
+        str(output_path),
+    ]
+
+    try:
+        with time_stage("remux"):
+            run_cancellable(command, cancel_event, stage="remux")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(
+            f"FFmpeg remux failed with error code {e.returncode}. "
+            f"Output: {e.stderr.decode(errors='ignore')}"
+        )
+
+    if not output_path.is_file():
+        raise FileNotFoundError("Remux failed; no output video generated.")
+    return output_path
@@ -0,0 +1,175 @@
+import math
+import time
+
+from asr_output import integrated_loudness
+from logger_utils import append_to_log
+from metrics_utils import record_stage
+from processing_config import get_processing_setting
+
+# Optional cleanup of the separated vocals before they are written: a chain of
+# vectorized NumPy stages, run block by block over the [channels, samples]
+# array, e.g. in config.json
+#   "vocal_postprocess": [{"type": "highpass", "cutoff_hz": 80}, {"type": "deess"},
+#                         {"type": "gate"}, {"type": "loudness", "target_lufs": -16}]
+# Parameters left out use STAGE_DEFAULTS. 'loudness' needs the whole signal,
+# so it always runs once, after the block-wise stages.
+BLOCK_SECONDS = 10.0
+BLOCK_PADDING_SECONDS = 0.5     # Context on both sides of a block, cropped after processing
+ENVELOPE_FRAME_SECONDS = 0.01   # Level detection frames for the de-esser and the gate
+
+STAGE_DEFAULTS = {
+    "highpass": {"cutoff_hz": 80.0, "order": 4},
+    "deess": {"frequency_hz": 5500.0, "threshold_db": -30.0, "ratio": 4.0, "max_reduction_db": 12.0},
+    "gate": {"threshold_db": -50.0, "floor_db": -40.0, "hold_seconds": 0.1},
+    "loudness": {"target_lufs": -16.0, "peak_db": -1.0},
+}
+STAGE_TYPES = tuple(STAGE_DEFAULTS)
+
+
+def get_postprocess_chain(chain=None):
+    """
+    Validated post-processing chain: 'chain' (the 'postprocess' separation
+    option) or the 'vocal_postprocess' setting, as a list of (type, params).
+    An empty list means no post-processing. Raises ValueError for unknown stages.
+    """
+    if chain is None:
+        chain = get_processing_setting("vocal_postprocess", [])
+    stages = []
+    for stage in chain or []:
+        if isinstance(stage, str):
+            stage = {"type": stage}
+        stage_type = stage.get("type")
+        if stage_type not in STAGE_DEFAULTS:
+            raise ValueError(f"Unknown post-processing stage '{stage_type}'. "
+                             f"Choose from: {', '.join(STAGE_TYPES)}.")
+        unknown = set(stage) - set(STAGE_DEFAULTS[stage_type]) - {"type"}
+        if unknown:
+            raise ValueError(f"Unknown parameter(s) for post-processing stage '{stage_type}': "
+                             f"{', '.join(sorted(unknown))}.")
+        params = {**STAGE_DEFAULTS[stage_type], **{key: value for key, value in stage.items() if key != "type"}}
+        stages.append((stage_type, params))
+    return stages
+
+
+def _highpass_gain(freqs, cutoff_hz, order):
+    """Butterworth high-pass magnitude response, applied zero-phase."""
+    import numpy as np
+    with np.errstate(divide="ignore", over="ignore"):
+        return 1.0 / np.sqrt(1.0 + (cutoff_hz / freqs) ** (2 * order))
+
+
+def _frame_levels_db(piece, frame):
+    """RMS level (dB) per frame of 'frame' samples, over all channels together."""
+    import numpy as np
+    frames = max(1, piece.shape[-1] // frame)
+    usable = min(piece.shape[-1], frames * frame)
+    power = (piece[:, :usable] ** 2).reshape(piece.shape[0], frames, -1).mean(axis=(0, 2))
+    return 10 * np.log10(power + 1e-12), usable // frames
+
+
+def _frame_gains_to_samples(gains, frame, length):
+    """Per-frame gains, linearly interpolated between frame centres to per-sample gains."""
+    import numpy as np
+    centres = (np.arange(len(gains)) + 0.5) * frame
+    return np.interp(np.arange(length), centres, gains)
+
+
+def _highpass(piece, samplerate, cutoff_hz, order):
+    import numpy as np
+    freqs = np.fft.rfftfreq(piece.shape[-1], 1.0 / samplerate)
+    spectrum = np.fft.rfft(piece, axis=-1)
+    spectrum *= _highpass_gain(freqs, cutoff_hz, order)
+    return np.fft.irfft(spectrum, piece.shape[-1], axis=-1)
+
+
+def _deess(piece, samplerate, frequency_hz, threshold_db, ratio, max_reduction_db):
+    """Turn down the sibilance band (above 'frequency_hz') while it is above the threshold."""
+    sibilance = _highpass(piece, samplerate, frequency_hz, 4)
+    levels, frame = _frame_levels_db(sibilance, max(1, int(ENVELOPE_FRAME_SECONDS * samplerate)))
+    reduction = ((levels - threshold_db) * (1.0 - 1.0 / ratio)).clip(0.0, max_reduction_db)
+    gains = _frame_gains_to_samples(10 ** (-reduction / 20), frame, piece.shape[-1])
+    return piece + sibilance * (gains - 1.0)
+
+
+def _gate(piece, samplerate, threshold_db, floor_db, hold_seconds):
+    """Attenuate to 'floor_db' where the signal stays below the threshold for longer than the hold time."""
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+    levels, frame = _frame_levels_db(piece, max(1, int(ENVELOPE_FRAME_SECONDS * samplerate)))
+    hold = max(1, int(round(hold_seconds / ENVELOPE_FRAME_SECONDS)))
+    is_open = np.pad((levels > threshold_db).astype(np.float64), hold)
+    is_open = sliding_window_view(is_open, 2 * hold + 1).max(axis=-1)
+    gains = np.where(is_open > 0, 1.0, 10 ** (floor_db / 20))
+    return piece * _frame_gains_to_samples(gains, frame, piece.shape[-1])
+
+
+BLOCK_STAGES = {
+    "highpass": _highpass,
+    "deess": _deess,
+    "gate": _gate,
+}
+
+
+def _normalize_loudness(samples, samplerate, target_lufs, peak_db):
+    """Gain to 'target_lufs', capped so peaks stay below 'peak_db'. Returns (samples, gain_db)."""
+    import numpy as np
+    loudness = integrated_loudness(samples, samplerate)
+    if not math.isfinite(loudness):
+        return samples, 0.0
+    gain_db = target_lufs - loudness
+    peak = float(np.abs(samples).max())
+    if peak > 0:
+        gain_db = min(gain_db, peak_db - 20 * math.log10(peak))
+    samples *= 10 ** (gain_db / 20)
+    return samples, gain_db
+
+
+def apply_chain(samples, samplerate, chain):
+    """
+    Run 'chain' (from get_postprocess_chain) over a [channels, samples] float
+    array. Block-wise stages process BLOCK_SECONDS at a time with padding on
+    both sides, so filters and level detection see across block edges.
+    Returns (processed array with the input dtype, seconds spent per stage).
+    """
+    import numpy as np
+    stage_seconds = {stage_type: 0.0 for stage_type, _ in chain}
+    block_stages = [(stage_type, params) for stage_type, params in chain if stage_type in BLOCK_STAGES]
+    length = samples.shape[-1]
+    output = np.empty(samples.shape, dtype=np.float64)
+    block = max(1, int(BLOCK_SECONDS * samplerate))
+    padding = int(BLOCK_PADDING_SECONDS * samplerate)
+    for start in range(0, length, block):
+        end = min(start + block, length)
+        lo, hi = max(0, start - padding), min(length, end + padding)
+        piece = samples[:, lo:hi].astype(np.float64)
+        for stage_type, params in block_stages:
+            started = time.perf_counter()
+            piece = BLOCK_STAGES[stage_type](piece, samplerate, **params)
+            stage_seconds[stage_type] += time.perf_counter() - started
+        output[:, start:end] = piece[:, start - lo:end - lo]
+
+    for stage_type, params in chain:
+        if stage_type == "loudness":
+            started = time.perf_counter()
+            output, _ = _normalize_loudness(output, samplerate, **params)
+            stage_seconds[stage_type] += time.perf_counter() - started
+    return output.astype(samples.dtype, copy=False), stage_seconds
+
+
+def postprocess_vocals(vocals, samplerate, chain, report=None):
+    """
+    Apply 'chain' to the separated vocals tensor ([channels, samples]) and
+    return the processed tensor. Each stage is recorded as a 'postprocess_<type>'
+    pipeline stage; if 'report' is a dict, the timings are added to it.
+    """
+    import torch
+    audio_seconds = vocals.shape[-1] / samplerate
+    processed, stage_seconds = apply_chain(vocals.detach().cpu().numpy(), samplerate, chain)
+    for stage_type, seconds in stage_seconds.items():
+        record_stage(f"postprocess_{stage_type}", seconds, audio_seconds)
+    total = sum(stage_seconds.values())
+    append_to_log(f"Vocal post-processing ({', '.join(stage_seconds)}) took {total:.2f}s "
+                  f"for {audio_seconds:.0f}s of audio.")
+    if report is not None:
+        report["postprocess_seconds"] = {stage: round(seconds, 3) for stage, seconds in stage_seconds.items()}
+    return torch.from_numpy(processed)
@@ -0,0 +1,330 @@
+import os
+import json
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from cancellation import JobCancelled, raise_if_cancelled
+from directory_manager import get_workspace_manager
+from job_ledger import job_parameters, track_job
+from job_manager import get_job_manager, JOB_RUNNING, JOB_FINISHED, JOB_FAILED, JOB_CANCELLED
+from logger_utils import append_to_log
+from processing_config import get_processing_setting
+from separation_presets import preset_options
+from utils import AUDIO_EXTENSIONS, VIDEO_EXTENSIONS, get_video_length, output_stem
+from video_processor import extract_audio, separate_audio
+
+# inotify is optional (Linux only); without it the folder is polled
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+WATCH_EXTENSIONS = {*VIDEO_EXTENSIONS, *AUDIO_EXTENSIONS}
+LEDGER_FILENAME = ".rian_processed.json"
+DEFAULT_DEBOUNCE_SECONDS = 10.0
+DEFAULT_POLL_SECONDS = 5.0
+JOB_KIND = "Watch Folder"
+
+
+class ProcessedLedger:
+    """
+    Record of inputs already processed, stored as JSON in the output folder so a
+    restart does not redo work. An input is considered done while its size and
+    modification time match the recorded ones.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r") as ledger_file:
+                self._entries = json.load(ledger_file)
+        except FileNotFoundError:
+            self._entries = {}
+        except json.JSONDecodeError:
+            append_to_log(f"Watch folder ledger {self.path} is corrupt; starting a new one.")
+            self._entries = {}
+
+    def is_processed(self, key, stat):
+        with self._lock:
+            entry = self._entries.get(key)
+        return bool(entry) and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
+
+    def mark_processed(self, key, stat, outputs):
+        with self._lock:
+            self._entries[key] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "processed_at": datetime.now().isoformat(),
+                "outputs": [str(path) for path in outputs],
+            }
+            temp_path = self.path.with_suffix(".tmp")
+            with open(temp_path, "w") as ledger_file:
+                json.dump(self._entries, ledger_file, indent=2)
+            os.replace(temp_path, self.path)
+
+
+class WatchFolder:
+    """
+    Hot-folder ingest: new video or audio files dropped below 'input_dir' are separated
+    automatically and their stems written to the same relative location below
+    'output_dir'.
+
+    Files are picked up via inotify when available (polling otherwise) and only
+    once their size and mtime have been stable for 'debounce_seconds', so files
+    still being copied are left alone. Processing is pipelined: a few extraction
+    workers run FFmpeg ahead of the separation worker(s), with a bounded hand-off
+    queue so extraction cannot run far ahead of separation (or the disk budget).
+    """
+    def __init__(self, input_dir, output_dir, debounce_seconds=None, poll_seconds=None,
+                 extract_workers=None, separate_workers=None):
+        self.input_dir = Path(input_dir).resolve()
+        self.output_dir = Path(output_dir).resolve()
+        if self.output_dir == self.input_dir:
+            # The stems (WAV files) would be picked up as new inputs, over and over
+            raise ValueError("The watch folder's output folder must differ from its input folder.")
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.debounce_seconds = debounce_seconds if debounce_seconds is not None else float(
+            get_processing_setting("watch_debounce_seconds", DEFAULT_DEBOUNCE_SECONDS))
+        self.poll_seconds = poll_seconds if poll_seconds is not None else float(
+            get_processing_setting("watch_poll_seconds", DEFAULT_POLL_SECONDS))
+        self.extract_workers = extract_workers or int(get_processing_setting("watch_extract_workers", 2))
+        self.separate_workers = separate_workers or int(get_processing_setting("watch_separate_workers", 1))
+
+        self.ledger = ProcessedLedger(self.output_dir / LEDGER_FILENAME)
+        self._stop_event = threading.Event()
+        self._candidates = {}  # path -> (size, mtime, last_change_time)
+        self._in_flight = set()
+        self._failed = {}  # path -> (size, mtime) of the version that failed or was cancelled; retried once it changes
+        self._in_flight_lock = threading.Lock()
+        self._ready = queue.Queue()
+        # Bounded: extraction blocks once this many extracted files await separation
+        self._extracted = queue.Queue(maxsize=self.separate_workers + 1)
+        self._threads = []
+
+    def start(self):
+        """Start watching and processing in background threads."""
+        if not self.input_dir.is_dir():
+            raise FileNotFoundError(f"Watch folder does not exist: {self.input_dir}")
+        self._stop_event.clear()
+        targets = [self._watch_loop]
+        targets += [self._extract_loop] * self.extract_workers
+        targets += [self._separate_loop] * self.separate_workers
+        self._threads = [threading.Thread(target=target, daemon=True) for target in targets]
+        for thread in self._threads:
+            thread.start()
+        append_to_log(
+            f"Watching {self.input_dir} -> {self.output_dir} "
+            f"({'inotify' if INotify else 'polling'}, debounce {self.debounce_seconds:.0f}s)."
+        )
+
+    def stop(self):
+        """Stop picking up new files. Jobs already running are left to finish."""
+        self._stop_event.set()
+        append_to_log(f"Stopped watching {self.input_dir}.")
+
+    @property
+    def running(self):
+        return not self._stop_event.is_set() and any(thread.is_alive() for thread in self._threads)
+
+    ############################################################################
+    #                             DETECTION
+    ############################################################################
+
+    def _relative_key(self, path):
+        return Path(path).relative_to(self.input_dir).as_posix()
+
+    def _note_candidate(self, path):
+        """Remember a possibly-new file; it becomes ready once it has stopped changing."""
+        path = Path(path)
+        if path.suffix.lower() not in WATCH_EXTENSIONS or path.name.startswith("."):
+            return
+        if self.output_dir in path.parents:
+            return  # Our own stems, when the output folder lies inside the input folder
+        try:
+            stat = path.stat()
+        except OSError:
+            self._candidates.pop(path, None)  # Deleted or moved away again
+            return
+        with self._in_flight_lock:
+            if path in self._in_flight:
+                return
+        if self.ledger.is_processed(self._relative_key(path), stat):
+            return
+        if self._failed.get(path) == (stat.st_size, stat.st_mtime):
+            return
+
+        previous = self._candidates.get(path)
+        if previous is None or previous[:2] != (stat.st_size, stat.st_mtime):
+            self._candidates[path] = (stat.st_size, stat.st_mtime, time.monotonic())
+
+    def _release_stable_candidates(self):
+        """Move files whose size/mtime have not changed for the debounce period to the ready queue."""
+        now = time.monotonic()
+        for path, (size, mtime, last_change) in list(self._candidates.items()):
+            self._note_candidate(path)  # Refresh size/mtime
+            current = self._candidates.get(path)
+            if current is None:
+                continue
+            if current[:2] == (size, mtime) and now - last_change >= self.debounce_seconds:
+                del self._candidates[path]
+                with self._in_flight_lock:
+                    self._in_flight.add(path)
+                self._ready.put(path)
+
+    def _scan(self):
+        """Full scan of the input tree (used at startup and by the polling fallback)."""
+        for root, _dirs, files in os.walk(self.input_dir):
+            for name in files:
+                self._note_candidate(Path(root) / name)
+
+    def _watch_loop(self):
+        self._scan()
+        if INotify is None:
+            while not self._stop_event.wait(self.poll_seconds):
+                self._scan()
+                self._release_stable_candidates()
+            return
+
+        inotify = INotify()
+        watch_flags = (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+                       | inotify_flags.MODIFY)
+        watched_dirs = {}
+
+        def add_watch(directory):
+            try:
+                watched_dirs[inotify.add_watch(str(directory), watch_flags)] = Path(directory)
+            except OSError as e:
+                append_to_log(f"Cannot watch {directory}: {e}")
+
+        for root, _dirs, _files in os.walk(self.input_dir):
+            add_watch(root)
+
+        try:
+            while not self._stop_event.is_set():
+                # Wake at least once per debounce tick to release files that settled
+                for event in inotify.read(timeout=int(min(self.poll_seconds, self.debounce_seconds) * 1000)):
+                    directory = watched_dirs.get(event.wd)
+                    if directory is None or not event.name:
+                        continue
+                    path = directory / event.name
+                    if event.mask & inotify_flags.ISDIR:
+                        if event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO):
+                            add_watch(path)
+                            for root, _dirs, files in os.walk(path):
+                                add_watch(root)
+                                for name in files:
+                                    self._note_candidate(Path(root) / name)
+                        continue
+                    self._note_candidate(path)
+                self._release_stable_candidates()
+        finally:
+            inotify.close()
+
+    ############################################################################
+    #                             PROCESSING
+    ############################################################################
+
+    def _output_paths(self, path):
+        target_dir = self.output_dir / Path(self._relative_key(path)).parent
+        stem = output_stem(path)
+        return target_dir / f"clean_{stem}.wav", target_dir / f"bg_{stem}.wav"
+
+    def _extract_loop(self):
+        """Stage 1: reserve a workspace and extract audio, then hand over to separation."""
+        manager = get_job_manager()
+        while not self._stop_event.is_set():
+            try:
+                path = self._ready.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            job = manager.track(JOB_KIND, self._relative_key(path))
+            workspace_context = None
+            try:
+                manager.update(job, status=JOB_RUNNING, started_at=datetime.now(), message="Extracting audio...")
+                duration = get_video_length(path)
+                workspace_context = get_workspace_manager().job_workspace(path.stem, duration)
+                workspace = workspace_context.__enter__()
+                audio_path = extract_audio(path, workspace.path, job.cancel_event)
+                manager.update(job, message="Waiting for separation...")
+                self._extracted.put((path, job, workspace_context, workspace, audio_path, duration))
+            except Exception as e:
+                if workspace_context is not None:
+                    workspace_context.__exit__(None, None, None)
+                self._finish(path, job, e)
+
+    def _separate_loop(self):
+        """Stage 2: separate extracted audio and write stems into the mirror tree."""
+        manager = get_job_manager()
+        while not (self._stop_event.is_set() and self._extracted.empty()):
+            try:
+                path, job, workspace_context, workspace, audio_path, duration = self._extracted.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            try:
+                raise_if_cancelled(job.cancel_event)
+                report = {}
+                separation_options = preset_options()
+                with track_job(JOB_KIND, self._relative_key(path), input_seconds=duration,
+                               file_size=path.stat().st_size,
+                               parameters=job_parameters(separation_options)) as ledger_entry:
+                    manager.update(job, message=f"Separating vocals... {ledger_entry.estimate.describe()}")
+
+                    def report_progress(percent, job=job, ledger_entry=ledger_entry):
+                        manager.update(job, progress=percent,
+                                       message=ledger_entry.progress_message("Separating vocals...", percent))
+
+                    vocals_path, noise_path, _ = separate_audio(
+                        audio_path,
+                        workspace.path,
+                        cancel_event=job.cancel_event,
+                        progress_callback=report_progress,
+                        separation_options=separation_options,
+                        report=report,
+                    )
+                    workspace.sample_usage()
+                    ledger_entry.update(peak_disk_bytes=workspace.peak_bytes,
+                                        peak_memory_bytes=report.get("peak_memory_bytes"))
+
+                vocals_dest, noise_dest = self._output_paths(path)
+                vocals_dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(vocals_path), str(vocals_dest))
+                shutil.move(str(noise_path), str(noise_dest))
+                self.ledger.mark_processed(self._relative_key(path), path.stat(), [vocals_dest, noise_dest])
+                append_to_log(f"Watch folder: {path} -> {vocals_dest}, {noise_dest} "
+                              f"(dedup hit rate {report.get('dedup_hit_rate', 0.0):.0%})")
+                self._finish(path, job)
+            except Exception as e:
+                self._finish(path, job, e)
+            finally:
+                workspace_context.__exit__(None, None, None)
+
+    def _finish(self, path, job, error=None):
+        """
+        Record a job outcome. A failed or cancelled file is not picked up again
+        until it changes, so a cancel sticks even when the folder is polled.
+        """
+        manager = get_job_manager()
+        if error is None:
+            manager.update(job, status=JOB_FINISHED, finished_at=datetime.now(), progress=100.0,
+                           message="Done.")
+        else:
+            if isinstance(error, JobCancelled):
+                append_to_log(f"Watch folder: cancelled {path}; it is skipped until it changes.")
+                manager.update(job, status=JOB_CANCELLED, finished_at=datetime.now(), message="Cancelled.")
+            else:
+                append_to_log(f"Watch folder: failed to process {path}: {error}")
+                manager.update(job, status=JOB_FAILED, finished_at=datetime.now(), error=str(error),
+                               message=f"Failed: {error}")
+            try:
+                stat = path.stat()
+                self._failed[path] = (stat.st_size, stat.st_mtime)
+            except OSError:
+                pass
+        with self._in_flight_lock:
+            self._in_flight.discard(path)
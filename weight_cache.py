@@ -0,0 +1,200 @@
+import os
+import time
+import argparse
+import importlib
+import itertools
+from pathlib import Path
+
+from directory_manager import get_directory_size, get_workspace_manager
+from logger_utils import append_to_log
+from processing_config import get_processing_setting
+
+# Dequantized model weights, stored once per model so later cold starts skip
+# checkpoint deserialization and diffq dequantization. State dicts are loaded
+# with torch.load(mmap=True): parameters point straight into the page cache,
+# so every process using the model (see bag_parallel) shares the same pages.
+WEIGHT_CACHE_DIRNAME = "rian_weight_cache"
+META_FILENAME = "meta.pt"  # Written last: a cache directory without it is incomplete
+FORMAT_VERSION = 1
+
+
+def weight_cache_enabled():
+    return bool(get_processing_setting("weight_cache", True))
+
+
+def get_weight_cache_dir():
+    """'weight_cache_dir' setting, or next to the workspaces."""
+    configured = get_processing_setting("weight_cache_dir")
+    return Path(configured) if configured else get_workspace_manager().root / WEIGHT_CACHE_DIRNAME
+
+
+def _versions():
+    import torch
+    import demucs
+    return {"format": FORMAT_VERSION, "torch": torch.__version__, "demucs": getattr(demucs, "__version__", "")}
+
+
+def _member_filename(index):
+    return f"member_{index}.pt"
+
+
+def _save_atomic(torch, obj, path):
+    temp_path = path.with_name(path.name + ".tmp")
+    torch.save(obj, str(temp_path))
+    os.replace(temp_path, path)
+
+
+def save_weight_cache(model_name, model, root=None):
+    """
+    Store the (already dequantized) weights of a loaded model or bag of models,
+    with what is needed to rebuild it: each member's class and constructor arguments.
+    """
+    import torch
+    from demucs.apply import BagOfModels
+
+    is_bag = isinstance(model, BagOfModels)
+    members = list(model.models) if is_bag else [model]
+    directory = Path(root or get_weight_cache_dir()) / model_name
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / META_FILENAME).unlink(missing_ok=True)
+
+    entries = []
+    for index, member in enumerate(members):
+        args, kwargs = member._init_args_kwargs  # Recorded by demucs.states.capture_init
+        entries.append({
+            "module": type(member).__module__,
+            "name": type(member).__qualname__,
+            "args": args,
+            "kwargs": kwargs,
+            "segment": getattr(member, "segment", None),
+        })
+        state = {key: tensor.detach().contiguous() for key, tensor in member.state_dict().items()}
+        _save_atomic(torch, state, directory / _member_filename(index))
+
+    meta = {
+        "versions": _versions(),
+        "bag": is_bag,
+        "weights": [list(member_weights) for member_weights in model.weights] if is_bag else None,
+        "members": entries,
+    }
+    _save_atomic(torch, meta, directory / META_FILENAME)
+    append_to_log(f"Weight cache for '{model_name}' written to {directory} "
+                  f"({get_directory_size(directory) / 1024 / 1024:.0f} MB).")
+
+
+def _load_state(torch, path):
+    """Memory-map a saved state dict (zero-copy); plain load on torch versions without mmap."""
+    try:
+        return torch.load(str(path), map_location="cpu", mmap=True, weights_only=True)
+    except TypeError:
+        return torch.load(str(path), map_location="cpu")
+
+
+def _build_member(torch, entry, state):
+    """
+    Rebuild one model around its cached weights. It is constructed on the meta
+    device and the mapped tensors are assigned, not copied; models that cannot
+    be built that way are constructed normally and the weights copied in.
+    """
+    klass = getattr(importlib.import_module(entry["module"]), entry["name"])
+    model = None
+    try:
+        with torch.device("meta"):
+            model = klass(*entry["args"], **entry["kwargs"])
+        model.load_state_dict(state, assign=True)
+        if any(tensor.is_meta for tensor in itertools.chain(model.parameters(), model.buffers())):
+            model = None
+    except (AttributeError, TypeError, RuntimeError):
+        model = None
+    if model is None:
+        model = klass(*entry["args"], **entry["kwargs"])
+        model.load_state_dict(state)
+    if entry.get("segment") is not None:
+        model.segment = entry["segment"]
+    model.eval()
+    return model
+
+
+def _read_meta(torch, model_name, root=None):
+    directory = Path(root or get_weight_cache_dir()) / model_name
+    meta_path = directory / META_FILENAME
+    if not meta_path.is_file():
+        return directory, None
+    meta = torch.load(str(meta_path), map_location="cpu", weights_only=False)
+    if meta.get("versions") != _versions():
+        append_to_log(f"Weight cache for '{model_name}' was written by other library versions; rebuilding it.")
+        return directory, None
+    return directory, meta
+
+
+def load_weight_cache(model_name, root=None):
+    """The cached model (or bag of models) 'model_name', or None on a cache miss."""
+    import torch
+    from demucs.apply import BagOfModels
+
+    try:
+        directory, meta = _read_meta(torch, model_name, root)
+        if meta is None:
+            return None
+        members = [_build_member(torch, entry, _load_state(torch, directory / _member_filename(index)))
+                   for index, entry in enumerate(meta["members"])]
+    except Exception as e:
+        append_to_log(f"Weight cache for '{model_name}' is unusable ({e}); loading from the checkpoint.")
+        return None
+    if not meta["bag"]:
+        return members[0]
+    model = BagOfModels(members, meta["weights"])
+    model.eval()
+    return model
+
+
+def load_cached_member(model_name, member_index, root=None):
+    """Only one member of a cached bag (for bag worker processes), or None on a cache miss."""
+    import torch
+    try:
+        directory, meta = _read_meta(torch, model_name, root)
+        if meta is None or member_index >= len(meta["members"]):
+            return None
+        return _build_member(torch, meta["members"][member_index],
+                             _load_state(torch, directory / _member_filename(member_index)))
+    except Exception as e:
+        append_to_log(f"Weight cache for '{model_name}' member {member_index} is unusable: {e}")
+        return None
+
+
+def benchmark_model_load(model_name):
+    """
+    Measure the three ways a model can be loaded: cold from the Demucs checkpoint
+    (deserialize + dequantize), from the memory-mapped weight cache, and warm
+    (already in this process). Returns seconds per path.
+    """
+    from separation_engine import import_demucs, load_separation_model
+
+    _, _, get_model = import_demucs()
+    started = time.perf_counter()
+    model = get_model(model_name)
+    cold = time.perf_counter() - started
+    save_weight_cache(model_name, model)
+    del model
+
+    started = time.perf_counter()
+    cached = load_weight_cache(model_name)
+    mapped = time.perf_counter() - started
+    if cached is None:
+        raise RuntimeError(f"Could not load '{model_name}' back from the weight cache.")
+
+    load_separation_model(model_name)
+    started = time.perf_counter()
+    load_separation_model(model_name)
+    warm = time.perf_counter() - started
+    return {"checkpoint": cold, "weight_cache": mapped, "warm": warm}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the weight cache and compare cold and warm model loads.")
+    parser.add_argument("models", nargs="*", default=["mdx_extra_q"])
+    args = parser.parse_args()
+    for name in args.models:
+        timings = benchmark_model_load(name)
+        print(f"{name}: checkpoint (deserialize + dequantize) {timings['checkpoint']:.2f}s, "
+              f"weight cache (mmap) {timings['weight_cache']:.2f}s, warm {timings['warm'] * 1000:.2f}ms")
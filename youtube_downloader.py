@@ -1,54 +1,254 @@
 import os
+import re
+import json
 import subprocess
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
+
+from cancellation import JobCancelled, raise_if_cancelled, run_cancellable
 from logger_utils import append_to_log
+from metrics_utils import time_stage
+from profiling_utils import profile_job
+from processing_config import get_processing_setting
+from subtitle_utils import vtt_to_srt
 from video_processor import get_bundled_path  # Assuming you have this in video_processor
 
-def download_youtube_videos(link, temp_dir):
+OUTPUT_TEMPLATE = "%(title)s.%(ext)s"
+SUBTITLE_FETCH_WORKERS = 8
+# Pseudo-subtitle tracks yt-dlp lists that are not subtitles at all
+IGNORED_SUBTITLE_TRACKS = {"live_chat", "rechat"}
+
+
+def get_default_subtitle_languages():
     """
-    Download a YouTube video or playlist into 'temp_dir', along with all available subtitles 
-    (including auto-generated). The resulting files will be named via yt-dlp's %(title)s.%(ext)s template.
-    
-    Return a dictionary of downloaded videos and subtitle files.
+    Subtitle language allow-list from settings ('subtitle_languages', a list or a
+    comma-separated string). None means every language the video actually has.
+    """
+    languages = get_processing_setting("subtitle_languages")
+    if isinstance(languages, str):
+        languages = [lang.strip() for lang in languages.split(",") if lang.strip()]
+    return languages or None
+
+
+def fetch_video_info(link, temp_dir, cancel_event=None):
+    """
+    Resolve a video or playlist link with 'yt-dlp -J' (no download).
+    Returns (info_json_path, entries) where entries is a flat list of per-video info dicts.
     """
     yt_dlp_path = get_bundled_path("yt-dlp.exe")
     if not os.path.exists(yt_dlp_path):
         raise FileNotFoundError(f"yt-dlp executable not found at {yt_dlp_path}")
 
-    # Use --write-auto-subs + --all-subs + --write-subs to ensure we get any available subtitles
     command = [
         yt_dlp_path,
-        "-f", "best[ext=mp4]",          # Best quality with .mp4 extension
-        "--write-subs",                 # Download normal subtitles if available
-        "--write-auto-subs",            # Also download auto-generated subtitles if no "real" subs exist
-        "--all-subs",                   # Download all available subtitles
-        "--convert-subs", "srt",        # Convert subtitles to SRT format
-        "-o", f"{temp_dir}/%(title)s.%(ext)s",  # Output template
+        "-J",
+        "-f", "best[ext=mp4]",
+        "-o", f"{temp_dir}/{OUTPUT_TEMPLATE}",
         link,
     ]
+    with time_stage("resolve_link"):
+        result = run_cancellable(command, cancel_event, stage="link resolution")
+    info = json.loads(result.stdout.decode("utf-8", errors="ignore"))
+
+    # Keep the resolved info so the media download does not have to extract it again
+    info_json_path = Path(temp_dir) / "info.json"
+    info_json_path.write_text(json.dumps(info), encoding="utf-8")
+
+    entries = []
+    pending = [info]
+    while pending:
+        item = pending.pop(0)
+        if item.get("entries") is not None:
+            pending.extend(entry for entry in item["entries"] if entry)
+        else:
+            entries.append(item)
+    return info_json_path, entries
+
+
+def _language_allowed(language, languages):
+    """Match 'en' against allow-list entries like 'en' or 'en-US' (and vice versa)."""
+    if not languages:
+        return True
+    base = language.split("-")[0].lower()
+    return any(language.lower() == lang.lower() or base == lang.split("-")[0].lower() for lang in languages)
+
+
+def select_subtitle_tracks(entry, languages=None, include_auto=True, include_translated=False):
+    """
+    Pick the subtitle tracks to fetch for one video.
+    Returns a list of (language, url, auto_generated) for WebVTT tracks. Uploaded subtitles in
+    allowed languages are always taken. Auto-generated captions are only taken
+    in the video's original spoken language ('<lang>-orig') unless
+    'include_translated' is set, and only when no uploaded track exists for that language.
+    """
+    def vtt_url(formats):
+        for fmt in formats or []:
+            if fmt.get("ext") == "vtt" and fmt.get("url"):
+                return fmt["url"]
+        return None
+
+    tracks = {}
+    for language, formats in (entry.get("subtitles") or {}).items():
+        if language in IGNORED_SUBTITLE_TRACKS or not _language_allowed(language, languages):
+            continue
+        url = vtt_url(formats)
+        if url:
+            tracks[language] = (url, False)
+
+    if include_auto:
+        for language, formats in (entry.get("automatic_captions") or {}).items():
+            is_original = language.endswith("-orig")
+            language_name = language[:-len("-orig")] if is_original else language
+            if not is_original and not include_translated:
+                continue  # Machine translation of the auto-captions
+            if language_name in tracks or not _language_allowed(language_name, languages):
+                continue
+            url = vtt_url(formats)
+            if url:
+                tracks[language_name] = (url, True)
+
+    return sorted((language, url, auto_generated) for language, (url, auto_generated) in tracks.items())
+
+
+def _subtitle_stem(entry):
+    """File stem matching the video file yt-dlp will write for this entry."""
+    filename = entry.get("_filename") or entry.get("filename")
+    if filename:
+        return Path(filename).stem
+    title = entry.get("title") or entry.get("id") or "video"
+    return re.sub(r'[\\/:*?"<>|]', "_", title)
+
+
+def _fetch_subtitle(url, destination, cancel_event=None, auto_generated=False):
+    """
+    Download one WebVTT track and write it as SRT (collapsing the rolling lines
+    of auto-generated captions). Returns the SRT path.
+    """
+    raise_if_cancelled(cancel_event, "subtitle download")
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    response.encoding = "utf-8"
+    destination.write_text(vtt_to_srt(response.text, rolling=auto_generated), encoding="utf-8")
+    return destination
+
+
+def download_subtitles(entries, temp_dir, languages=None, include_auto=True, include_translated=False,
+                       cancel_event=None, max_workers=SUBTITLE_FETCH_WORKERS):
+    """
+    Fetch the selected subtitle tracks of all entries in parallel and convert
+    them to SRT in-process (no ffmpeg). Returns the list of SRT paths; tracks that
+    fail to download are logged and skipped.
+    """
+    jobs = []
+    for entry in entries:
+        stem = _subtitle_stem(entry)
+        for language, url, auto_generated in select_subtitle_tracks(entry, languages, include_auto,
+                                                                    include_translated):
+            jobs.append((url, Path(temp_dir) / f"{stem}.{language}.srt", auto_generated))
+
+    append_to_log(f"Fetching {len(jobs)} subtitle track(s) for {len(entries)} video(s).")
+    subtitle_paths = []
+    with time_stage("subtitles"), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_fetch_subtitle, url, destination, cancel_event, auto_generated)
+                   for url, destination, auto_generated in jobs]
+        for future, (url, destination, _) in zip(futures, jobs):
+            try:
+                subtitle_paths.append(future.result())
+            except JobCancelled:
+                raise
+            except Exception as e:
+                append_to_log(f"Failed to fetch subtitles {destination.name}: {e}")
+    return subtitle_paths
+
+
+def download_entry(entry, temp_dir, cancel_event=None):
+    """
+    Download the media of one resolved entry (see fetch_video_info) into 'temp_dir'
+    and return the path of the MP4 file. Used to fetch playlist items one at a time.
+    """
+    yt_dlp_path = get_bundled_path("yt-dlp.exe")
+    if not os.path.exists(yt_dlp_path):
+        raise FileNotFoundError(f"yt-dlp executable not found at {yt_dlp_path}")
+
+    info_json_path = Path(temp_dir) / "entry.info.json"
+    info_json_path.write_text(json.dumps(entry), encoding="utf-8")
+    command = [
+        yt_dlp_path,
+        "--load-info-json", str(info_json_path),
+        "-f", "best[ext=mp4]",
+        "-o", f"{temp_dir}/{OUTPUT_TEMPLATE}",
+    ]
+    try:
+        with time_stage("download"):
+            run_cancellable(command, cancel_event, stage="download")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"yt-dlp failed: {e.stderr.decode('utf-8', errors='ignore')}")
+
+    downloaded = list(Path(temp_dir).glob("*.mp4"))
+    if not downloaded:
+        raise FileNotFoundError(f"No MP4 file found after downloading '{entry.get('title')}'.")
+    return downloaded[0]
+
+
+def download_youtube_videos(link, temp_dir, cancel_event=None, languages=None, include_auto_subs=True,
+                            include_translated_subs=False, subtitles_only=False):
+    """
+    Download a YouTube video or playlist into 'temp_dir', along with its subtitles.
+    The link is resolved once; the selected subtitle tracks are then fetched in
+    parallel (while the media downloads) and converted to SRT in-process.
+    'languages' is an allow-list of subtitle languages (None = all available);
+    auto-translated captions are skipped unless 'include_translated_subs' is set.
+    With 'subtitles_only', no media is downloaded at all.
+    The resulting files will be named via yt-dlp's %(title)s.%(ext)s template.
+
+    Return a dictionary of downloaded videos and subtitle files.
+    If 'cancel_event' is set, yt-dlp (and any ffmpeg it started) is killed and JobCancelled is raised.
+    With profiling enabled, a cProfile of the whole download is written.
+    """
+    yt_dlp_path = get_bundled_path("yt-dlp.exe")
+    if not os.path.exists(yt_dlp_path):
+        raise FileNotFoundError(f"yt-dlp executable not found at {yt_dlp_path}")
+
+    if languages is None:
+        languages = get_default_subtitle_languages()
 
     try:
-        result = subprocess.run(
-            command,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-
-        # Gather all downloaded MP4 files
-        downloaded_videos = list(Path(temp_dir).glob("*.mp4"))
-
-        # Gather all downloaded subtitle files (now including auto-subs)
-        downloaded_subtitles = list(Path(temp_dir).glob("*.srt"))
-
-        if not downloaded_videos:
-            raise FileNotFoundError("No MP4 files found after download.")
-        
-        return {
-            "videos": downloaded_videos,
-            "subtitles": downloaded_subtitles,
-        }
+        with profile_job("youtube_download"):
+            info_json_path, entries = fetch_video_info(link, temp_dir, cancel_event)
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                subtitles_future = executor.submit(
+                    download_subtitles, entries, temp_dir, languages,
+                    include_auto_subs, include_translated_subs, cancel_event,
+                )
+
+                downloaded_videos = []
+                if not subtitles_only:
+                    command = [
+                        yt_dlp_path,
+                        "--load-info-json", str(info_json_path),  # Reuse the resolved info
+                        "-f", "best[ext=mp4]",          # Best quality with .mp4 extension
+                        "-o", f"{temp_dir}/{OUTPUT_TEMPLATE}",  # Output template
+                    ]
+                    with time_stage("download"):
+                        run_cancellable(command, cancel_event, stage="download")
+
+                    # Gather all downloaded MP4 files
+                    downloaded_videos = list(Path(temp_dir).glob("*.mp4"))
+                    if not downloaded_videos:
+                        raise FileNotFoundError("No MP4 files found after download.")
+
+                downloaded_subtitles = subtitles_future.result()
+
+            return {
+                "videos": downloaded_videos,
+                "subtitles": downloaded_subtitles,
+            }
+
+    except JobCancelled:
+        raise
 
     except subprocess.CalledProcessError as e:
         # If yt-dlp returned a non-zero exit code
@@ -56,4 +256,4 @@ def download_youtube_videos(link, temp_dir):
         raise RuntimeError(f"yt-dlp failed: {err_msg}")
 
     except Exception as e:
-        raise RuntimeError(f"Unexpected error during video download: {e}")
\ No newline at end of file
+        raise RuntimeError(f"Unexpected error during video download: {e}")
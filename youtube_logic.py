@@ -1,94 +1,127 @@
 import os
+import queue
 import shutil
-import tempfile
 import socket
 import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from tkinter import filedialog
 
+from cancellation import CombinedEvent, JobCancelled, raise_if_cancelled
+from directory_manager import get_workspace_manager
+from job_ledger import job_parameters, track_job
 from logger_utils import append_to_log, send_log_to_server
+from processing_config import get_processing_setting
+from separation_presets import preset_options
 from utils import (
     format_duration,
     calculate_processing_time,
     get_video_length,
 )
-from youtube_downloader import download_youtube_videos
+from video_processor import extract_audio, separate_audio
+from youtube_downloader import (
+    download_entry,
+    download_subtitles,
+    download_youtube_videos,
+    fetch_video_info,
+    get_default_subtitle_languages,
+)
+
+# Playlist items downloaded ahead of the one being separated (each holds a workspace reservation)
+DEFAULT_PREFETCH_ITEMS = 1
 
 
-def process_youtube_video(app, youtube_link_var, progress_label, progress_bar):
+def process_youtube_video(link, save_folder, progress_label, subtitle_languages=None,
+                          include_translated_subs=False, subtitles_only=False):
     """
-    Download YouTube video(s) and subtitles in all available languages in a background thread.
-    Then prompt the user to select a folder to save them.
+    Download YouTube video(s) and their subtitles and move them into 'save_folder'.
+    'subtitle_languages' limits which subtitle languages are fetched (None = configured
+    default, empty list = all);
+    auto-translated captions are only fetched with 'include_translated_subs', and
+    'subtitles_only' skips the media download entirely.
+    Runs on a job worker thread; 'progress_label' only needs a set() method.
+    Raises ValueError for an empty link, and re-raises on failure or cancellation
+    (after logging), so the job is marked accordingly.
     """
-    link = youtube_link_var.get().strip()
+    cancel_event = getattr(progress_label, "cancel_event", None)
+    link = link.strip()
     if not link:
-        progress_label.set("YouTube link is empty.")
-        append_to_log("YouTube link is empty.")
-        return
+        raise ValueError("YouTube link is empty.")
 
-    progress_label.set("Downloading video and subtitles... Please wait.")
+    function_type = "YouTube Subtitles" if subtitles_only else "YouTube Download"
+    progress_label.set(
+        "Downloading subtitles... Please wait." if subtitles_only
+        else "Downloading video and subtitles... Please wait."
+    )
     start_time = datetime.utcnow()  # Use UTC time
 
     file_size = None
     video_length_str = None
 
     try:
-        # 1. Create a temporary directory for the download operation
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 2. Download videos + subtitles into temp_dir using youtube_downloader
-            download_results = download_youtube_videos(link, temp_dir)
-
-            video_paths = download_results.get("videos", [])
-            subtitle_paths = download_results.get("subtitles", [])
-
-            if not video_paths:
-                raise FileNotFoundError("No videos downloaded.")
-            if not subtitle_paths:
-                append_to_log("No subtitles were found or available for download.")
-
-            # 3. Prompt the user to select the final folder where files will be moved
-            save_folder = filedialog.askdirectory(title="Choose folder to save the downloaded files")
-            if not save_folder:
-                progress_label.set("Save operation canceled by user.")
-                append_to_log("Save operation canceled by user.")
-                return
-
-            # 4. Move .mp4 files and .srt subtitle files from temp_dir to the chosen folder
-            total_size = 0
-            max_duration = 0
-
-            # Process videos
-            for vp in video_paths:
-                size = os.path.getsize(vp)
-                total_size += size
-
-                # Attempt to get video duration for logging
-                length_seconds = get_video_length(vp)
-                if length_seconds and length_seconds > max_duration:
-                    max_duration = length_seconds
-
-                # Move the video from temp_dir to the final destination
-                dest_path = Path(save_folder) / vp.name
-                shutil.move(str(vp), str(dest_path))
-                append_to_log(f"Video saved: {dest_path}")
-
-            # Process subtitles
-            for sp in subtitle_paths:
-                # Move each .srt file from temp_dir to the final destination
-                dest_path = Path(save_folder) / sp.name
-                shutil.move(str(sp), str(dest_path))
-                append_to_log(f"Subtitle saved: {dest_path}")
-
-            # 5. Prepare logging info
-            file_size = total_size
-            if max_duration > 0:
-                video_length_str = format_duration(max_duration)
-
-        # 6. After the with-block, temp_dir is automatically cleaned up
+        # The ledger records the download (its length is only known afterwards)
+        with track_job(function_type, link, parameters={"subtitles_only": subtitles_only}) as ledger_entry:
+            # 1. Reserve a managed workspace for the download (duration is unknown up front)
+            with get_workspace_manager().job_workspace("YouTube Download", includes_video=True) as workspace:
+                temp_dir = str(workspace.path)
+                # 2. Download videos + subtitles into temp_dir using youtube_downloader
+                download_results = download_youtube_videos(
+                    link,
+                    temp_dir,
+                    cancel_event=cancel_event,
+                    languages=subtitle_languages,
+                    include_translated_subs=include_translated_subs,
+                    subtitles_only=subtitles_only,
+                )
+                workspace.sample_usage()
+
+                video_paths = download_results.get("videos", [])
+                subtitle_paths = download_results.get("subtitles", [])
+
+                if not video_paths and not subtitles_only:
+                    raise FileNotFoundError("No videos downloaded.")
+                if not subtitle_paths:
+                    append_to_log("No subtitles were found or available for download.")
+
+                # 3. Move .mp4 files and .srt subtitle files from temp_dir to the chosen folder
+                total_size = 0
+                max_duration = 0
+
+                # Process videos
+                for vp in video_paths:
+                    size = os.path.getsize(vp)
+                    total_size += size
+
+                    # Attempt to get video duration for logging
+                    length_seconds = get_video_length(vp)
+                    if length_seconds and length_seconds > max_duration:
+                        max_duration = length_seconds
+
+                    # Move the video from temp_dir to the final destination
+                    dest_path = Path(save_folder) / vp.name
+                    shutil.move(str(vp), str(dest_path))
+                    append_to_log(f"Video saved: {dest_path}")
+
+                # Process subtitles
+                for sp in subtitle_paths:
+                    # Move each .srt file from temp_dir to the final destination
+                    dest_path = Path(save_folder) / sp.name
+                    shutil.move(str(sp), str(dest_path))
+                    append_to_log(f"Subtitle saved: {dest_path}")
+
+                # 4. Prepare logging info
+                file_size = total_size
+                if max_duration > 0:
+                    video_length_str = format_duration(max_duration)
+            ledger_entry.update(input_seconds=max_duration or None, file_size=total_size,
+                                peak_disk_bytes=workspace.peak_bytes)
+
+        # 5. After the with-block, the workspace is cleaned up and its reservation released
         end_time = datetime.utcnow()
 
-        # 7. Create JSON log data
+        # 6. Create JSON log data
         log_data = {
             "ip": socket.gethostbyname(socket.gethostname()),
             "machine_name": platform.node(),
@@ -103,26 +136,252 @@ def process_youtube_video(app, youtube_link_var, progress_label, progress_bar):
             "video_length": video_length_str,
             "processing_time": calculate_processing_time(start_time, end_time),
             "type": "youtube",
-            "function_type": "YouTube Download",
+            "function_type": function_type,
             "status": "success",
         }
         send_log_to_server(log_data)
 
-        # 8. Update UI status
+        # 7. Update UI status
         progress_label.set(
+            f"{len(subtitle_paths)} subtitle file(s) downloaded successfully in {log_data['processing_time']:.2f} seconds."
+            if subtitles_only else
             f"Video(s) and subtitles downloaded successfully in {log_data['processing_time']:.2f} seconds."
         )
 
     # --- Exception Handling ---
+    except JobCancelled:
+        progress_label.set("Download cancelled.")
+        append_to_log("YouTube download cancelled by user.")
+        raise
     except FileNotFoundError as fnf_err:
-        _handle_download_error(app, progress_label, start_time, "file not found", fnf_err, "YouTube Download")
+        _handle_download_error(progress_label, start_time, "file not found", fnf_err, function_type)
+        raise
     except RuntimeError as rt_err:
-        _handle_download_error(app, progress_label, start_time, "runtime", rt_err, "YouTube Download")
+        _handle_download_error(progress_label, start_time, "runtime", rt_err, function_type)
+        raise
     except Exception as e:
-        _handle_download_error(app, progress_label, start_time, "unexpected", e, "YouTube Download")
+        _handle_download_error(progress_label, start_time, "unexpected", e, function_type)
+        raise
+
+
+def _download_ahead(entries, prefetched, cancel_event, stop_event):
+    """
+    Producer for separate_youtube_video: download playlist items one at a time,
+    each into its own workspace, and queue (entry, workspace_context, workspace,
+    video_path or exception). 'prefetched' is bounded and every queued item keeps
+    its workspace reservation, so downloads cannot run ahead of separation (or of
+    the disk budget) by more than the queue size. Ends with a None sentinel.
+    Setting 'stop_event' also kills a download in progress (its partial file goes
+    with its workspace), so the consumer does not wait for it when giving up.
+    """
+    manager = get_workspace_manager()
+    download_cancel_event = CombinedEvent(cancel_event, stop_event)
+
+    def hand_over(item):
+        while not stop_event.is_set():
+            try:
+                prefetched.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    for entry in entries:
+        if stop_event.is_set():
+            break
+        title = entry.get("title") or entry.get("id") or "video"
+        workspace_context = manager.job_workspace(title, entry.get("duration"), includes_video=True)
+        workspace = None
+        try:
+            workspace = workspace_context.__enter__()
+            item = (entry, workspace_context, workspace, download_entry(entry, workspace.path, download_cancel_event))
+        except Exception as e:
+            if workspace is not None:
+                workspace_context.__exit__(None, None, None)
+            item = (entry, None, None, e)
+        if not hand_over(item):
+            if item[1] is not None:
+                item[1].__exit__(None, None, None)
+            break
+        if isinstance(item[3], JobCancelled):
+            break
+    hand_over(None)
+
+
+def separate_youtube_video(link, save_folder, progress_label, subtitle_languages=None,
+                           include_translated_subs=False, preset=None):
+    """
+    Download YouTube video(s) and separate each one into clean_<title>.wav and
+    bg_<title>.wav in 'save_folder', next to the video and its subtitles.
+    Playlist items are pipelined: item N+1 downloads while item N is being
+    extracted and separated, with at most 'youtube_prefetch_items' items waiting
+    (each on its own disk-budget reservation). Items that fail are logged and
+    skipped; the job fails at the end if any did. An empty link raises ValueError.
+    'preset' names a separation preset (None = configured default).
+    Runs on a job worker thread; 'progress_label' only needs a set() method.
+    """
+    cancel_event = getattr(progress_label, "cancel_event", None)
+    progress_callback = getattr(progress_label, "progress", None)
+    link = link.strip()
+    if not link:
+        raise ValueError("YouTube link is empty.")
+
+    function_type = "YouTube Separation"
+    progress_label.set("Resolving link... Please wait.")
+    start_time = datetime.utcnow()  # Use UTC time
+    if subtitle_languages is None:
+        subtitle_languages = get_default_subtitle_languages()
+    separation_options = preset_options(preset)
+
+    stop_event = threading.Event()
+    prefetch_items = max(1, int(get_processing_setting("youtube_prefetch_items", DEFAULT_PREFETCH_ITEMS)))
+    prefetched = queue.Queue(maxsize=prefetch_items)
+    producer = None
+    total_size = 0
+    max_duration = 0
+    failures = []
+
+    try:
+        with get_workspace_manager().job_workspace("YouTube Link", includes_video=False) as workspace:
+            _, entries = fetch_video_info(link, str(workspace.path), cancel_event)
+        if not entries:
+            raise FileNotFoundError("No videos found for this link.")
+
+        producer = threading.Thread(
+            target=_download_ahead, args=(entries, prefetched, cancel_event, stop_event),
+            daemon=True, name="youtube-prefetch",
+        )
+        producer.start()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # Subtitles are small: fetch them straight into the save folder
+            subtitles_future = executor.submit(
+                download_subtitles, entries, save_folder, subtitle_languages,
+                True, include_translated_subs, cancel_event,
+            )
+
+            for index in range(len(entries)):
+                item = prefetched.get()
+                if item is None:
+                    break
+                entry, workspace_context, workspace, result = item
+                title = entry.get("title") or entry.get("id") or "video"
+                try:
+                    if isinstance(result, Exception):
+                        raise result
+                    raise_if_cancelled(cancel_event)
+                    report = {}
+                    with track_job(function_type, title, input_seconds=entry.get("duration"),
+                                   file_size=os.path.getsize(result),
+                                   parameters=job_parameters(separation_options, preset=preset)) as ledger_entry:
+                        prefix = f"Separating {index + 1}/{len(entries)}: {title}..."
+                        progress_label.set(f"{prefix} {ledger_entry.estimate.describe()}")
+
+                        def item_progress(percent, index=index, prefix=prefix, ledger_entry=ledger_entry):
+                            if progress_callback:
+                                progress_callback((index + percent / 100.0) * 100.0 / len(entries))
+                            progress_label.set(ledger_entry.progress_message(prefix, percent))
+
+                        audio_path = extract_audio(result, workspace.path, cancel_event)
+                        vocals_path, noise_path, _ = separate_audio(
+                            audio_path,
+                            workspace.path,
+                            cancel_event=cancel_event,
+                            progress_callback=item_progress,
+                            separation_options=separation_options,
+                            report=report,
+                        )
+                        workspace.sample_usage()
+                        ledger_entry.update(peak_disk_bytes=workspace.peak_bytes,
+                                            peak_memory_bytes=report.get("peak_memory_bytes"))
+
+                    length_seconds = get_video_length(result)
+                    if length_seconds and length_seconds > max_duration:
+                        max_duration = length_seconds
+                    total_size += os.path.getsize(result)
+
+                    for source, dest_name in ((result, result.name),
+                                              (vocals_path, f"clean_{result.stem}.wav"),
+                                              (noise_path, f"bg_{result.stem}.wav")):
+                        dest_path = Path(save_folder) / dest_name
+                        shutil.move(str(source), str(dest_path))
+                        append_to_log(f"Saved: {dest_path}")
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    append_to_log(f"{function_type}: failed to process '{title}': {e}")
+                    failures.append(title)
+                finally:
+                    if workspace_context is not None:
+                        workspace_context.__exit__(None, None, None)
+
+            subtitle_paths = subtitles_future.result()
+
+        if failures:
+            raise RuntimeError(f"{len(failures)} of {len(entries)} video(s) failed: {', '.join(failures)}")
+
+        end_time = datetime.utcnow()
+        log_data = {
+            "ip": socket.gethostbyname(socket.gethostname()),
+            "machine_name": platform.node(),
+            "machine_specs": {
+                "os": platform.system(),
+                "os_version": platform.version(),
+                "machine": platform.machine(),
+            },
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "file_size": total_size,
+            "video_length": format_duration(max_duration) if max_duration > 0 else None,
+            "processing_time": calculate_processing_time(start_time, end_time),
+            "type": "youtube",
+            "function_type": function_type,
+            "status": "success",
+        }
+        send_log_to_server(log_data)
+
+        progress_label.set(
+            f"{len(entries)} video(s) separated and {len(subtitle_paths)} subtitle file(s) downloaded "
+            f"in {log_data['processing_time']:.2f} seconds."
+        )
+
+    except JobCancelled:
+        progress_label.set("Download cancelled.")
+        append_to_log("YouTube separation cancelled by user.")
+        raise
+    except FileNotFoundError as fnf_err:
+        _handle_download_error(progress_label, start_time, "file not found", fnf_err, function_type)
+        raise
+    except RuntimeError as rt_err:
+        _handle_download_error(progress_label, start_time, "runtime", rt_err, function_type)
+        raise
+    except Exception as e:
+        _handle_download_error(progress_label, start_time, "unexpected", e, function_type)
+        raise
+    finally:
+        # Stop the producer and release the workspaces of items nobody will process
+        stop_event.set()
+        if producer is not None:
+            while producer.is_alive() or not prefetched.empty():
+                try:
+                    item = prefetched.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is not None and item[1] is not None:
+                    item[1].__exit__(None, None, None)
+            producer.join()
+
+
+def ask_youtube_save_folder():
+    """Ask (on the UI thread) where downloaded files should be saved. Returns None if canceled."""
+    save_folder = filedialog.askdirectory(title="Choose folder to save the downloaded files")
+    if not save_folder:
+        append_to_log("Save operation canceled by user.")
+        return None
+    return save_folder
 
 
-def _handle_download_error(app, progress_label, start_time, error_type, error_obj, function_type):
+def _handle_download_error(progress_label, start_time, error_type, error_obj, function_type):
     """Common handler for download exceptions."""
     error_message = f"{error_type.capitalize()} error during download: {error_obj}"
     append_to_log(error_message)